@@ -30,7 +30,8 @@ import bigmler.utils as u
 
 from bigmler.analyze.k_fold_cv import (create_kfold_cv,
                                        create_features_analysis,
-                                       create_nodes_analysis)
+                                       create_nodes_analysis,
+                                       create_hyperparams_analysis, MEMO_LOG)
 from bigmler.dispatcher import (SESSIONS_LOG, command_handling,
                                 clear_log_files)
 from bigmler.command import get_stored_command
@@ -38,7 +39,7 @@ from bigmler.command import get_stored_command
 
 COMMAND_LOG = u".bigmler_analyze"
 DIRS_LOG = u".bigmler_analyze_dir_stack"
-LOG_FILES = [COMMAND_LOG, DIRS_LOG, u.NEW_DIRS_LOG]
+LOG_FILES = [COMMAND_LOG, DIRS_LOG, u.NEW_DIRS_LOG, MEMO_LOG]
 
 
 def analyze_dispatcher(args=sys.argv[1:]):
@@ -89,10 +90,10 @@ def analyze_dispatcher(args=sys.argv[1:]):
     if command_args.maximize is not None and command_args.optimize is None:
         command_args.optimize = command_args.maximize
     incompatible_flags = [command_args.cv, command_args.features,
-                          command_args.nodes]
+                          command_args.nodes, command_args.hyperparams]
     if sum([int(bool(flag)) for flag in incompatible_flags]) > 1:
         sys.exit("The following flags cannot be used together:\n    --features"
-                 "\n    --cross-validation\n    --nodes")
+                 "\n    --cross-validation\n    --nodes\n    --hyperparams")
     # k-fold cross-validation
     if command_args.cv and command_args.dataset is not None:
         create_kfold_cv(command_args, api, command.common_options,
@@ -107,8 +108,13 @@ def analyze_dispatcher(args=sys.argv[1:]):
     elif command_args.nodes:
         create_nodes_analysis(command_args, api, command.common_options,
                               resume=resume)
+
+    # model and ensemble options analysis
+    elif command_args.hyperparams:
+        create_hyperparams_analysis(command_args, api, command.common_options,
+                                    resume=resume)
     else:
         sys.exit("You must choose one of the available analysis: --features,"
-                 " --nodes or --cross-validation. Add your prefered option to"
-                 " the command line or type\n    bigmler analyze --help\n"
-                 " to see all the available options.")
+                 " --nodes, --hyperparams or --cross-validation. Add your"
+                 " prefered option to the command line or type\n    bigmler"
+                 " analyze --help\n to see all the available options.")
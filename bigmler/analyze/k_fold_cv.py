@@ -28,18 +28,26 @@ import sys
 import json
 import re
 import csv
+import math
+import hashlib
+import random
+import itertools
 
 import bigml
 
 import bigmler.processing.args as a
 import bigmler.utils as u
+import bigmler.resources as r
 
 from copy import copy
 
 from bigml.fields import Fields
 
 from bigmler.dispatcher import main_dispatcher
-from bigmler.options.analyze import ACCURACY, MINIMIZE_OPTIONS
+from bigmler.options.analyze import (ACCURACY, MINIMIZE_OPTIONS,
+                                     BRACKETING_SEARCH, GOLDEN_SEARCH,
+                                     GRID_SEARCH)
+from bigmler.parallel import run_in_parallel
 
 AVG_PREFIX = "average_%s"
 R_SQUARED = "r_squared"
@@ -60,7 +68,9 @@ COMMANDS = {"selection":
                  " --name %s --dataset-file %s"),
             "node_threshold":
                 ("main --datasets %s --node-threshold %s --output-dir %s"
-                 " --dataset-off --evaluate")}
+                 " --dataset-off --evaluate"),
+            "baseline":
+                ("main --datasets %s --output-dir %s --name %s")}
 
 DEFAULT_KFOLD_FIELD = "__kfold__"
 KFOLD_SUBDIR = "k_fold"
@@ -80,14 +90,37 @@ DEFAULT_NODES_PENALTY = 0
 # staleness
 DEFAULT_STALENESS = 5
 
+# fraction of candidates promoted in each screening round
+DEFAULT_SCREENING_RATE = 0.5
+
+# probe points per bracket in the coarse-to-fine node threshold search
+DEFAULT_NODES_PROBES = 5
+
+# golden-section search ratio
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
 # k-fold
 DEFAULT_KFOLDS = 5
 
+# model and ensemble options searched by default in --hyperparams analysis
+HYPERPARAMS_SPACE = [("number_of_models", [1, 10, 32]),
+                     ("sample_rate", [1.0, 0.8, 0.6]),
+                     ("randomize", [False, True]),
+                     ("balance", [False, True]),
+                     ("missing_splits", [False, True]),
+                     ("pruning", ["smart", "statistical", "no-pruning"])]
+ENSEMBLE_HYPERPARAMS = {"sample_rate": 1.0, "randomize": False}
+DEFAULT_RANDOM_TRIALS = 20
+
 #subcommands
 SUBCOMMAND_LOG = u".bigmler_subcmd"
 SESSIONS_LOG = u"bigmler_sessions"
 FEATURES_LOG = u"features_sets.csv"
 NODES_LOG = u"nodes_sets.csv"
+TRIALS_LOG = u"hyperparams_trials.csv"
+
+# evaluations memo shared by all the analyze runs
+MEMO_LOG = u".bigmler_analyze_memo"
 
 #name max length
 NAME_MAX_LENGTH = 127
@@ -95,6 +128,7 @@ NAME_MAX_LENGTH = 127
 subcommand_list = []
 subcommand_file = None
 session_file = None
+evaluations_memo = None
 
 
 
@@ -200,6 +234,24 @@ def create_nodes_analysis(args, api, common_options, resume=False):
                         resume=resume)
 
 
+def create_hyperparams_analysis(args, api, common_options, resume=False):
+    """Analyzes the model performance as a function of the model and
+       ensemble options.
+
+    """
+    set_subcommand_file(args.output_dir)
+    if resume:
+        retrieve_subcommands()
+    datasets_file, objective_name, resume = create_kfold_datasets_file(
+        args, api, common_options, resume=resume)
+    args.objective_field = objective_name
+    message = ('Creating the hyperparameters trials.....\n')
+    u.log_message(message, log_file=session_file,
+                  console=args.verbosity)
+    best_hyperparams(datasets_file, args, common_options,
+                     staleness=args.staleness, resume=resume)
+
+
 def create_kfold_datasets_file(args, api, common_options, resume=False):
     """Create the kfold dataset resources and store their ids in a file
        one per line
@@ -242,7 +294,7 @@ def create_kfold_datasets_file(args, api, common_options, resume=False):
         datasets_file, resume = create_kfold_datasets(dataset_id, args,
                                                       selecting_file_list,
                                                       common_options,
-                                                      resume=resume)
+                                                      resume=resume, api=api)
         return datasets_file, objective_name, resume
     return None, None, None
 
@@ -287,39 +339,69 @@ def avoid_duplicates(field_name, fields, affix="_"):
 
 def create_kfold_datasets(dataset, args,
                           selecting_file_list,
-                          common_options, resume=False):
-    """Calling the bigmler procedure to create the k-fold datasets
+                          common_options, resume=False, api=None):
+    """Calling the bigmler procedure to create the k-fold datasets. Each
+       selection command stores its dataset in a separate directory, so they
+       can be run in parallel, and the generated datasets are collected in
+       the fold order.
 
     """
     args.output_dir = os.path.normpath(os.path.join(args.output_dir, "test"))
     output_dir = args.output_dir
-    global subcommand_list
     # creating the selecting datasets
+    commands = []
+    fold_dirs = []
     for index in range(0, len(selecting_file_list)):
+        fold_dir = os.path.normpath(os.path.join(output_dir,
+                                                 "fold%s" % index))
         command = COMMANDS["selection"] % (
             dataset, selecting_file_list[index],
-            output_dir)
+            fold_dir)
         command_args = command.split()
         common_options_list = u.get_options_list(args, common_options,
                                                  prioritary=command_args)
         command_args.extend(common_options_list)
-        command = rebuild_command(command_args)
-        if resume:
-            next_command = subcommand_list.pop()
-            if different_command(next_command, command):
-                resume = False
-                u.sys_log_message(command, log_file=subcommand_file)
-                main_dispatcher(args=command_args)
-            elif not subcommand_list:
-                main_dispatcher(args=['main', '--resume'])
-                resume = False
-        else:
-            u.sys_log_message(command, log_file=subcommand_file)
-            main_dispatcher(args=command_args)
+        commands.append((command_args, os.path.join(fold_dir,
+                                                    "dataset_gen")))
+        fold_dirs.append(fold_dir)
+    resume = run_subcommands(commands, resume=resume,
+                             max_parallel=args.max_parallel_datasets)
     datasets_file = os.path.normpath(os.path.join(output_dir, "dataset_gen"))
+    dataset_ids = [collect_kfold_dataset(fold_dir, output_dir, args, api=api)
+                   for fold_dir in fold_dirs]
+    with open(datasets_file, "w") as datasets_handler:
+        datasets_handler.write("%s\n" % "\n".join(dataset_ids))
     return datasets_file, resume
 
 
+def collect_kfold_dataset(fold_dir, output_dir, args, api=None):
+    """Copies the finished dataset generated in a fold directory to the
+       output directory and returns its id
+
+    """
+    try:
+        dataset_id = u.read_datasets(os.path.join(fold_dir,
+                                                  "dataset_gen"))[-1]
+    except (IOError, IndexError):
+        sys.exit("Failed to find the dataset generated in %s." % fold_dir)
+    try:
+        with open(u.storage_file_name(fold_dir, dataset_id)) as \
+                dataset_handler:
+            dataset = json.loads(dataset_handler.read())
+    except (IOError, ValueError):
+        dataset = dataset_id
+    # the stored dataset can be unfinished if the command was interrupted
+    if isinstance(dataset, basestring) or \
+            bigml.api.get_status(dataset)['code'] != bigml.api.FINISHED:
+        dataset = r.get_dataset(dataset_id, api=api,
+                                verbosity=args.verbosity,
+                                session_file=session_file)
+    with open(u.storage_file_name(output_dir, dataset_id), "w") as \
+            dataset_handler:
+        dataset_handler.write(json.dumps(dataset))
+    return dataset_id
+
+
 def add_model_options(command_args, args):
     """Adds the command options used to configure models or ensembles
 
@@ -360,12 +442,121 @@ def add_model_options(command_args, args):
     return command_args
 
 
-def create_kfold_evaluations(datasets_file, args, common_options,
-                             resume=False, counter=0):
-    """ Create k-fold cross-validation from a datasets file
+def run_subcommands(commands, resume=False, max_parallel=1):
+    """Logs and runs a list of bigmler main commands using up to
+       `max_parallel` parallel tasks. Each element in the list is a
+       (command_args, output_file) tuple. When resuming, the stored commands
+       are only run again if their output file was not generated.
+       Commands with no output file have a memoized result, so they are
+       logged to keep the resume sequence but not run.
 
     """
     global subcommand_list
+    pending = []
+    for command_args, output_file in commands:
+        command = rebuild_command(command_args)
+        if resume and subcommand_list:
+            next_command = subcommand_list.pop()
+            if not different_command(next_command, command):
+                last_command = not subcommand_list
+                if last_command:
+                    resume = False
+                if output_file is None or os.path.exists(output_file):
+                    continue
+                # the stored command was interrupted. Only the last command
+                # can be resumed, and only when commands are run in sequence
+                if last_command and max_parallel < 2:
+                    pending.append(['main', '--resume'])
+                else:
+                    pending.append(command_args)
+                continue
+            resume = False
+        u.sys_log_message(command, log_file=subcommand_file)
+        if output_file is not None:
+            pending.append(command_args)
+    for _ in run_in_parallel(main_dispatcher, pending,
+                             max_parallel=max_parallel):
+        pass
+    return resume
+
+
+def read_evaluation(output_dir):
+    """Reads the evaluation stored in the output directory of a subcommand
+
+    """
+    evaluation_file = os.path.normpath(os.path.join(output_dir,
+                                                    "evaluation.json"))
+    try:
+        with open(evaluation_file) as evaluation_handler:
+            return json.loads(evaluation_handler.read())
+    except (ValueError, IOError):
+        sys.exit("Failed to retrieve evaluation.")
+
+
+def load_evaluations_memo():
+    """Reads the stored evaluations memo. Each line in the memo file contains
+       the JSON of a [key, evaluation] pair.
+
+    """
+    global evaluations_memo
+    evaluations_memo = {}
+    line = "\n"
+    try:
+        with open(MEMO_LOG) as memo_handler:
+            for line in memo_handler:
+                try:
+                    key, evaluation = json.loads(line)
+                    evaluations_memo[key] = evaluation
+                except ValueError:
+                    # lines can be truncated if a previous run was aborted
+                    pass
+    except IOError:
+        pass
+    if not line.endswith("\n"):
+        # new evaluations must not be appended to the truncated line
+        u.log_message("\n", log_file=MEMO_LOG)
+    return evaluations_memo
+
+
+def evaluation_memo_key(datasets, model_fields, model_options, args):
+    """Hashed key for the evaluation of the models built with the given
+       datasets, feature subset and model options when optimizing the
+       metric set in `args`.
+
+    """
+    if model_fields:
+        model_fields = sorted(model_fields.split(args.args_separator))
+    key = json.dumps([datasets, model_fields, model_options,
+                      args.optimize, args.optimize_category])
+    return hashlib.sha1(key.encode(u.FILE_ENCODING)).hexdigest()
+
+
+def memoized_evaluation(key):
+    """Returns the memoized evaluation for the key, if any
+
+    """
+    if evaluations_memo is None:
+        load_evaluations_memo()
+    return evaluations_memo.get(key)
+
+
+def memoize_evaluation(key, evaluation):
+    """Stores the model information of the evaluation in the memo
+
+    """
+    if evaluations_memo is None:
+        load_evaluations_memo()
+    evaluation = {"model": evaluation.get("model", {})}
+    evaluations_memo[key] = evaluation
+    u.log_message("%s\n" % json.dumps([key, evaluation]), log_file=MEMO_LOG)
+
+
+def kfold_evaluation_command(datasets_file, args, common_options, counter=0):
+    """Builds the command that creates a k-fold cross-validation from
+       a datasets file. Returns the command arguments and its output
+       directory.
+
+    """
     output_dir = os.path.normpath(
         u.check_dir(os.path.join(u"%s%s" % (args.output_dir, counter),
                                  u"evaluation.json")))
@@ -388,27 +579,115 @@ def create_kfold_evaluations(datasets_file, args, common_options,
     common_options_list = u.get_options_list(args, common_options,
                                              prioritary=command_args)
     command_args.extend(common_options_list)
-    command = rebuild_command(command_args)
-    if resume:
-        next_command = subcommand_list.pop()
-        if different_command(next_command, command):
-            resume = False
-            u.sys_log_message(command, log_file=subcommand_file)
-            main_dispatcher(args=command_args)
-        elif not subcommand_list:
-            main_dispatcher(args=['main', '--resume'])
-            resume = False
-    else:
-        u.sys_log_message(command, log_file=subcommand_file)
-        main_dispatcher(args=command_args)
-    evaluation_file = os.path.normpath(os.path.join(output_dir,
-                                                    "evaluation.json"))
+    return command_args, output_dir
+
+
+def create_kfold_evaluations(datasets_file, args, common_options,
+                             resume=False, counter=0):
+    """ Create k-fold cross-validation from a datasets file
+
+    """
+    command_args, output_dir = kfold_evaluation_command(
+        datasets_file, args, common_options, counter=counter)
+    resume = run_subcommands(
+        [(command_args, os.path.join(output_dir, "evaluation.json"))],
+        resume=resume)
+    return read_evaluation(output_dir), resume
+
+
+def read_features_sets(path):
+    """Reads the feature subsets stored in the features_sets.csv file of a
+       previous --features analysis. Returns the file name and the
+       (state, score, metric_value, folds) rows.
+
+    """
+    features_file = (os.path.join(path, FEATURES_LOG) if os.path.isdir(path)
+                     else path)
+    rows = []
     try:
-        with open(evaluation_file) as evaluation_handler:
-            evaluation = json.loads(evaluation_handler.read())
-        return evaluation, resume
-    except (ValueError, IOError):
-        sys.exit("Failed to retrieve evaluation.")
+        with open(features_file) as features_handler:
+            for row in csv.DictReader(features_handler):
+                state = [bool(in_set) for in_set in json.loads(row["state"])]
+                rows.append((state, float(row["score"]),
+                             float(row["metric_value"]),
+                             int(row.get("folds") or 0)))
+    except IOError:
+        sys.exit("Could not read the %s file." % features_file)
+    except (KeyError, ValueError):
+        sys.exit("Failed to read the feature subsets in %s." % features_file)
+    return features_file, rows
+
+
+def warm_start_seeds(features_sets, field_ids):
+    """Fully cross-validated feature subsets among the ones read from a
+       previous analysis
+
+    """
+    features_file, rows = features_sets
+    for (state, _, _, _) in rows:
+        if len(state) != len(field_ids):
+            sys.exit("The feature subsets in %s do not match the"
+                     " fields in the current analysis." %
+                     features_file)
+    # screened out and not evaluated states are not used
+    max_folds = max([0] + [folds for (_, _, _, folds) in rows])
+    return [(state, score, metric_value) for (state, score, metric_value,
+                                              folds) in rows
+            if folds == max_folds and score > - float('inf')]
+
+
+def baseline_importance(datasets_file, args, api, common_options,
+                        resume=False):
+    """Builds a model using all the features and the k-fold datasets and
+       returns its field importances (averaged for ensembles).
+
+    """
+    output_dir = os.path.normpath(os.path.join(u.check_dir(datasets_file),
+                                               "baseline"))
+    command = COMMANDS["baseline"] % (datasets_file, output_dir,
+                                      "%s_baseline" % args.name[
+                                          0: NAME_MAX_LENGTH - 9])
+    command_args = command.split()
+    command_args.append("--objective")
+    command_args.append(args.objective_field)
+    command_args = add_model_options(command_args, args)
+    common_options_list = u.get_options_list(args, common_options,
+                                             prioritary=command_args)
+    command_args.extend(common_options_list)
+    models_file = os.path.join(output_dir, "models")
+    resume = run_subcommands([(command_args, models_file)], resume=resume)
+    importance = {}
+    model_ids = u.read_resources(models_file)
+    for model_id in model_ids:
+        model = u.check_resource(model_id, api.get_model,
+                                 query_string=r.ALL_FIELDS_QS)
+        try:
+            model_importance = model['object']['model']['importance']
+        except KeyError:
+            sys.exit("Failed to retrieve the field importance of %s." %
+                     model_id)
+        for field_id, value in model_importance:
+            importance[field_id] = (importance.get(field_id, 0) +
+                                    value / len(model_ids))
+    return importance, resume
+
+
+def importance_seeds(field_ids, importance):
+    """Feature subsets made of the most important fields: one per number of
+       fields with a non-zero importance. Returns the fields order too.
+
+    """
+    order = sorted(range(len(field_ids)),
+                   key=lambda index: - importance.get(field_ids[index], 0))
+    seeds = []
+    for index in range(len(field_ids)):
+        if importance.get(field_ids[order[index]], 0) <= 0:
+            break
+        state = [False for _ in field_ids]
+        for field_index in order[0: index + 1]:
+            state[field_index] = True
+        seeds.append(state)
+    return seeds, order
 
 
 def find_max_state(states_list):
@@ -444,10 +723,15 @@ def best_first_search(datasets_file, api, args, common_options,
     loop_counter = 0
     features_file = os.path.normpath(os.path.join(args.output_dir,
                                                   FEATURES_LOG))
+    # the warm start subsets are read before the features log is rewritten,
+    # as they can be stored in the same file
+    features_sets = (read_features_sets(args.warm_start) if args.warm_start
+                     else None)
     with open(features_file, 'w', 0) as features_handler:
         features_writer = csv.writer(features_handler, lineterminator="\n")
         features_writer.writerow([
-            "step", "state", "score", "metric_value", "best_score"])
+            "step", "state", "score", "metric_value", "best_score",
+            "folds"])
         features_handler.flush()
         if staleness is None:
             staleness = DEFAULT_STALENESS
@@ -483,16 +767,64 @@ def best_first_search(datasets_file, api, args, common_options,
         initial_state = [False for field_id in field_ids]
         open_list = [(initial_state, - float('inf'), -float('inf'))]
         closed_list = []
-        best_state, best_score, best_metric_value = open_list[0]
-        best_unchanged_count = 0
+        # number of k-fold datasets used to score each state
+        total_folds = len(u.read_datasets(datasets_file))
+        schedule = screening_schedule(args, total_folds)
+        states_folds = {tuple(initial_state): 0}
+        # hashed versions of the states in the closed list and of the
+        # screened out states, that are not expanded
+        closed_states = set()
         metric = args.optimize
+        # order used to expand the fields in a state
+        fields_order = range(len(field_ids))
+        seeds = []
+        if features_sets is not None:
+            seeds = warm_start_seeds(features_sets, field_ids)
+            message = u.dated("Starting from the %s feature subsets in %s\n" %
+                              (len(seeds), args.warm_start))
+            u.log_message(message, log_file=session_file,
+                          console=args.verbosity)
+        if args.importance_seed:
+            importance, resume = baseline_importance(
+                datasets_file, args, api, common_options, resume=resume)
+            seed_states, fields_order = importance_seeds(field_ids,
+                                                         importance)
+            known_states = set([tuple(state) for (state, _, _) in seeds])
+            seed_states = [state for state in seed_states
+                           if tuple(state) not in known_states]
+            candidates = []
+            for state in seed_states:
+                counter += 1
+                candidates.append((counter, args.args_separator.join(
+                    [fields.field_name(field_ids[index]) for
+                     (index, in_set) in enumerate(state) if in_set])))
+            scores, resume = screen_candidates(
+                datasets_file, args, candidates, common_options,
+                schedule, penalty=penalty, resume=resume, metric=metric)
+            for state, (score, metric_value, metric, folds) in zip(
+                    seed_states, scores):
+                states_folds[tuple(state)] = folds
+                if folds == total_folds:
+                    seeds.append((state, score, metric_value))
+                else:
+                    closed_states.add(tuple(state))
+        if seeds:
+            open_list = seeds
+            for (state, _, _) in seeds:
+                states_folds.setdefault(tuple(state), total_folds)
+        # hashed versions of the states in the open list
+        open_states = set([tuple(state) for (state, _, _) in open_list])
+        best_state, best_score, best_metric_value = (
+            initial_state, - float('inf'), - float('inf'))
+        best_unchanged_count = 0
         while best_unchanged_count < staleness and open_list:
             loop_counter += 1
             features_set = find_max_state(open_list)
             state, score, metric_value = features_set
+            folds = states_folds[tuple(state)]
             features_writer.writerow([
                 loop_counter, [int(in_set) for in_set in state],
-                score, metric_value, best_score])
+                score, metric_value, best_score, folds])
             features_handler.flush()
             try:
                 state_fields = [fields.field_name(field_ids[index])
@@ -501,8 +833,10 @@ def best_first_search(datasets_file, api, args, common_options,
             except ValueError, exc:
                 sys.exit(exc)
             closed_list.append(features_set)
+            closed_states.add(tuple(state))
             open_list.remove(features_set)
-            if (score - EPSILON) > best_score:
+            open_states.discard(tuple(state))
+            if (score - EPSILON) > best_score and folds == total_folds:
                 best_state, best_score, best_metric_value = features_set
                 best_unchanged_count = 0
                 if state_fields:
@@ -521,26 +855,39 @@ def best_first_search(datasets_file, api, args, common_options,
                 best_unchanged_count += 1
 
             children = expand_state(state)
-            for child in children:
-                if (child not in [state for state, _, _ in open_list] and
-                        child not in [state for state, _, _ in closed_list]):
+            new_children = []
+            candidates = []
+            for child in [children[index] for index in fields_order]:
+                child_key = tuple(child)
+                if (child_key not in open_states and
+                        child_key not in closed_states):
                     try:
                         input_fields = [fields.field_name(field_id)
                                         for (i, field_id)
                                         in enumerate(field_ids) if child[i]]
                     except ValueError, exc:
                         sys.exit(exc)
-                    # create models and evaluation with input_fields
-                    args.model_fields = args.args_separator.join(input_fields)
                     counter += 1
-                    (score,
-                     metric_value,
-                     metric,
-                     resume) = kfold_evaluate(datasets_file,
-                                              args, counter, common_options,
-                                              penalty=penalty, resume=resume,
-                                              metric=metric)
-                    open_list.append((child, score, metric_value))
+                    new_children.append(child)
+                    open_states.add(child_key)
+                    candidates.append(
+                        (counter, args.args_separator.join(input_fields)))
+            if candidates:
+                # create models and evaluations with the input_fields of
+                # every child, in parallel if required
+                scores, resume = screen_candidates(
+                    datasets_file, args, candidates, common_options,
+                    schedule, penalty=penalty, resume=resume, metric=metric)
+                for child, (score, metric_value, metric, folds) in zip(
+                        new_children, scores):
+                    states_folds[tuple(child)] = folds
+                    # only the fully cross-validated states are compared
+                    # and expanded
+                    if folds == total_folds:
+                        open_list.append((child, score, metric_value))
+                    else:
+                        open_states.discard(tuple(child))
+                        closed_states.add(tuple(child))
         try:
             best_features = [fields.field_name(field_ids[i]) for (i, score)
                              in enumerate(best_state) if score]
@@ -556,7 +903,7 @@ def best_first_search(datasets_file, api, args, common_options,
             message = (u'%s = %f\n' % (metric.capitalize(), best_metric_value))
         u.log_message(message, log_file=session_file, console=1)
         message = (u'Evaluated %d/%d feature subsets\n' %
-                   ((len(open_list) + len(closed_list) - 1),
+                   (len([folds for folds in states_folds.values() if folds]),
                     2 ** len(field_ids) - 1))
         u.log_message(message, log_file=session_file, console=1)
 
@@ -574,20 +921,12 @@ def extract_evaluation_info(evaluation, category):
     return evaluation
 
 
-def kfold_evaluate(datasets_file, args, counter, common_options,
-                   penalty=DEFAULT_PENALTY,
-                   metric=ACCURACY, resume=False):
-    """Scoring k-fold cross-validation using the given feature subset
+def evaluation_score(evaluation, args, metric=ACCURACY, penalty=0):
+    """Returns the score, the metric value and the metric name used to score
+       an evaluation. The `penalty` amount is substracted from the
+       metric value.
 
     """
-    # create evaluation with input_fields
-    args.output_dir = os.path.normpath(os.path.join(u.check_dir(datasets_file),
-                                                    "kfold"))
-    evaluation, resume = create_kfold_evaluations(datasets_file, args,
-                                                  common_options,
-                                                  resume=resume,
-                                                  counter=counter)
-
     evaluation = extract_evaluation_info(
         evaluation, args.optimize_category)
     avg_metric = AVG_PREFIX % metric
@@ -599,11 +938,228 @@ def kfold_evaluate(datasets_file, args, counter, common_options,
             sys.exit("Failed to find %s or r-squared in the evaluation"
                      % metric)
     invert = -1 if metric in MINIMIZE_OPTIONS else 1
-    return (invert * (evaluation[avg_metric] -
-                      invert * penalty *
-                      len(args.model_fields.split(args.args_separator))),
+    return (invert * (evaluation[avg_metric] - invert * penalty),
             evaluation[avg_metric],
-            metric_literal, resume)
+            metric_literal)
+
+
+def kfold_evaluate(datasets_file, args, counter, common_options,
+                   penalty=DEFAULT_PENALTY,
+                   metric=ACCURACY, resume=False):
+    """Scoring k-fold cross-validation using the given feature subset
+
+    """
+    scores, resume = kfold_evaluate_candidates(
+        datasets_file, args, [(counter, args.model_fields)], common_options,
+        penalty=penalty, metric=metric, resume=resume)
+    score, metric_value, metric_literal = scores[0]
+    return score, metric_value, metric_literal, resume
+
+
+def kfold_evaluate_candidates(datasets_file, args, candidates,
+                              common_options, penalty=DEFAULT_PENALTY,
+                              metric=ACCURACY, resume=False, subdir="kfold"):
+    """Scoring k-fold cross-validation for a list of (counter, model_fields)
+       candidate feature subsets. A third element in the tuple can hold a
+       dict of model options (args attributes) to be used for the candidate.
+       Up to --max-parallel-candidates k-fold
+       cross-validations are run in parallel. The evaluations memo is
+       checked first, so only the candidates that were never evaluated
+       create new resources. The scores are returned in the candidates order.
+
+    """
+    # create evaluations with input_fields
+    args.output_dir = os.path.normpath(os.path.join(u.check_dir(datasets_file),
+                                                    subdir))
+    datasets = u.read_datasets(datasets_file)
+    commands = []
+    evaluations = []
+    for candidate in candidates:
+        counter, model_fields = candidate[0: 2]
+        args.model_fields = model_fields
+        if len(candidate) > 2:
+            for option, value in candidate[2].items():
+                setattr(args, option, value)
+        model_options = add_model_options(
+            ["--objective", args.objective_field], args)
+        command_args, output_dir = kfold_evaluation_command(
+            datasets_file, args, common_options, counter=counter)
+        key = evaluation_memo_key(datasets, model_fields, model_options, args)
+        evaluation = memoized_evaluation(key)
+        if evaluation is None:
+            commands.append((command_args,
+                             os.path.join(output_dir, "evaluation.json")))
+        else:
+            message = u.dated("Using the stored evaluation for %s\n" %
+                              model_fields)
+            u.log_message(message, log_file=session_file,
+                          console=args.verbosity)
+            commands.append((command_args, None))
+        evaluations.append((key, evaluation, output_dir))
+    resume = run_subcommands(commands, resume=resume,
+                             max_parallel=args.max_parallel_candidates)
+    scores = []
+    for candidate, (key, evaluation, output_dir) in zip(
+            candidates, evaluations):
+        if evaluation is None:
+            evaluation = read_evaluation(output_dir)
+            memoize_evaluation(key, evaluation)
+        model_fields = candidate[1]
+        features_penalty = (0 if not model_fields else penalty * len(
+            model_fields.split(args.args_separator)))
+        scores.append(evaluation_score(evaluation, args,
+                                       metric=metric,
+                                       penalty=features_penalty))
+    return scores, resume
+
+
+def better_node_threshold(score, node_threshold, best_score, best_threshold):
+    """Checks whether the score of a node threshold improves the best one.
+       Scores that differ less than EPSILON are resolved in favour of the
+       smaller threshold.
+
+    """
+    if (score - EPSILON) > best_score:
+        return True
+    return (best_threshold is not None and node_threshold < best_threshold
+            and abs(score - best_score) <= EPSILON)
+
+
+def bracket_indexes(low, high, probes):
+    """Indexes of the probe points evenly spread in the [low, high] bracket
+
+    """
+    if high - low + 1 <= probes:
+        return range(low, high + 1)
+    spacing = (high - low) / float(probes - 1)
+    return sorted(set([int(round(low + index * spacing))
+                       for index in range(probes)]))
+
+
+def linear_nodes_search(evaluate, thresholds, state, staleness):
+    """Evaluates the thresholds one by one till the best score is not
+       improved for `staleness` steps.
+
+    """
+    best_unchanged_count = 0
+    for index in range(len(thresholds)):
+        if best_unchanged_count >= staleness:
+            break
+        evaluate([index])
+        if state["best_index"] == index:
+            best_unchanged_count = 0
+        else:
+            best_unchanged_count += 1
+
+
+def bracketing_nodes_search(evaluate, thresholds, state, probes):
+    """Coarse-to-fine search: the probe points evenly spread in the bracket
+       are evaluated in parallel and the bracket is narrowed around the best
+       one till all its thresholds are evaluated.
+
+    """
+    low, high = 0, len(thresholds) - 1
+    while True:
+        indexes = bracket_indexes(low, high, probes)
+        evaluate(indexes)
+        if len(indexes) == high - low + 1:
+            break
+        radius = int(math.ceil((high - low) / float(probes - 1)))
+        low = max(low, state["best_index"] - radius)
+        high = min(high, state["best_index"] + radius)
+
+
+def golden_nodes_search(evaluate, thresholds, state):
+    """Golden-section search: assumes an unimodal score and discards the
+       part of the bracket beyond the worst of the two inner probe points.
+
+    """
+    low, high = 0, len(thresholds) - 1
+    while high - low > 3:
+        inner = int(round(GOLDEN_RATIO * (high - low)))
+        left, right = high - inner, low + inner
+        if left >= right:
+            break
+        evaluate([left, right])
+        if state["scores"][left] >= state["scores"][right]:
+            high = right
+        else:
+            low = left
+    evaluate(range(low, high + 1))
+
+
+def screening_schedule(args, total_folds):
+    """Sorted list of the number of k-fold datasets used in each screening
+       round, as set in --screening-folds
+
+    """
+    if not args.screening_folds:
+        return []
+    try:
+        schedule = sorted(set([int(folds) for folds in
+                               args.screening_folds.split(
+                                   args.args_separator)]))
+    except ValueError:
+        sys.exit("The --screening-folds option expects a comma-separated"
+                 " list of integers.")
+    if schedule[0] < 2 or schedule[-1] >= total_folds:
+        sys.exit("The number of folds in --screening-folds must be between"
+                 " 2 and %s." % (total_folds - 1))
+    if args.screening_rate is None:
+        args.screening_rate = DEFAULT_SCREENING_RATE
+    if not 0 < args.screening_rate < 1:
+        sys.exit("The --screening-rate value must be between 0 and 1.")
+    return schedule
+
+
+def screening_datasets_file(datasets_file, folds):
+    """Stores the first `folds` k-fold datasets in a new datasets file
+
+    """
+    subset_file = u"%s_%s" % (datasets_file, folds)
+    datasets = u.read_datasets(datasets_file)[0: folds]
+    with open(subset_file, "w") as subset_handler:
+        subset_handler.write("%s\n" % "\n".join(datasets))
+    return subset_file
+
+
+def screen_candidates(datasets_file, args, candidates, common_options,
+                      schedule, penalty=DEFAULT_PENALTY, metric=ACCURACY,
+                      resume=False):
+    """Successive halving: the candidates are cross-validated using only
+       the number of k-fold datasets in each round of the schedule, and the
+       top --screening-rate fraction of them is promoted to the next round.
+       The remaining ones are cross-validated with all the k-fold datasets.
+       Returns the (score, metric_value, metric, folds) of each candidate.
+
+    """
+    total_folds = len(u.read_datasets(datasets_file))
+    results = [None] * len(candidates)
+    promoted = range(len(candidates))
+    for folds in schedule:
+        keep = max(1, int(math.ceil(len(promoted) * args.screening_rate)))
+        if keep == len(promoted):
+            continue
+        message = u.dated("Screening %s candidates using %s folds\n" %
+                          (len(promoted), folds))
+        u.log_message(message, log_file=session_file,
+                      console=args.verbosity)
+        scores, resume = kfold_evaluate_candidates(
+            screening_datasets_file(datasets_file, folds), args,
+            [candidates[index] for index in promoted], common_options,
+            penalty=penalty, metric=metric, resume=resume,
+            subdir="screening%s_" % folds)
+        for index, score in zip(promoted, scores):
+            results[index] = score + (folds,)
+        ranking = sorted(promoted, key=lambda index: (- results[index][0],
+                                                      index))
+        promoted = sorted(ranking[0: keep])
+    scores, resume = kfold_evaluate_candidates(
+        datasets_file, args, [candidates[index] for index in promoted],
+        common_options, penalty=penalty, metric=metric, resume=resume)
+    for index, score in zip(promoted, scores):
+        results[index] = score + (total_folds,)
+    return results, resume
 
 
 def best_node_threshold(datasets_file, args, common_options,
@@ -612,7 +1168,6 @@ def best_node_threshold(datasets_file, args, common_options,
     """Selecting the node_limit to be used in the model construction
 
     """
-    loop_counter = 0
     nodes_file = os.path.normpath(os.path.join(args.output_dir,
                                                NODES_LOG))
     with open(nodes_file, 'w', 0) as nodes_handler:
@@ -622,55 +1177,77 @@ def best_node_threshold(datasets_file, args, common_options,
         nodes_handler.flush()
         args.output_dir = os.path.normpath(os.path.join(args.output_dir,
                                                         "node_th"))
-        max_nodes = args.max_nodes + 1
-
         if args.min_nodes is None:
             args.min_nodes = DEFAULT_MIN_NODES
         if args.nodes_step is None:
             args.nodes_step = DEFAULT_NODES_STEP
-        node_threshold = args.min_nodes
         if staleness is None:
             staleness = DEFAULT_STALENESS
         if penalty is None:
             penalty = DEFAULT_NODES_PENALTY
-        best_score = - float('inf')
-        best_unchanged_count = 0
-        metric = args.optimize
-        score = best_score
-        while best_unchanged_count < staleness and node_threshold < max_nodes:
-            loop_counter += 1
-            (score,
-             metric_value,
-             metric,
-             resume) = node_threshold_evaluate(datasets_file, args,
-                                               node_threshold, common_options,
-                                               penalty=penalty, resume=resume,
-                                               metric=metric)
-            nodes_writer.writerow([
-                loop_counter, node_threshold, score, metric_value, best_score])
-            nodes_handler.flush()
-            if (score - EPSILON) > best_score:
-                best_threshold = node_threshold
-                best_score = score
-                best_unchanged_count = 0
-                message = 'New best node threshold: %s\n' % (best_threshold)
-                u.log_message(message, log_file=session_file,
-                              console=args.verbosity)
-                if metric in PERCENT_EVAL_METRICS:
-                    message = '%s = %0.2f%% (score = %s)\n' % (
-                        metric.capitalize(), metric_value * 100, score)
-                else:
-                    message = '%s = %f (score = %s)\n' % (metric.capitalize(),
-                                                          metric_value,
-                                                          score)
-                u.log_message(message, log_file=session_file,
-                              console=args.verbosity)
-            else:
-                best_unchanged_count += 1
-            node_threshold += args.nodes_step
+        thresholds = range(args.min_nodes, args.max_nodes + 1,
+                           args.nodes_step)
+        state = {"step": 0, "scores": {}, "best_index": None,
+                 "best_score": - float('inf'), "best_metric_value": None,
+                 "metric": args.optimize, "resume": resume}
+
+        def evaluate(indexes):
+            """Evaluates the thresholds in `indexes` that were not probed
+               before and logs every probe in the nodes file.
+
+            """
+            indexes = [index for index in sorted(set(indexes))
+                       if index not in state["scores"]]
+            scores, state["resume"] = node_threshold_evaluate_candidates(
+                datasets_file, args,
+                [thresholds[index] for index in indexes], common_options,
+                penalty=penalty, metric=state["metric"],
+                resume=state["resume"])
+            for index, (score, metric_value, metric) in zip(indexes, scores):
+                state["step"] += 1
+                state["scores"][index] = score
+                state["metric"] = metric
+                best_threshold = (None if state["best_index"] is None
+                                  else thresholds[state["best_index"]])
+                nodes_writer.writerow([
+                    state["step"], thresholds[index], score, metric_value,
+                    state["best_score"]])
+                nodes_handler.flush()
+                if better_node_threshold(score, thresholds[index],
+                                         state["best_score"],
+                                         best_threshold):
+                    state["best_index"] = index
+                    state["best_score"] = score
+                    state["best_metric_value"] = metric_value
+                    message = 'New best node threshold: %s\n' % (
+                        thresholds[index])
+                    u.log_message(message, log_file=session_file,
+                                  console=args.verbosity)
+                    if metric in PERCENT_EVAL_METRICS:
+                        message = '%s = %0.2f%% (score = %s)\n' % (
+                            metric.capitalize(), metric_value * 100, score)
+                    else:
+                        message = '%s = %f (score = %s)\n' % (
+                            metric.capitalize(), metric_value, score)
+                    u.log_message(message, log_file=session_file,
+                                  console=args.verbosity)
+
+        if args.nodes_search == BRACKETING_SEARCH:
+            bracketing_nodes_search(
+                evaluate, thresholds, state,
+                max(DEFAULT_NODES_PROBES, args.max_parallel_candidates))
+        elif args.nodes_search == GOLDEN_SEARCH:
+            golden_nodes_search(evaluate, thresholds, state)
+        else:
+            linear_nodes_search(evaluate, thresholds, state, staleness)
 
+        if state["best_index"] is None:
+            sys.exit("No node threshold could be evaluated. Please, check"
+                     " the --min-nodes and --max-nodes values.")
+        metric = state["metric"]
+        best_score = state["best_score"]
         message = ('The best node threshold is: %s \n'
-                   % best_threshold)
+                   % thresholds[state["best_index"]])
         u.log_message(message, log_file=session_file, console=1)
         if metric in PERCENT_EVAL_METRICS:
             message = ('%s = %0.2f%%\n' % (metric.capitalize(),
@@ -678,6 +1255,9 @@ def best_node_threshold(datasets_file, args, common_options,
         else:
             message = ('%s = %f\n' % (metric.capitalize(), best_score))
         u.log_message(message, log_file=session_file, console=1)
+        message = ('%s node thresholds evaluated out of %s\n' %
+                   (state["step"], len(thresholds)))
+        u.log_message(message, log_file=session_file, console=1)
 
 
 def node_threshold_evaluate(datasets_file, args, node_threshold,
@@ -686,35 +1266,62 @@ def node_threshold_evaluate(datasets_file, args, node_threshold,
     """Scoring node_threshold created models
 
     """
-    # create evaluation with input_fields
-    evaluation, resume = create_node_th_evaluations(
-        datasets_file, args, common_options, resume=resume,
-        node_threshold=node_threshold)
-
-    evaluation = extract_evaluation_info(
-        evaluation, args.optimize_category)
-    avg_metric = AVG_PREFIX % metric
-    metric_literal = metric
-    if not avg_metric in evaluation:
-        avg_metric = AVG_PREFIX % R_SQUARED
-        metric_literal = R_SQUARED
-        if not avg_metric in evaluation:
-            sys.exit("Failed to find %s or r-squared in the evaluation"
-                     % metric)
-    invert = -1 if metric in MINIMIZE_OPTIONS else 1
-    return (invert * (evaluation[avg_metric] -
-                      invert * penalty * node_threshold),
-            evaluation[avg_metric],
-            metric_literal, resume)
+    scores, resume = node_threshold_evaluate_candidates(
+        datasets_file, args, [node_threshold], common_options,
+        penalty=penalty, metric=metric, resume=resume)
+    score, metric_value, metric_literal = scores[0]
+    return score, metric_value, metric_literal, resume
+
+
+def node_threshold_evaluate_candidates(datasets_file, args, node_thresholds,
+                                       common_options,
+                                       penalty=DEFAULT_NODES_PENALTY,
+                                       metric=ACCURACY, resume=False):
+    """Scoring the models built with a list of node thresholds. Up to
+       --max-parallel-candidates k-fold cross-validations are run in parallel
+       and stored evaluations are reused. The scores are returned in the
+       node thresholds order.
 
-
-def create_node_th_evaluations(datasets_file, args, common_options,
-                               resume=False,
-                               node_threshold=DEFAULT_MIN_NODES):
-    """ Create node_threshold evaluations
+    """
+    datasets = u.read_datasets(datasets_file)
+    commands = []
+    evaluations = []
+    for node_threshold in node_thresholds:
+        command_args, output_dir = node_threshold_command(
+            datasets_file, args, common_options, node_threshold=node_threshold)
+        model_options = ["--objective", args.objective_field,
+                         "--node-threshold", str(node_threshold)]
+        key = evaluation_memo_key(datasets, None, model_options, args)
+        evaluation = memoized_evaluation(key)
+        if evaluation is None:
+            commands.append((command_args,
+                             os.path.join(output_dir, "evaluation.json")))
+        else:
+            message = u.dated("Using the stored evaluation for node"
+                              " threshold %s\n" % node_threshold)
+            u.log_message(message, log_file=session_file,
+                          console=args.verbosity)
+            commands.append((command_args, None))
+        evaluations.append((key, evaluation, output_dir))
+    resume = run_subcommands(commands, resume=resume,
+                             max_parallel=args.max_parallel_candidates)
+    scores = []
+    for node_threshold, (key, evaluation, output_dir) in zip(
+            node_thresholds, evaluations):
+        if evaluation is None:
+            evaluation = read_evaluation(output_dir)
+            memoize_evaluation(key, evaluation)
+        scores.append(evaluation_score(evaluation, args, metric=metric,
+                                       penalty=(penalty * node_threshold)))
+    return scores, resume
+
+
+def node_threshold_command(datasets_file, args, common_options,
+                           node_threshold=DEFAULT_MIN_NODES):
+    """Builds the command that creates the node_threshold evaluations.
+       Returns the command arguments and its output directory.
 
     """
-    global subcommand_list
     output_dir = os.path.normpath(u.check_dir(
         os.path.join(u"%s%s" % (args.output_dir, node_threshold),
                      "evaluation.json")))
@@ -726,24 +1333,123 @@ def create_node_th_evaluations(datasets_file, args, common_options,
     command_args.extend(common_options_list)
     command_args.append("--objective")
     command_args.append(args.objective_field)
-    command = rebuild_command(command_args)
-    if resume:
-        next_command = subcommand_list.pop()
-        if different_command(next_command, command):
-            resume = False
-            u.sys_log_message(command, log_file=subcommand_file)
-            main_dispatcher(args=command_args)
-        elif not subcommand_list:
-            main_dispatcher(args=['main', '--resume'])
-            resume = False
+    return command_args, output_dir
+
+
+def hyperparams_space(args):
+    """List of (option, values) pairs to be searched. The default space
+       can be replaced by the JSON dictionary in --hyperparams-space.
+
+    """
+    if not args.hyperparams_space:
+        return HYPERPARAMS_SPACE
+    space = u.read_json(args.hyperparams_space)
+    options = [option for option, _ in HYPERPARAMS_SPACE]
+    for option, values in space.items():
+        if option not in options or not isinstance(values, list) or \
+                not values:
+            sys.exit("Failed to use %s in --hyperparams-space. The allowed"
+                     " options are %s and their values must be given in a"
+                     " list." % (option, ", ".join(options)))
+    return [(option, space[option]) for option in options
+            if option in space]
+
+
+def hyperparams_trials(args):
+    """Settings to be evaluated, in the grid order or shuffled for random
+       search. Ensemble options are ignored in single models, so only one
+       of the equivalent settings is kept.
+
+    """
+    space = hyperparams_space(args)
+    trials = []
+    known_trials = set()
+    for values in itertools.product(*[values for _, values in space]):
+        settings = dict(zip([option for option, _ in space], values))
+        if settings.get("number_of_models",
+                        args.number_of_models) < 2:
+            settings.update(dict([(option, value) for option, value in
+                                  ENSEMBLE_HYPERPARAMS.items()
+                                  if option in settings]))
+        trial_key = tuple(sorted(settings.items()))
+        if trial_key not in known_trials:
+            known_trials.add(trial_key)
+            trials.append(settings)
+    max_trials = args.max_trials
+    if args.hyperparams_search != GRID_SEARCH:
+        random.Random(r.SEED).shuffle(trials)
+        if max_trials is None:
+            max_trials = DEFAULT_RANDOM_TRIALS
+    return trials[0: max_trials]
+
+
+def best_hyperparams(datasets_file, args, common_options, staleness=None,
+                     resume=False):
+    """Selecting the model and ensemble options to be used in the model
+       construction. Trials are evaluated in groups of
+       --max-parallel-candidates and the search stops when the best score is
+       not improved for `staleness` trials.
+
+    """
+    if staleness is None:
+        staleness = DEFAULT_STALENESS
+    trials = hyperparams_trials(args)
+    options = sorted(trials[0].keys()) if trials else []
+    original_settings = dict([(option, getattr(args, option))
+                              for option in options])
+    trials_file = os.path.normpath(os.path.join(args.output_dir,
+                                                TRIALS_LOG))
+    batch_size = max(1, args.max_parallel_candidates)
+    metric = args.optimize
+    results = []
+    best_score = - float('inf')
+    best_unchanged_count = 0
+    for start in range(0, len(trials), batch_size):
+        if best_unchanged_count >= staleness:
+            break
+        batch = [(start + index + 1, args.model_fields, settings)
+                 for index, settings in enumerate(
+                     trials[start: start + batch_size])]
+        scores, resume = kfold_evaluate_candidates(
+            datasets_file, args, batch, common_options, penalty=0,
+            metric=metric, resume=resume, subdir="trial")
+        for (counter, _, settings), (score, metric_value, metric) in zip(
+                batch, scores):
+            results.append((score, counter, settings, metric_value))
+            if (score - EPSILON) > best_score:
+                best_score = score
+                best_unchanged_count = 0
+                message = 'New best trial %s: %s\n' % (counter, settings)
+                u.log_message(message, log_file=session_file,
+                              console=args.verbosity)
+            else:
+                best_unchanged_count += 1
+    for option, value in original_settings.items():
+        setattr(args, option, value)
+    if not results:
+        sys.exit("No hyperparameters trial could be evaluated.")
+    # ranked trials log
+    results.sort(key=lambda result: (- result[0], result[1]))
+    with open(trials_file, 'w', 0) as trials_handler:
+        trials_writer = csv.writer(trials_handler, lineterminator="\n")
+        trials_writer.writerow(["rank", "trial"] + options +
+                               ["score", "metric_value"])
+        for rank, (score, counter, settings, metric_value) in enumerate(
+                results):
+            trials_writer.writerow([rank + 1, counter] +
+                                   [settings[option] for option in options] +
+                                   [score, metric_value])
+    score, counter, settings, metric_value = results[0]
+    message = ('The best hyperparameters are: %s \n' %
+               ", ".join(["%s=%s" % (option, settings[option])
+                          for option in options]))
+    u.log_message(message, log_file=session_file, console=1)
+    if metric in PERCENT_EVAL_METRICS:
+        message = ('%s = %0.2f%%\n' % (metric.capitalize(),
+                                       (metric_value * 100)))
     else:
-        u.sys_log_message(command, log_file=subcommand_file)
-        main_dispatcher(args=command_args)
-    evaluation_file = os.path.normpath(os.path.join(output_dir,
-                                                    "evaluation.json"))
-    try:
-        with open(evaluation_file) as evaluation_handler:
-            evaluation = json.loads(evaluation_handler.read())
-        return evaluation, resume
-    except (ValueError, IOError):
-        sys.exit("Failed to retrieve evaluation.")
+        message = ('%s = %f\n' % (metric.capitalize(), metric_value))
+    u.log_message(message, log_file=session_file, console=1)
+    message = ('%s trials evaluated out of %s\n' %
+               (len(results), len(trials)))
+    u.log_message(message, log_file=session_file, console=1)
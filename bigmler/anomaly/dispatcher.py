@@ -210,6 +210,10 @@ def compute_output(api, args):
         # Remote anomaly scores: scores are computed as batch anomaly scores
         # in bigml.com except when --no-batch flag is set on
         if args.remote and not args.no_batch:
+            if len(anomalies) > 1:
+                sys.exit("Only one anomaly detector can be used to compute"
+                         " remote anomaly scores. Please, remove --remote"
+                         " to use several anomaly detectors.")
             # create test source from file
             test_name = "%s - test" % args.name
             if args.test_source is None:
@@ -18,8 +18,12 @@
 """
 from __future__ import absolute_import
 
+import os
 import csv
 import sys
+import heapq
+import shutil
+import traceback
 
 import bigml.api
 
@@ -32,13 +36,23 @@ from bigml.anomaly import Anomaly
 from bigmler.test_reader import TestReader
 from bigmler.resources import NORMAL_FORMAT, FULL_FORMAT
 from bigmler.resources import create_batch_anomaly_score
+from bigmler.anomaly_scorer import AnomalyScorer, CHUNK_SIZE
+from bigmler.anomaly_scorer import (tree_height, depth_sum_cutoff,
+                                    mean_depth_score, threshold_flag)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # symbol used in failing anomaly score predictions
 NO_ANOMALY_SCORE = "NaN"
+# bytes read at a time when counting the quotes in the test file
+QUOTES_BLOCK = 1024 * 1024
 
 
 def use_prediction_headers(prediction_headers, output, test_reader,
-                           fields, args):
+                           fields, args, anomaly_ids=None):
     """Uses header information from the test file in the prediction output
 
        If --prediction-header is set, adds a headers row to the anomaly score
@@ -46,10 +60,17 @@ def use_prediction_headers(prediction_headers, output, test_reader,
        If --prediction-fields is used, retrieves the fields to exclude
        from the test input in the --prediction-info full format, that includes
        them all by default.
+       When several anomaly detectors are used, their columns are labeled
+       with the `anomaly_ids`.
 
     """
     exclude = []
     headers = ["anomaly score"]
+    if args.anomaly_flag:
+        headers = ["anomalous", "anomaly score bound"]
+    if anomaly_ids and len(anomaly_ids) > 1:
+        headers = ["%s %s" % (header, anomaly_id) for
+                   anomaly_id in anomaly_ids for header in headers]
 
     if (args.prediction_info == FULL_FORMAT or
             args.prediction_fields is not None):
@@ -111,6 +132,25 @@ def write_anomaly_score(anomaly_score_resource, output=sys.stdout,
             raise AttributeError("You should provide a writeable object")
 
 
+def write_anomaly_values(values, output, prediction_info=NORMAL_FORMAT,
+                         input_data=None, exclude=None):
+    """Writes the anomaly scores of the anomaly detectors (or their flags
+       and score bounds, see --anomaly-flag) to the required output, with
+       the same formats used in `write_anomaly_score`
+
+    """
+    row = []
+    if prediction_info != NORMAL_FORMAT:
+        if input_data is None:
+            input_data = []
+        row = input_data
+        if exclude:
+            for index in exclude:
+                del row[index]
+    row.extend(values)
+    output.writerow(row)
+
+
 def anomaly_score_to_row(anomaly_score_resource):
     """Returns a csv row to store main anomaly score info in csv files.
 
@@ -118,29 +158,347 @@ def anomaly_score_to_row(anomaly_score_resource):
     return [anomaly_score_resource['object']['core']]
 
 
-def local_anomaly_score(anomalies, test_reader, output, args,
-                        exclude=None):
-    """Get local anomaly detector and issue anomaly score prediction
+class ScoreFilter(object):
+    """Output wrapper that only keeps the rows whose anomaly score reaches
+       the `threshold`. When `top` is set, the rows with the `top` highest
+       scores are kept in a heap and written in descending order of score
+       when closed. With several anomaly detectors, the last `columns`
+       columns of each row are their scores and the highest one is used.
 
     """
-    # Only one anomaly detector at present
-    local_anomaly = Anomaly(anomalies[0])
-    test_set_header = test_reader.has_headers()
-    for input_data in test_reader:
-        input_data_dict = test_reader.dict(input_data, filtering=False)
+
+    def __init__(self, output, top=None, threshold=None, columns=1):
+        self.output = output
+        self.top = top
+        self.threshold = threshold
+        self.columns = columns
+        self.heap = []
+        self.count = 0
+
+    def writerow(self, row):
+        """Filters the row, whose last columns are its scores
+
+        """
+        scores = [score for score in row[-self.columns:] if
+                  score != NO_ANOMALY_SCORE]
+        if not scores:
+            return
+        score = max(scores)
+        if self.threshold is not None and score < self.threshold:
+            return
+        if not self.top:
+            self.output.writerow(row)
+            return
+        self.count += 1
+        # ties are solved in favour of the first rows
+        item = (score, -self.count, row)
+        if len(self.heap) < self.top:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def close(self):
+        """Writes the top rows
+
+        """
+        for _, _, row in sorted(self.heap, reverse=True):
+            self.output.writerow(row)
+        self.heap = []
+
+
+def failed_values(args):
+    """Values written for a detector that fails to score a row
+
+    """
+    return [NO_ANOMALY_SCORE] * (2 if args.anomaly_flag else 1)
+
+
+def flag_values(flag, bound):
+    """Values written for a detector with --anomaly-flag: whether the score
+       reaches the threshold and the score bound that proves it
+
+    """
+    return [str(bool(flag)).lower(), bound]
+
+
+def chunk_values(scorer, rows, columns, args):
+    """Anomaly scores (or flags and score bounds) of a group of test rows
+       for one anomaly detector
+
+    """
+    parsed = []
+    for row, input_columns in zip(rows, columns):
         try:
-            anomaly_score_info = {'score': local_anomaly.anomaly_score(
-                input_data_dict, by_name=test_set_header)}
+            parsed.append(scorer.parse(dict(
+                [(field_id, row[column]) for field_id, column in
+                 input_columns])))
         except Exception:
-            anomaly_score_info = {'score': NO_ANOMALY_SCORE}
-        write_anomaly_score(anomaly_score_info['score'], output,
-                            args.prediction_info, input_data, exclude)
+            parsed.append(None)
+    parsed_rows = [input_data for input_data in parsed
+                   if input_data is not None]
+    if args.anomaly_flag:
+        results = iter([flag_values(flag, bound) for flag, bound in
+                        scorer.threshold_flags(parsed_rows,
+                                               args.anomaly_threshold)])
+    else:
+        results = iter([[score] for score in scorer.scores(parsed_rows)])
+    return [failed_values(args) if input_data is None else results.next()
+            for input_data in parsed]
+
+
+def write_anomaly_scores(local_anomalies, scorers, rows, test_reader,
+                         output, args, exclude=None):
+    """Scores a group of test rows with every anomaly detector and writes
+       their anomaly scores
+
+    """
+    values = [chunk_values(scorer, rows,
+                           [test_reader.input_columns(row, local_anomaly) for
+                            row in rows], args)
+              for local_anomaly, scorer in zip(local_anomalies, scorers)]
+    for index, row in enumerate(rows):
+        write_anomaly_values(
+            [value for detector_values in values for
+             value in detector_values[index]],
+            output, args.prediction_info, row, exclude)
+
+
+def local_values(local_anomaly, input_data, args, by_name=True,
+                 bounds=None):
+    """Anomaly score (or flag and score bound) of an input data dict for
+       one anomaly detector, when NumPy is not available. `bounds` holds the
+       heights of the trees and the cutoff used with --anomaly-flag.
+
+    """
+    try:
+        if args.anomaly_flag:
+            heights, cutoff = bounds
+            flag, depth_sum = threshold_flag(
+                local_anomaly, input_data, cutoff, heights, by_name=by_name)
+            return flag_values(flag, mean_depth_score(
+                depth_sum, len(heights), local_anomaly.expected_mean_depth))
+        return [local_anomaly.anomaly_score(input_data, by_name=by_name)]
+    except Exception:
+        return failed_values(args)
+
+
+def score_rows(local_anomalies, scorers, rows, test_reader, output, args,
+               exclude=None):
+    """Scores the test rows with every anomaly detector in a single pass and
+       writes their anomaly scores. When NumPy is available, the rows are
+       scored in chunks of CHUNK_SIZE rows by the array-backed `scorers`.
+       The --anomaly-top and --anomaly-threshold options filter the written
+       rows, unless --anomaly-flag is used to write whether each row reaches
+       the threshold.
+
+    """
+    score_filter = None
+    if not args.anomaly_flag and (args.anomaly_top or
+                                  args.anomaly_threshold is not None):
+        output = score_filter = ScoreFilter(output, top=args.anomaly_top,
+                                            threshold=args.anomaly_threshold,
+                                            columns=len(local_anomalies))
+    if scorers is None:
+        test_set_header = test_reader.has_headers()
+        bounds = [None] * len(local_anomalies)
+        if args.anomaly_flag:
+            bounds = []
+            for local_anomaly in local_anomalies:
+                heights = [tree_height(tree) for tree in
+                           local_anomaly.iforest]
+                bounds.append((heights, depth_sum_cutoff(
+                    args.anomaly_threshold, heights,
+                    local_anomaly.expected_mean_depth)))
+        for input_data in rows:
+            input_data_dict = test_reader.dict(input_data, filtering=False)
+            values = []
+            for local_anomaly, detector_bounds in zip(local_anomalies,
+                                                      bounds):
+                values.extend(local_values(
+                    local_anomaly, dict(input_data_dict), args,
+                    by_name=test_set_header, bounds=detector_bounds))
+            write_anomaly_values(values, output, args.prediction_info,
+                                 input_data, exclude)
+    else:
+        chunk = []
+        for input_data in rows:
+            chunk.append(input_data)
+            if len(chunk) == CHUNK_SIZE:
+                write_anomaly_scores(local_anomalies, scorers, chunk,
+                                     test_reader, output, args,
+                                     exclude=exclude)
+                chunk = []
+        write_anomaly_scores(local_anomalies, scorers, chunk, test_reader,
+                             output, args, exclude=exclude)
+    if score_filter is not None:
+        score_filter.close()
+
+
+def count_quotes(test_file, end):
+    """Number of quote characters from the current position of the file
+       to the `end` byte
+
+    """
+    quotes = 0
+    while test_file.tell() < end:
+        block = test_file.read(min(QUOTES_BLOCK, end - test_file.tell()))
+        if not block:
+            break
+        quotes += block.count('"')
+    return quotes
+
+
+def file_ranges(test_set, test_set_header, jobs):
+    """Splits the rows of the test file in `jobs` ranges of bytes that
+       end at the end of a row. The quotes before each split are counted,
+       so quoted values that contain new lines are not split.
+
+    """
+    size = os.path.getsize(test_set)
+    with open(test_set, "rb") as test_file:
+        if test_set_header:
+            test_file.readline()
+        bounds = [test_file.tell()]
+        quotes = 0
+        for job in range(1, jobs):
+            quotes += count_quotes(test_file, max(
+                bounds[0] + (size - bounds[0]) * job / jobs, bounds[-1]))
+            line = test_file.readline()
+            quotes += line.count('"')
+            # an odd number of quotes means the line ends inside a value
+            while quotes % 2 and line:
+                line = test_file.readline()
+                quotes += line.count('"')
+            bounds.append(test_file.tell())
+    bounds.append(size)
+    return zip(bounds[0: -1], bounds[1:])
+
+
+def range_rows(test_set, start, end, test_separator):
+    """Rows of the test file in the given range of bytes
+
+    """
+    with open(test_set, "rb") as test_file:
+        test_file.seek(start)
+
+        def lines():
+            """Lines in the range
+
+            """
+            while test_file.tell() < end:
+                line = test_file.readline()
+                if not line:
+                    break
+                yield line
+
+        for row in csv.reader(lines(), delimiter=test_separator):
+            yield row
+
+
+def merge_top_rows(parts, output, top, columns=1):
+    """Writes the `top` rows with the highest scores in the part files,
+       each of them sorted by descending score. The score of a row is the
+       highest in its last `columns` columns.
+
+    """
+    rows = []
+    for index, part in enumerate(parts):
+        with open(part, "rb") as part_file:
+            rows.extend([(max([float(score) for score in row[-columns:] if
+                               score != NO_ANOMALY_SCORE]),
+                          -index, -position, row) for
+                         position, row in enumerate(csv.reader(part_file))])
+    output = csv.writer(output, lineterminator="\n")
+    for _, _, _, row in heapq.nlargest(top, rows):
+        output.writerow(row)
+
+
+def parallel_anomaly_score(local_anomalies, scorers, test_reader, args,
+                           exclude=None):
+    """Scores the test file in `args.jobs` forked processes. Each of them
+       scores a range of rows, sharing the local anomaly detectors loaded
+       by the parent, and the scores are appended to the output file in
+       the order of the rows.
+
+    """
+    test_set = test_reader.test_set
+    ranges = file_ranges(test_set, test_reader.has_headers(), args.jobs)
+    parts = ["%s.part%s" % (args.predictions, index) for
+             index in range(len(ranges))]
+    sys.stdout.flush()
+    pids = []
+    for part, (start, end) in zip(parts, ranges):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                with open(part, "w") as part_file:
+                    score_rows(local_anomalies, scorers,
+                               range_rows(test_set, start, end,
+                                          test_reader.test_separator),
+                               test_reader,
+                               csv.writer(part_file, lineterminator="\n"),
+                               args, exclude=exclude)
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            os._exit(status)
+        pids.append(pid)
+    failed = [index for index, pid in enumerate(pids) if
+              os.waitpid(pid, 0)[1] != 0]
+    if not failed:
+        with open(args.predictions, "ab") as output:
+            if args.anomaly_top:
+                merge_top_rows(parts, output, args.anomaly_top,
+                               columns=len(local_anomalies))
+            else:
+                for part in parts:
+                    with open(part, "rb") as part_file:
+                        shutil.copyfileobj(part_file, output)
+    for part in parts:
+        if os.path.exists(part):
+            os.remove(part)
+    if failed:
+        sys.exit("Failed to compute the anomaly scores in job %s." %
+                 ", ".join([str(index) for index in failed]))
+
+
+def local_anomaly_score(anomalies, test_reader, output, args,
+                        exclude=None):
+    """Get local anomaly detectors and issue anomaly score predictions. The
+       test rows are read once and scored by all the anomaly detectors.
+       With --jobs, the test file is split in ranges of rows scored in
+       parallel processes.
+
+    """
+    local_anomalies = [Anomaly(anomaly) for anomaly in anomalies]
+    if not all([test_reader.matches_columns(local_anomaly) for
+                local_anomaly in local_anomalies]):
+        sys.exit("The fields of the anomaly detectors are in different"
+                 " columns, so the test file needs headers to match"
+                 " them.")
+    scorers = None if numpy is None else [
+        AnomalyScorer(local_anomaly) for local_anomaly in local_anomalies]
+    if args.jobs > 1 and hasattr(os, "fork") and \
+            isinstance(test_reader.test_set, basestring):
+        parallel_anomaly_score(local_anomalies, scorers, test_reader, args,
+                               exclude=exclude)
+    else:
+        score_rows(local_anomalies, scorers, test_reader, test_reader,
+                   output, args, exclude=exclude)
 
 
 def anomaly_score(anomalies, fields, args, session_file=None):
     """Computes an anomaly score for each entry in the `test_set`.
 
     """
+    if args.anomaly_top is not None and args.anomaly_top < 1:
+        sys.exit("--anomaly-top needs a positive number of rows.")
+    if args.anomaly_flag and args.anomaly_threshold is None:
+        sys.exit("--anomaly-flag needs an --anomaly-threshold to compare"
+                 " the anomaly scores with.")
+    if args.anomaly_flag and args.anomaly_top:
+        sys.exit("--anomaly-flag and --anomaly-top cannot be used together.")
     test_set = args.test_set
     test_set_header = args.test_header
     output = args.predictions
@@ -148,9 +506,15 @@ def anomaly_score(anomalies, fields, args, session_file=None):
                              None,
                              test_separator=args.test_separator)
     output = csv.writer(open(output, 'w', 0), lineterminator="\n")
+    if (args.anomaly_top or args.anomaly_threshold is not None) and \
+            not args.anomaly_flag and args.prediction_info == NORMAL_FORMAT:
+        # the filtered anomalous rows are written with their scores
+        args.prediction_info = FULL_FORMAT
     # columns to exclude if input_data is added to the prediction field
     exclude = use_prediction_headers(
-        args.prediction_header, output, test_reader, fields, args)
+        args.prediction_header, output, test_reader, fields, args,
+        anomaly_ids=[bigml.api.get_anomaly_id(anomaly) for
+                     anomaly in anomalies])
 
     # Local anomaly scores: Anomaly scores are computed locally using
     # the local anomaly detector method
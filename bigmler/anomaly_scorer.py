@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Batch anomaly scoring for BigMLer
+
+   The trees of a local anomaly detector are flattened into arrays: the
+   children of each node, the predicates of each node and, for numeric
+   predicates, their field, operator and value. The depths reached by a
+   group of rows in each tree are found with NumPy, following all the rows
+   down the tree level by level. The scores are the same as the ones
+   computed by `Anomaly.anomaly_score`. When only the comparison of the
+   scores with a threshold is needed, the trees are used one at a time and
+   each row stops as soon as the bounds of its sum of depths decide it.
+
+"""
+from __future__ import absolute_import
+
+import math
+import locale
+
+from bigml.util import strip_affixes, cast
+from bigml.predicate import Predicate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# number of rows scored at once
+CHUNK_SIZE = 1000
+# operators of the predicates evaluated with NumPy
+NUMERIC_OPERATORS = ["<", "<=", "=", "!=", "/=", ">=", ">"]
+CATEGORICAL_OPERATORS = ["=", "!=", "/=", "in"]
+# codes of the missing and unknown categorical values
+MISSING_CODE = -1
+UNKNOWN_CODE = -2
+
+
+def predicate_kind(predicate, fields):
+    """Predicates comparing numeric fields with numbers (or checking
+       whether they are missing) and categorical fields with categories
+       are evaluated with NumPy. The rest are evaluated when a row reaches
+       their node.
+
+    """
+    optype = fields[predicate.field]['optype']
+    value = predicate.value
+    if predicate.term is not None:
+        return "lazy"
+    if optype == 'numeric':
+        if predicate.operator in NUMERIC_OPERATORS and \
+                isinstance(value, (int, long, float)) and \
+                not isinstance(value, bool):
+            return "numeric"
+        if predicate.operator in ["=", "!=", "/="] and value is None:
+            return "numeric"
+    if optype == 'categorical' and \
+            predicate.operator in CATEGORICAL_OPERATORS:
+        values = value if predicate.operator == "in" else [value]
+        if isinstance(values, list) and \
+                all(isinstance(item, basestring) for item in values):
+            return "categorical"
+    return "lazy"
+
+
+def compare(operator, values, limits):
+    """Applies the operator to the arrays of values and limits. Comparing
+       a value with None is only true for inequality.
+
+    """
+    if operator == "<":
+        return values < limits
+    if operator == "<=":
+        return values <= limits
+    if operator == "=":
+        return values == limits
+    if operator in ["!=", "/="]:
+        return values != limits
+    if operator == ">=":
+        return values >= limits
+    return values > limits
+
+
+def missing_result(predicate):
+    """Result of the predicate when the field is missing
+
+    """
+    return predicate.missing or (predicate.operator == '=' and
+                                 predicate.value is None)
+
+
+def tree_height(tree):
+    """Maximum depth that can be reached in an `AnomalyTree`
+
+    """
+    return 1 + max([tree_height(child) for child in tree.children] + [0])
+
+
+def mean_depth_score(depth_sum, trees, expected_mean_depth):
+    """Anomaly score for the sum of depths in all the trees, as computed in
+       `Anomaly.anomaly_score`
+
+    """
+    observed_mean_depth = float(depth_sum) / trees
+    return math.pow(2, - observed_mean_depth / expected_mean_depth)
+
+
+def depth_sum_cutoff(threshold, heights, expected_mean_depth):
+    """Largest sum of depths whose score reaches the threshold, or -1 if
+       none does. Scores decrease as the sum of depths grows, so a row's
+       score reaches the threshold only if its sum is not over the cutoff.
+
+    """
+    low, high = -1, sum(heights)
+    while low < high:
+        middle = (low + high + 1) / 2
+        if mean_depth_score(middle, len(heights),
+                            expected_mean_depth) >= threshold:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def threshold_flag(local_anomaly, input_data, cutoff, heights,
+                   by_name=True):
+    """Checks whether the score of the input data reaches the threshold
+       whose `cutoff` is given, using the trees of the local anomaly
+       detector one at a time. Each tree adds from 0 to its height to the
+       sum of depths, so the trees are no longer used when the sum is over
+       the cutoff or the remaining trees cannot take it over the cutoff.
+       Returns the flag and the sum of depths bound that decided it.
+
+    """
+    input_data = local_anomaly.filter_input_data(input_data, by_name=by_name)
+    cast(input_data, local_anomaly.fields)
+    depth_sum, remaining = 0, sum(heights)
+    for tree, height in zip(local_anomaly.iforest, heights):
+        depth_sum += tree.depth(input_data)[0]
+        remaining -= height
+        if depth_sum > cutoff:
+            return False, depth_sum
+        if depth_sum + remaining <= cutoff:
+            return True, depth_sum + remaining
+
+
+class FlatTree(object):
+    """Arrays that describe an anomaly tree
+
+    """
+
+    def __init__(self, tree, fields, numeric_columns, categorical_codes):
+        nodes = []
+        pending = [tree]
+        # nodes are numbered in breadth-first order
+        while pending:
+            node = pending.pop(0)
+            nodes.append(node)
+            pending.extend(node.children)
+        numbers = dict([(id(node), index) for index, node in
+                        enumerate(nodes)])
+        width = max([len(node.children) for node in nodes] + [1])
+        self.children = numpy.full((len(nodes), width), -1, dtype=int)
+        self.lazy_predicates = {}
+        numeric, categorical, starts, positions = [], [], [], 0
+        for index, node in enumerate(nodes):
+            for position, child in enumerate(node.children):
+                self.children[index, position] = numbers[id(child)]
+            starts.append(positions)
+            for predicate in node.predicates.predicates:
+                if not isinstance(predicate, Predicate):
+                    continue
+                kind = predicate_kind(predicate, fields)
+                if kind == "numeric":
+                    numeric.append((positions, predicate))
+                elif kind == "categorical":
+                    categorical.append((positions, predicate))
+                else:
+                    self.lazy_predicates.setdefault(index, []).append(
+                        predicate)
+                    continue
+                positions += 1
+            if starts[-1] == positions:
+                # nodes with no vectorized predicates are true until their
+                # lazy predicates are evaluated
+                positions += 1
+        self.size = positions
+        self.starts = numpy.array(starts)
+        self.lazy = numpy.zeros(len(nodes), dtype=bool)
+        self.lazy[self.lazy_predicates.keys()] = True
+        self.numeric = numpy.array([position for position, _ in numeric],
+                                   dtype=int)
+        self.columns = numpy.array([numeric_columns[predicate.field] for
+                                    _, predicate in numeric], dtype=int)
+        self.limits = numpy.array([numpy.nan if predicate.value is None else
+                                   predicate.value for
+                                   _, predicate in numeric], dtype=float)
+        self.numeric_missing = numpy.array([missing_result(predicate) for
+                                            _, predicate in numeric],
+                                           dtype=bool)
+        self.operators = {}
+        for position, (_, predicate) in enumerate(numeric):
+            operator = predicate.operator
+            if predicate.value is None:
+                operator = "%sNone" % operator
+            self.operators.setdefault(operator, []).append(position)
+        self.categorical = numpy.array([position for position, _ in
+                                        categorical], dtype=int)
+        self.categorical_columns = numpy.array(
+            [categorical_codes[predicate.field][0] for
+             _, predicate in categorical], dtype=int)
+        self.categorical_missing = numpy.array(
+            [missing_result(predicate) for _, predicate in categorical],
+            dtype=bool)
+        self.categories = []
+        for _, predicate in categorical:
+            codes = categorical_codes[predicate.field][1]
+            values = predicate.value if predicate.operator == "in" else \
+                [predicate.value]
+            self.categories.append((predicate.operator,
+                                    [codes[value] for value in values]))
+        self.height = self.get_height(0)
+
+    def get_height(self, node):
+        """Maximum depth that can be reached from the node
+
+        """
+        children = [child for child in self.children[node] if child >= 0]
+        return 1 + max([self.get_height(child) for child in children] + [0])
+
+    def evaluate(self, matrix, codes):
+        """Result of the vectorized predicates for the rows. `matrix`
+           contains the numeric values of the rows (NaN for missing values)
+           and `codes` the codes of their categorical values.
+
+        """
+        results = numpy.ones((matrix.shape[0], self.size), dtype=bool)
+        if len(self.numeric):
+            values = matrix[:, self.columns]
+            numeric = numpy.zeros(values.shape, dtype=bool)
+            with numpy.errstate(invalid="ignore"):
+                for operator, positions in self.operators.items():
+                    if operator.endswith("None"):
+                        numeric[:, positions] = operator != "=None"
+                    else:
+                        numeric[:, positions] = compare(
+                            operator, values[:, positions],
+                            self.limits[positions])
+            results[:, self.numeric] = numpy.where(
+                numpy.isnan(values), self.numeric_missing[None, :], numeric)
+        if len(self.categorical):
+            values = codes[:, self.categorical_columns]
+            categorical = numpy.zeros(values.shape, dtype=bool)
+            for position, (operator, categories) in \
+                    enumerate(self.categories):
+                if operator == "in":
+                    categorical[:, position] = numpy.in1d(values[:, position],
+                                                          categories)
+                else:
+                    categorical[:, position] = compare(
+                        operator, values[:, position], categories[0])
+            results[:, self.categorical] = numpy.where(
+                values == MISSING_CODE, self.categorical_missing[None, :],
+                categorical)
+        return results
+
+    def depths(self, matrix, codes, rows, fields):
+        """Depth reached by each row in the tree
+
+        """
+        results = self.evaluate(matrix, codes)
+        valid = numpy.logical_and.reduceat(results, self.starts, axis=1)
+        if self.lazy[0]:
+            valid[:, 0] &= [all(predicate.apply(input_data, fields) for
+                                predicate in self.lazy_predicates[0])
+                            for input_data in rows]
+        current = numpy.zeros(len(rows), dtype=int)
+        depths = valid[:, 0].astype(int)
+        active = numpy.nonzero(valid[:, 0])[0]
+        while len(active):
+            children = self.children[current[active]]
+            nodes = numpy.maximum(children, 0)
+            matches = (children >= 0) & valid[active[:, None], nodes]
+            for row, column in zip(*numpy.nonzero(matches &
+                                                  self.lazy[nodes])):
+                input_data = rows[active[row]]
+                matches[row, column] = all(
+                    predicate.apply(input_data, fields) for predicate in
+                    self.lazy_predicates[children[row, column]])
+            found = matches.any(axis=1)
+            active = active[found]
+            # the first child whose predicates are true is followed
+            current[active] = children[found, matches[found].argmax(axis=1)]
+            depths[active] += 1
+        return depths
+
+
+class AnomalyScorer(object):
+    """Computes the anomaly scores of a local anomaly detector for groups
+       of rows
+
+    """
+
+    def __init__(self, local_anomaly):
+        if local_anomaly.iforest is None:
+            raise Exception("We could not find the iforest information to "
+                            "compute the anomaly score. Please, rebuild your "
+                            "Anomaly object from a complete anomaly detector "
+                            "resource.")
+        self.anomaly = local_anomaly
+        self.fields = local_anomaly.fields
+        self.numeric_ids = sorted([field_id for field_id, field in
+                                   self.fields.items() if
+                                   field['optype'] == 'numeric'])
+        numeric_columns = dict([(field_id, column) for column, field_id in
+                                enumerate(self.numeric_ids)])
+        # codes of the categories used in the predicates of each field
+        self.categories = {}
+        pending = local_anomaly.iforest[:]
+        while pending:
+            node = pending.pop()
+            pending.extend(node.children)
+            for predicate in node.predicates.predicates:
+                if isinstance(predicate, Predicate) and predicate_kind(
+                        predicate, self.fields) == "categorical":
+                    values = predicate.value if predicate.operator == "in" \
+                        else [predicate.value]
+                    codes = self.categories.setdefault(predicate.field, {})
+                    for value in values:
+                        codes.setdefault(value, len(codes))
+        self.categorical_ids = sorted(self.categories.keys())
+        categorical_codes = dict([
+            (field_id, (column, self.categories[field_id])) for
+            column, field_id in enumerate(self.categorical_ids)])
+        self.trees = [FlatTree(tree, self.fields, numeric_columns,
+                               categorical_codes) for
+                      tree in local_anomaly.iforest]
+        self.expected_mean_depth = local_anomaly.expected_mean_depth
+
+    def parse(self, input_data):
+        """Cleans and casts the values of an input data dict keyed by field
+           id, as `Anomaly.anomaly_score` does
+
+        """
+        values = {}
+        for field_id, value in input_data.items():
+            value = self.anomaly.normalize(value)
+            if value is None or field_id not in self.fields:
+                continue
+            if self.fields[field_id]['optype'] == 'numeric':
+                value = locale.atof(strip_affixes(value,
+                                                  self.fields[field_id]))
+            values[field_id] = value
+        return values
+
+    def matrix(self, rows):
+        """Numeric values of the parsed rows, with NaN for missing values
+
+        """
+        return numpy.array([[input_data.get(field_id, numpy.nan) for
+                             field_id in self.numeric_ids] for
+                            input_data in rows], dtype=float).reshape(
+                                (len(rows), len(self.numeric_ids)))
+
+    def codes(self, rows):
+        """Codes of the categorical values of the parsed rows
+
+        """
+        return numpy.array([[
+            MISSING_CODE if field_id not in input_data else
+            self.categories[field_id].get(input_data[field_id],
+                                          UNKNOWN_CODE)
+            for field_id in self.categorical_ids] for input_data in rows],
+                           dtype=int).reshape(
+                               (len(rows), len(self.categorical_ids)))
+
+    def depth_sums(self, rows):
+        """Sum of the depths reached by each parsed row in all the trees
+
+        """
+        matrix, codes = self.matrix(rows), self.codes(rows)
+        depth_sums = numpy.zeros(len(rows), dtype=int)
+        for tree in self.trees:
+            depth_sums += tree.depths(matrix, codes, rows, self.fields)
+        return depth_sums
+
+    def score(self, depth_sum):
+        """Anomaly score for the sum of depths in all the trees
+
+        """
+        return mean_depth_score(depth_sum, len(self.trees),
+                                self.expected_mean_depth)
+
+    def scores(self, rows):
+        """Anomaly scores of the parsed rows
+
+        """
+        if not rows:
+            return []
+        return [self.score(depth_sum) for depth_sum in self.depth_sums(rows)]
+
+    def threshold_flags(self, rows, threshold):
+        """Checks whether the scores of the parsed rows reach the threshold.
+           The trees are used one at a time and only for the rows that
+           are still undecided (see `threshold_flag`). Returns the flag of
+           each row and the score bound that decided it: a lower bound of
+           the score for the rows that reach the threshold and an upper
+           bound for the rest.
+
+        """
+        if not rows:
+            return []
+        heights = [tree.height for tree in self.trees]
+        cutoff = depth_sum_cutoff(threshold, heights,
+                                  self.expected_mean_depth)
+        remaining = sum(heights)
+        depth_sums = numpy.zeros(len(rows), dtype=int)
+        flags = numpy.zeros(len(rows), dtype=bool)
+        bounds = numpy.zeros(len(rows), dtype=int)
+        active = numpy.arange(len(rows))
+        matrix, codes, active_rows = self.matrix(rows), self.codes(rows), rows
+        for tree in self.trees:
+            depth_sums[active] += tree.depths(matrix, codes, active_rows,
+                                              self.fields)
+            remaining -= tree.height
+            below = depth_sums[active] > cutoff
+            above = depth_sums[active] + remaining <= cutoff
+            bounds[active[below]] = depth_sums[active[below]]
+            flags[active[above]] = True
+            bounds[active[above]] = depth_sums[active[above]] + remaining
+            undecided = ~(below | above)
+            if not undecided.all():
+                active = active[undecided]
+                if not len(active):
+                    break
+                matrix, codes = matrix[undecided], codes[undecided]
+                active_rows = [rows[index] for index in active]
+        return [(flag, self.score(bound)) for flag, bound in
+                zip(flags, bounds)]
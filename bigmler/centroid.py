@@ -32,13 +32,19 @@ from bigml.cluster import Cluster
 from bigmler.test_reader import TestReader
 from bigmler.resources import NORMAL_FORMAT, FULL_FORMAT
 from bigmler.resources import create_batch_centroid
+from bigmler.centroid_scorer import CentroidScorer, CHUNK_SIZE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # symbol used in failing centroid predictions
 NO_CENTROID = "-"
 
 
 def use_prediction_headers(prediction_headers, output, test_reader,
-                           fields, args):
+                           fields, args, cluster_ids=None):
     """Uses header information from the test file in the prediction output
 
        If --prediction-header is set, adds a headers row to the centroid
@@ -46,10 +52,17 @@ def use_prediction_headers(prediction_headers, output, test_reader,
        If --prediction-fields is used, retrieves the fields to exclude
        from the test input in the --prediction-info full format, that includes
        them all by default.
+       When several clusters are used, their columns are labeled with the
+       `cluster_ids`.
 
     """
     exclude = []
     headers = ["centroid name"]
+    if args.centroid_distance:
+        headers.append("distance")
+    if cluster_ids and len(cluster_ids) > 1:
+        headers = ["%s %s" % (header, cluster_id) for
+                   cluster_id in cluster_ids for header in headers]
 
     if (args.prediction_info == FULL_FORMAT or
             args.prediction_fields is not None):
@@ -82,13 +95,14 @@ def use_prediction_headers(prediction_headers, output, test_reader,
 
 def write_centroid(centroid_resource, output=sys.stdout,
                    prediction_info=NORMAL_FORMAT, input_data=None,
-                   exclude=None):
+                   exclude=None, distance=None):
     """Writes the final centroid prediction to the required output
 
        The format of the output depends on the `prediction_info` value.
        There's a brief format, that writes only the predicted value,
        and a full data format that writes first the input data
-       used to predict followed by the centroid prediction.
+       used to predict followed by the centroid prediction. The distance
+       to the centroid is added when given.
 
     """
 
@@ -102,6 +116,8 @@ def write_centroid(centroid_resource, output=sys.stdout,
             for index in exclude:
                 del row[index]
     row.append(centroid_resource)
+    if distance is not None:
+        row.append(distance)
     try:
         output.writerow(row)
     except AttributeError:
@@ -118,23 +134,110 @@ def centroid_to_row(centroid_resource):
     return [centroid_resource['object']['centroid_name']]
 
 
+def write_centroid_values(values, output, prediction_info=NORMAL_FORMAT,
+                          input_data=None, exclude=None):
+    """Writes the centroids (and distances) found in every cluster to the
+       required output, with the same formats used in `write_centroid`
+
+    """
+    row = []
+    if prediction_info != NORMAL_FORMAT:
+        if input_data is None:
+            input_data = []
+        row = input_data
+        if exclude:
+            for index in exclude:
+                del row[index]
+    row.extend(values)
+    output.writerow(row)
+
+
+def centroid_values(name, distance, args):
+    """Values written for the centroid found in a cluster
+
+    """
+    if not args.centroid_distance:
+        return [name]
+    return [name, "" if distance is None else distance]
+
+
+def chunk_values(scorer, rows, columns, args):
+    """Centroids (and distances) of a group of test rows in one cluster
+
+    """
+    parsed = []
+    for row, input_columns in zip(rows, columns):
+        try:
+            parsed.append(scorer.parse(dict(
+                [(field_id, row[column]) for field_id, column in
+                 input_columns])))
+        except Exception:
+            parsed.append(None)
+    centroids = iter(scorer.centroids([input_data for input_data in parsed
+                                       if input_data is not None]))
+    return [centroid_values(NO_CENTROID, None, args) if input_data is None
+            else centroid_values(*(centroids.next() + (args,)))
+            for input_data in parsed]
+
+
+def write_centroids(local_clusters, scorers, rows, test_reader, output,
+                    args, exclude=None):
+    """Scores a group of test rows with every cluster and writes their
+       centroids
+
+    """
+    values = [chunk_values(scorer, rows,
+                           [test_reader.input_columns(row, local_cluster) for
+                            row in rows], args)
+              for local_cluster, scorer in zip(local_clusters, scorers)]
+    for index, row in enumerate(rows):
+        write_centroid_values(
+            [value for cluster_values in values for
+             value in cluster_values[index]],
+            output, args.prediction_info, row, exclude)
+
+
 def local_centroid(clusters, test_reader, output, args,
                    exclude=None):
-    """Get local cluster and issue centroid prediction
+    """Get local clusters and issue centroid predictions. The test rows are
+       read once and scored by all the clusters. When NumPy is available,
+       the test rows are scored in chunks of CHUNK_SIZE rows.
 
     """
-    # Only one cluster at present
-    local_cluster = Cluster(clusters[0])
+    local_clusters = [Cluster(cluster) for cluster in clusters]
+    if not all([test_reader.matches_columns(local_cluster) for
+                local_cluster in local_clusters]):
+        sys.exit("The fields of the clusters are in different columns, so"
+                 " the test file needs headers to match them.")
     test_set_header = test_reader.has_headers()
+    if numpy is None:
+        for input_data in test_reader:
+            input_data_dict = test_reader.dict(input_data, filtering=False)
+            values = []
+            for local_cluster in local_clusters:
+                try:
+                    centroid_info = local_cluster.centroid(
+                        dict(input_data_dict), by_name=test_set_header)
+                except Exception:
+                    centroid_info = {'centroid_name': NO_CENTROID,
+                                     'distance': None}
+                values.extend(centroid_values(centroid_info['centroid_name'],
+                                              centroid_info['distance'],
+                                              args))
+            write_centroid_values(values, output, args.prediction_info,
+                                  input_data, exclude)
+        return
+    scorers = [CentroidScorer(local_cluster) for
+               local_cluster in local_clusters]
+    rows = []
     for input_data in test_reader:
-        input_data_dict = test_reader.dict(input_data, filtering=False)
-        try:
-            centroid_info = local_cluster.centroid(
-                input_data_dict, by_name=test_set_header)
-        except Exception:
-            centroid_info = {'centroid_name': NO_CENTROID}
-        write_centroid(centroid_info['centroid_name'], output,
-                       args.prediction_info, input_data, exclude)
+        rows.append(input_data)
+        if len(rows) == CHUNK_SIZE:
+            write_centroids(local_clusters, scorers, rows, test_reader,
+                            output, args, exclude=exclude)
+            rows = []
+    write_centroids(local_clusters, scorers, rows, test_reader, output, args,
+                    exclude=exclude)
 
 
 def centroid(clusters, fields, args, session_file=None):
@@ -150,7 +253,9 @@ def centroid(clusters, fields, args, session_file=None):
     output = csv.writer(open(output, 'w', 0), lineterminator="\n")
     # columns to exclude if input_data is added to the prediction field
     exclude = use_prediction_headers(
-        args.prediction_header, output, test_reader, fields, args)
+        args.prediction_header, output, test_reader, fields, args,
+        cluster_ids=[bigml.api.get_cluster_id(cluster) for
+                     cluster in clusters])
 
     # Local centroids: Centroids are computed locally using clusters'
     # centroids distances
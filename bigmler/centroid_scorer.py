@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Batch centroid scoring for BigMLer
+
+   The centroids of a local cluster are stored once as arrays (scaled
+   numeric values, categorical codes and text term counts) and the nearest
+   centroid of a group of rows is found with NumPy. The distances are added
+   field by field in the same order used in `Centroid.distance2`, so the
+   results are the same as `Cluster.centroid`. Clusters with many centroids
+   are indexed by their numeric values to avoid computing the distances to
+   all of them.
+
+"""
+from __future__ import absolute_import
+
+import math
+import locale
+
+from bigml.util import strip_affixes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# number of rows scored at once
+CHUNK_SIZE = 1000
+# clusters with more centroids use an index over their numeric values
+INDEX_MIN_CENTROIDS = 128
+# maximum number of centroids in each leaf of the index
+LEAF_SIZE = 16
+# relative tolerance used when pruning leaves, as the bounds are computed
+# in a different order than the distances
+PRUNING_TOLERANCE = 1e-9
+
+
+def build_leaves(points, indices, leaves):
+    """Splits the centroids by the median of the dimension with the
+       largest spread until they fit in leaves of LEAF_SIZE centroids,
+       as in a KD-tree
+
+    """
+    if len(indices) <= LEAF_SIZE:
+        leaves.append(indices)
+        return leaves
+    values = points[indices]
+    dimension = (values.max(axis=0) - values.min(axis=0)).argmax()
+    order = indices[values[:, dimension].argsort(kind="mergesort")]
+    half = len(order) / 2
+    build_leaves(points, order[0: half], leaves)
+    build_leaves(points, order[half:], leaves)
+    return leaves
+
+
+def power2(values):
+    """Squares the values using `pow`, as Python's ** operator does, so that
+       the results don't differ in the last digit from `x * x`
+
+    """
+    return numpy.power(values, 2.0)
+
+
+class CentroidScorer(object):
+    """Finds the nearest centroid of a local cluster to groups of rows
+
+    """
+
+    def __init__(self, local_cluster):
+        self.cluster = local_cluster
+        self.names = [centroid.name for centroid in local_cluster.centroids]
+        self.numeric_ids = [field_id for field_id, field in
+                            local_cluster.fields.items()
+                            if field['optype'] == 'numeric']
+        self.field_ids = local_cluster.centroids[0].center.keys()
+        self.kinds = {}
+        self.centers = {}
+        self.vocabularies = {}
+        for field_id in self.field_ids:
+            values = [centroid.center[field_id] for centroid in
+                      local_cluster.centroids]
+            if isinstance(values[0], list):
+                # term counts of each centroid and number of terms
+                vocabulary = {}
+                for terms in values:
+                    for term in terms:
+                        vocabulary.setdefault(term, len(vocabulary))
+                counts = numpy.zeros((len(values), len(vocabulary)))
+                for index, terms in enumerate(values):
+                    for term in terms:
+                        counts[index, vocabulary[term]] += 1
+                self.kinds[field_id] = "text"
+                self.vocabularies[field_id] = vocabulary
+                self.centers[field_id] = (counts, numpy.array(
+                    [len(terms) for terms in values], dtype=float))
+            elif isinstance(values[0], basestring):
+                # categories are coded, missing and unknown values are -1
+                vocabulary = {}
+                for value in values:
+                    vocabulary.setdefault(value, len(vocabulary))
+                self.kinds[field_id] = "categorical"
+                self.vocabularies[field_id] = vocabulary
+                self.centers[field_id] = numpy.array(
+                    [vocabulary[value] for value in values])
+            else:
+                self.kinds[field_id] = "numeric"
+                self.centers[field_id] = numpy.array(values, dtype=float)
+        # centroids are grouped by the order of the fields in their center,
+        # the order in which their distances are added
+        self.orders = {}
+        for index, centroid in enumerate(local_cluster.centroids):
+            self.orders.setdefault(tuple(centroid.center.keys()),
+                                   []).append(index)
+        self.orders = [(list(order), numpy.array(indices)) for
+                       order, indices in self.orders.items()]
+        self.scales = dict([(field_id, local_cluster.scales[field_id]) for
+                            field_id in self.field_ids])
+        self.leaves = None
+        if len(self.names) > INDEX_MIN_CENTROIDS and len(self.orders) == 1:
+            self.build_index()
+
+    def build_index(self):
+        """Groups the centroids in leaves according to their scaled numeric
+           values and stores the bounding box of each leaf. Categorical and
+           text fields are not indexed: their distances are bounded by their
+           minimum in each leaf.
+
+        """
+        self.indexed_ids = [field_id for field_id in self.field_ids if
+                            self.kinds[field_id] == "numeric"]
+        if not self.indexed_ids:
+            return
+        points = numpy.array([self.centers[field_id] *
+                              self.scales[field_id] for
+                              field_id in self.indexed_ids]).T
+        leaves = build_leaves(points, numpy.arange(len(self.names)), [])
+        self.leaves = numpy.full((len(leaves), LEAF_SIZE), -1, dtype=int)
+        for index, leaf in enumerate(leaves):
+            self.leaves[index, 0: len(leaf)] = leaf
+        self.leaf_order = numpy.concatenate(leaves)
+        self.leaf_starts = numpy.cumsum([0] + [len(leaf) for
+                                               leaf in leaves[:-1]])
+        self.lower = numpy.array([points[leaf].min(axis=0) for
+                                  leaf in leaves])
+        self.upper = numpy.array([points[leaf].max(axis=0) for
+                                  leaf in leaves])
+
+    def parse(self, input_data):
+        """Values of the cluster fields in an input data dict keyed by
+           field id. Raises an exception when a numeric field is missing,
+           as `Cluster.centroid` does.
+
+        """
+        cluster = self.cluster
+        values = {}
+        for key, value in input_data.items():
+            value = cluster.normalize(value)
+            if value is None or key not in cluster.fields:
+                continue
+            values[key] = value
+        for field_id in self.numeric_ids:
+            if field_id not in values:
+                raise Exception("Failed to predict a centroid. Input"
+                                " data must contain values for all "
+                                "numeric fields to find a centroid.")
+            values[field_id] = locale.atof(
+                strip_affixes(values[field_id],
+                              cluster.fields[field_id]))
+        row = {}
+        for field_id in self.field_ids:
+            kind = self.kinds[field_id]
+            if kind == "numeric":
+                row[field_id] = values[field_id]
+            elif kind == "categorical":
+                row[field_id] = self.vocabularies[field_id].get(
+                    values.get(field_id), -1)
+            else:
+                terms = (self.cluster.get_unique_terms(
+                    {field_id: values[field_id]}).get(field_id, [])
+                         if field_id in values else [])
+                row[field_id] = terms
+        return row
+
+    def field_distances(self, rows, field_id):
+        """Squared distances of the rows to every centroid in one field
+
+        """
+        kind = self.kinds[field_id]
+        scale = self.scales[field_id]
+        if kind == "numeric":
+            values = numpy.array([row[field_id] for row in rows])
+            return power2((values[:, None] -
+                           self.centers[field_id][None, :]) * scale)
+        if kind == "categorical":
+            codes = numpy.array([row[field_id] for row in rows])
+            return (codes[:, None] != self.centers[field_id][None, :]) * \
+                (1 * scale ** 2)
+        counts, lengths = self.centers[field_id]
+        vocabulary = self.vocabularies[field_id]
+        present = numpy.zeros((len(rows), len(vocabulary)))
+        terms_lengths = numpy.zeros(len(rows))
+        for index, row in enumerate(rows):
+            terms = row[field_id]
+            terms_lengths[index] = len(terms)
+            for term in terms:
+                if term in vocabulary:
+                    present[index, vocabulary[term]] = 1
+        input_counts = numpy.dot(present, counts.T)
+        both = terms_lengths[:, None] * lengths[None, :]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            distances = power2(scale * (1 - input_counts /
+                                        numpy.sqrt(both)))
+        empty_terms = (terms_lengths == 0)[:, None]
+        empty_center = (lengths == 0)[None, :]
+        distances = numpy.where(empty_terms | empty_center, scale ** 2,
+                                distances)
+        return numpy.where(empty_terms & empty_center, 0, distances)
+
+    def distances2(self, rows):
+        """Matrix of squared distances of the parsed rows to the centroids
+
+        """
+        per_field = dict([(field_id, self.field_distances(rows, field_id))
+                          for field_id in self.field_ids])
+        distances = numpy.zeros((len(rows), len(self.names)))
+        for order, indices in self.orders:
+            for field_id in order:
+                distances[:, indices] += per_field[field_id][:, indices]
+        return distances
+
+    def bounds(self, rows, per_field):
+        """Lower bound of the squared distance of each row to the centroids
+           in each leaf of the index
+
+        """
+        bounds = numpy.zeros((len(rows), len(self.leaves)))
+        for position, field_id in enumerate(self.indexed_ids):
+            values = numpy.array([row[field_id] for row in rows]) * \
+                self.scales[field_id]
+            gaps = numpy.maximum(
+                numpy.maximum(self.lower[None, :, position] -
+                              values[:, None], 0),
+                values[:, None] - self.upper[None, :, position])
+            bounds += gaps ** 2
+        others = [per_field[field_id] for field_id in self.field_ids if
+                  field_id in per_field]
+        if others:
+            others = sum(others)[:, self.leaf_order]
+            bounds += numpy.minimum.reduceat(others, self.leaf_starts, axis=1)
+        return bounds
+
+    def indexed_nearest(self, rows):
+        """Nearest centroid index and squared distance for each row. The
+           leaves are visited in the order of their bounds and the rest of
+           leaves are pruned when their bound exceeds the best distance. The
+           result is the same as the one found in `distances2`.
+
+        """
+        per_field = dict([(field_id, self.field_distances(rows, field_id))
+                          for field_id in self.field_ids if
+                          self.kinds[field_id] != "numeric"])
+        values = dict([(field_id, numpy.array([row[field_id] for
+                                               row in rows]))
+                       for field_id in self.indexed_ids])
+        bounds = self.bounds(rows, per_field)
+        visiting_order = bounds.argsort(axis=1)
+        best = numpy.full(len(rows), numpy.inf)
+        nearest = numpy.full(len(rows), len(self.names), dtype=int)
+        field_order = self.orders[0][0]
+        for step in range(len(self.leaves)):
+            leaves = visiting_order[:, step]
+            leaf_bounds = bounds[numpy.arange(len(rows)), leaves]
+            active = numpy.nonzero(
+                leaf_bounds <= best * (1 + PRUNING_TOLERANCE))[0]
+            if not len(active):
+                break
+            members = self.leaves[leaves[active]]
+            valid = members >= 0
+            members = numpy.where(valid, members, 0)
+            distances = numpy.zeros(members.shape)
+            for field_id in field_order:
+                if self.kinds[field_id] == "numeric":
+                    distances += power2(
+                        (values[field_id][active][:, None] -
+                         self.centers[field_id][members]) *
+                        self.scales[field_id])
+                else:
+                    distances += per_field[field_id][active[:, None],
+                                                     members]
+            distances[~valid] = numpy.inf
+            minimum = distances.min(axis=1)
+            # ties are solved in favour of the first centroid
+            candidate = numpy.where(distances == minimum[:, None], members,
+                                    len(self.names)).min(axis=1)
+            better = (minimum < best[active]) | (
+                (minimum == best[active]) & (candidate < nearest[active]))
+            best[active[better]] = minimum[better]
+            nearest[active[better]] = candidate[better]
+        return nearest, best
+
+    def centroids(self, rows):
+        """Nearest centroid name and distance for each of the parsed rows
+
+        """
+        if not rows:
+            return []
+        if self.leaves is not None:
+            nearest, distances = self.indexed_nearest(rows)
+        else:
+            distances = self.distances2(rows)
+            nearest = distances.argmin(axis=1)
+            distances = distances[numpy.arange(len(rows)), nearest]
+        return [(self.names[index], math.sqrt(distance))
+                for index, distance in zip(nearest, distances)]
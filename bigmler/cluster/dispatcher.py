@@ -32,6 +32,7 @@ import bigmler.processing.sources as ps
 import bigmler.processing.datasets as pd
 
 from bigmler.defaults import DEFAULTS_FILE
+from bigmler.parallel import run_in_parallel
 from bigmler.centroid import centroid, remote_centroid
 from bigmler.reports import clear_reports, upload_reports
 from bigmler.command import get_stored_command
@@ -45,6 +46,27 @@ MINIMUM_MODEL = "full=false"
 DEFAULT_OUTPUT = u"centroids.csv"
 
 
+def create_cluster_datasets(cluster, centroid_ids, args, api, path=None,
+                            session_file=None, log=None):
+    """Creates the datasets for the given centroids of the cluster, up to
+       --max-parallel-datasets at a time, and logs them as they are created
+
+    """
+    names = dict([(centroid['id'], centroid['name']) for centroid in
+                  cluster['object']['clusters']['clusters']])
+    arguments_list = [(cluster, {'centroid': centroid_id}, args, api, path,
+                       session_file, log, 'cluster') for
+                      centroid_id in centroid_ids]
+    for count, (index, dataset) in enumerate(run_in_parallel(
+            r.create_dataset, arguments_list,
+            max_parallel=args.max_parallel_datasets, ordered=False)):
+        message = u.dated("Dataset for %s created: %s (%s of %s)\n" % (
+            names[centroid_ids[index]], u.get_url(dataset), count + 1,
+            len(centroid_ids)))
+        u.log_message(message, log_file=session_file,
+                      console=args.verbosity)
+
+
 def cluster_dispatcher(args=sys.argv[1:]):
     """Parses command line and calls the different processing functions
 
@@ -206,6 +228,10 @@ def compute_output(api, args):
         # Remote centroids: centroids are computed as batch centroids
         # in bigml.com except when --no-batch flag is set on
         if args.remote and not args.no_batch:
+            if len(clusters) > 1:
+                sys.exit("Only one cluster can be used to compute remote"
+                         " centroids. Please, remove --remote to use several"
+                         " clusters.")
             # create test source from file
             test_name = "%s - test" % args.name
             if args.test_source is None:
@@ -251,11 +277,8 @@ def compute_output(api, args):
                             args.cluster_datasets_
                             if datasets[centroids[cluster_name]] == '']
 
-        for centroid_id in centroid_ids:
-            dataset_args = {'centroid': centroid_id}
-            r.create_dataset(cluster, dataset_args, args, api=api, path=path,
-                             session_file=session_file, log=log,
-                             dataset_type='cluster')
+        create_cluster_datasets(cluster, centroid_ids, args, api, path=path,
+                                session_file=session_file, log=log)
 
     u.print_generated_files(path, log_file=session_file,
                             verbosity=args.verbosity)
@@ -85,6 +85,9 @@ FLAGS = {
         {'flag': 'clear_logs', 'type': 'boolean'},
         {'flag': 'cross_validation_rate', 'type': 'float'},
         {'flag': 'number_of_evaluations', 'type': 'int'},
+        {'flag': 'cv_tolerance', 'type': 'float'},
+        {'flag': 'cv_wave', 'type': 'int'},
+        {'flag': 'cv_metric', 'type': 'string'},
         {'flag': 'store', 'type': 'boolean'},
         {'flag': 'test_split', 'type': 'float'},
         {'flag': 'ensemble', 'type': 'string'},
@@ -142,6 +145,9 @@ FLAGS = {
         {'flag': 'to_csv', 'type': 'string'},
         {'flag': 'resource_types', 'type': 'string'},
         {'flag': 'dry_run', 'type': 'boolean'},
+        {'flag': 'max_parallel_deletes', 'type': 'int'},
+        {'flag': 'delete_rate', 'type': 'float'},
+        {'flag': 'delete_retries', 'type': 'int'},
         {'flag': 'anomaly_tag', 'type': 'string'},
         {'flag': 'anomaly_score_tag', 'type': 'string'},
         {'flag': 'fast', 'type': 'boolean'},
@@ -149,7 +155,8 @@ FLAGS = {
         {'flag': 'project_id', 'type': 'string'},
         {'flag': 'no_csv', 'type': 'boolean'},
         {'flag': 'to_dataset', 'type': 'boolean'},
-        {'flag': 'median', 'type': 'boolean'}],
+        {'flag': 'median', 'type': 'boolean'},
+        {'flag': 'local_evaluation', 'type': 'boolean'}],
     'BigMLer analyze': [
         {'flag': 'k-fold', 'type': 'integer'},
         {'flag': 'cv', 'type': 'boolean'},
@@ -160,8 +167,19 @@ FLAGS = {
         {'flag': 'max_nodes', 'type': 'integer'},
         {'flag': 'min_nodes', 'type': 'integer'},
         {'flag': 'nodes_step', 'type': 'integer'},
+        {'flag': 'nodes_search', 'type': 'string'},
         {'flag': 'exclude_features', 'type': 'string'},
-        {'flag': 'optimize_category', 'type': 'string'}],
+        {'flag': 'optimize_category', 'type': 'string'},
+        {'flag': 'max_parallel_candidates', 'type': 'int'},
+        {'flag': 'max_parallel_datasets', 'type': 'int'},
+        {'flag': 'screening_folds', 'type': 'string'},
+        {'flag': 'screening_rate', 'type': 'float'},
+        {'flag': 'warm_start', 'type': 'string'},
+        {'flag': 'importance_seed', 'type': 'boolean'},
+        {'flag': 'hyperparams', 'type': 'boolean'},
+        {'flag': 'hyperparams_search', 'type': 'string'},
+        {'flag': 'hyperparams_space', 'type': 'string'},
+        {'flag': 'max_trials', 'type': 'int'}],
     'BigMLer cluster': [
         {'flag': 'cluster_fields', 'type': 'string'},
         {'flag': 'cluster', 'type': 'string'},
@@ -172,7 +190,9 @@ FLAGS = {
         {'flag': 'cluster_attributes', 'type': 'string'},
         {'flag': 'centroid_attributes', 'type': 'string'},
         {'flag': 'batch_centroid_attributes', 'type': 'string'},
-        {'flag': 'cluster_datasets', 'type': 'string'}],
+        {'flag': 'cluster_datasets', 'type': 'string'},
+        {'flag': 'max_parallel_datasets', 'type': 'int'},
+        {'flag': 'centroid_distance', 'type': 'boolean'}],
     'BigMLer anomaly': [
         {'flag': 'anomaly_fields', 'type': 'string'},
         {'flag': 'anomaly', 'type': 'string'},
@@ -182,7 +202,11 @@ FLAGS = {
         {'flag': 'anomaly_attributes', 'type': 'string'},
         {'flag': 'anomaly_score_attributes', 'type': 'string'},
         {'flag': 'batch_anomaly_score_attributes', 'type': 'string'},
-        {'flag': 'score', 'type': 'boolean'}],
+        {'flag': 'score', 'type': 'boolean'},
+        {'flag': 'jobs', 'type': 'int'},
+        {'flag': 'anomaly_top', 'type': 'int'},
+        {'flag': 'anomaly_threshold', 'type': 'float'},
+        {'flag': 'anomaly_flag', 'type': 'boolean'}],
     'BigMLer sample': [
         {'flag': 'anomaly_fields', 'type': 'string'},
         {'flag': 'sample', 'type': 'string'},
@@ -202,7 +226,8 @@ FLAGS = {
         {'flag': 'row_fields', 'type': 'string'},
         {'flag': 'stat_fields', 'type': 'string'},
         {'flag': 'stat_field', 'type': 'string'},
-        {'flag': 'unique', 'type': 'boolean'}]}
+        {'flag': 'unique', 'type': 'boolean'},
+        {'flag': 'local_sample', 'type': 'boolean'}]}
 
 
 def get_user_defaults(defaults_file=DEFAULTS_FILE):
@@ -29,13 +29,25 @@ import bigmler.processing.args as a
 
 from bigmler.defaults import DEFAULTS_FILE
 from bigmler.command import get_stored_command
+from bigmler.parallel import run_in_parallel
 from bigmler.dispatcher import (SESSIONS_LOG, command_handling,
                                 clear_log_files)
 
 COMMAND_LOG = u".bigmler_delete"
+DELETE_FAILURES = "delete_failures"
 DIRS_LOG = u".bigmler_delete_dir_stack"
 LOG_FILES = [COMMAND_LOG, DIRS_LOG, u.NEW_DIRS_LOG]
 ROWS_LIMIT = 15
+MAX_PARALLEL_LISTINGS = 4
+# resources are deleted in waves, from the derived ones to the sources
+DELETE_WAVES = [
+    ("predictions, scores and evaluations",
+     ["prediction", "batchprediction", "evaluation", "centroid",
+      "batchcentroid", "anomalyscore", "batchanomalyscore"]),
+    ("models, ensembles, clusters, anomaly detectors and samples",
+     ["ensemble", "model", "cluster", "anomaly", "sample"]),
+    ("datasets", ["dataset"]),
+    ("sources", ["source"])]
 INDENT_IDS = 26
 RESOURCES_LOG_FILES = set(['source', 'dataset', 'dataset_train',
                            'dataset_test', 'dataset_gen', 'dataset_cluster',
@@ -89,6 +101,7 @@ def get_delete_list(args, api, query_list):
     """
     resource_selectors = filtered_selectors(args, api)
     delete_list = []
+    listings = []
 
     if resource_selectors:
         for selector, api_call, filter_linked in resource_selectors:
@@ -101,8 +114,11 @@ def get_delete_list(args, api, query_list):
             if type_query_list and filter_linked:
                 type_query_list.append(filter_linked)
             if type_query_list:
-                delete_list.extend(u.list_ids(api_call,
-                                              ";".join(type_query_list)))
+                listings.append((api_call, ";".join(type_query_list)))
+    # the resource types are listed in parallel
+    for _, ids in run_in_parallel(u.list_ids, listings,
+                                  max_parallel=MAX_PARALLEL_LISTINGS):
+        delete_list.extend(ids)
     return delete_list
 
 
@@ -132,9 +148,8 @@ def get_date(reference, api):
 
 
 def resources_by_type(resources_list):
-    """Sorts resources by type. Datasets are shifted to the bottom of the
-       list to avoid problems deleting cluster-related datasets, if possible.
-       Returns aggregations by type.
+    """Sorts resources by type. Returns aggregations by type.
+
     """
     type_summary = {}
     resources_list.sort()
@@ -146,6 +161,26 @@ def resources_by_type(resources_list):
     return type_summary
 
 
+def delete_waves(delete_list):
+    """Groups the resources in waves to be deleted one after the other, so
+       that resources are deleted before the ones they were created from.
+       Returns the non-empty waves as (name, sorted ids) pairs.
+
+    """
+    wave_names = [name for name, _ in DELETE_WAVES] + ["other resources"]
+    wave_index = {}
+    for index, (_, resource_types) in enumerate(DELETE_WAVES):
+        for resource_type in resource_types:
+            wave_index[resource_type] = index
+    waves = [set() for _ in wave_names]
+    for resource_id in delete_list:
+        index = wave_index.get(u.get_resource_type(resource_id),
+                               len(DELETE_WAVES))
+        waves[index].add(resource_id)
+    return [(wave_names[index], sorted(wave))
+            for index, wave in enumerate(waves) if wave]
+
+
 def filter_resource_types(delete_list, resource_types):
     """Filters the ids using the user-given resource types to ensure that
        only those resources will be deleted.
@@ -273,10 +308,10 @@ def delete_resources(command_args, api):
         if not os.path.exists(command_args.delete_file):
             sys.exit("File %s not found" % command_args.delete_file)
         with open(command_args.delete_file, "r") as delete_file:
-            resource_id = bigml.api.get_resource_id(
-                delete_file.readline().strip())
-            if resource_id:
-                delete_list.append(resource_id)
+            for line in delete_file:
+                resource_id = bigml.api.get_resource_id(line.strip())
+                if resource_id:
+                    delete_list.append(resource_id)
     # from directory
     if command_args.from_dir:
         delete_list.extend(retrieve_resources(command_args.from_dir))
@@ -289,15 +324,24 @@ def delete_resources(command_args, api):
     time_qs_list = time_interval_qs(command_args, api)
     delete_list.extend(get_delete_list(command_args, api, time_qs_list))
 
-    types_summary = resources_by_type(delete_list)
-    message = u.dated("Deleting %s objects.\n" % len(delete_list))
+    waves = delete_waves(delete_list)
+    delete_list = [resource_id for _, wave in waves for resource_id in wave]
+    message = u.dated("Deleting %s objects in %s %s.\n" %
+                      (len(delete_list), len(waves),
+                       u.plural("wave", len(waves))))
     u.log_message(message, log_file=session_file,
                   console=command_args.verbosity)
-    for resource_type, instances in types_summary.items():
-        message = "%s%ss: %s\n" % (" " * INDENT_IDS, resource_type,
-                                   instances)
+    for index, (wave_name, wave) in enumerate(waves):
+        message = "%sWave %s, %s:\n" % (" " * (INDENT_IDS - 2), index + 1,
+                                        wave_name)
         u.log_message(message, log_file=session_file,
                       console=command_args.verbosity)
+        for resource_type, instances in sorted(
+                resources_by_type(wave).items()):
+            message = "%s%ss: %s\n" % (" " * INDENT_IDS, resource_type,
+                                       instances)
+            u.log_message(message, log_file=session_file,
+                          console=command_args.verbosity)
     if len(delete_list) > ROWS_LIMIT:
         pre_indent = INDENT_IDS - 4
         message = ("\n%s%s\n" % ((" " * pre_indent),
@@ -318,6 +362,20 @@ def delete_resources(command_args, api):
     message = ("%s" % (" " * INDENT_IDS)) + message + "\n"
     u.log_message(message, log_file=session_file)
     if not command_args.dry_run:
-        u.delete(api, delete_list)
+        retry_file = os.path.join(path, DELETE_FAILURES)
+        if os.path.exists(retry_file):
+            os.remove(retry_file)
+        # each wave is finished before the next one starts
+        for index, (wave_name, wave) in enumerate(waves):
+            message = u.dated("Deleting wave %s, %s.\n" % (index + 1,
+                                                           wave_name))
+            u.log_message(message, log_file=session_file,
+                          console=command_args.verbosity)
+            u.delete(api, wave,
+                     max_parallel=command_args.max_parallel_deletes,
+                     rate=command_args.delete_rate,
+                     retries=command_args.delete_retries,
+                     retry_file=retry_file,
+                     verbosity=command_args.verbosity)
     u.print_generated_files(path, log_file=session_file,
                             verbosity=command_args.verbosity)
@@ -616,11 +616,15 @@ def compute_output(api, args):
                     labels=labels, session_file=session_file)[0]
                 test_set_header = True
 
-            if args.test_split > 0:
-                dataset = test_dataset
-            dataset_fields = pd.get_fields_structure(dataset, None)
             models_or_ensembles = (ensemble_ids if ensemble_ids != []
                                    else models)
+            if r.local_test(args):
+                # the test file is read locally, no dataset is created
+                dataset, dataset_fields = args.test_set, None
+            else:
+                if args.test_split > 0:
+                    dataset = test_dataset
+                dataset_fields = pd.get_fields_structure(dataset, None)
             resume = evaluate(models_or_ensembles, [dataset], api,
                               args, resume,
                               fields=fields, dataset_fields=dataset_fields,
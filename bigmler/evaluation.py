@@ -20,16 +20,26 @@
 from __future__ import absolute_import
 
 import os
+import sys
 import json
 import numbers
 import math
 
+import bigml.api
+
 import bigmler.utils as u
 import bigmler.resources as r
 import bigmler.checkpoint as c
 
 from bigml.util import slugify
 
+from bigmler.local_evaluation import local_evaluate
+from bigmler.parallel import run_in_parallel
+from bigmler.processing.models import cross_validation_rounds
+
+# normal quantile for the 95% confidence interval of adaptive cross-validation
+CONFIDENCE_Z = 1.96
+
 
 def evaluate(models_or_ensembles, datasets, api, args, resume,
              session_file=None, path=None, log=None,
@@ -40,64 +50,231 @@ def evaluate(models_or_ensembles, datasets, api, args, resume,
 
     """
     output = args.predictions
-    evaluation_files = []
-    evaluations, resume = evaluations_process(
-        models_or_ensembles, datasets, fields,
-        dataset_fields, api, args, resume,
-        session_file=session_file, path=path, log=log,
-        labels=labels, all_labels=all_labels, objective_field=objective_field)
+    if args.local_evaluation:
+        evaluations = local_evaluate(models_or_ensembles, datasets, api, args,
+                                     session_file=session_file, path=path)
+    else:
+        evaluations, resume = evaluations_process(
+            models_or_ensembles, datasets, fields,
+            dataset_fields, api, args, resume,
+            session_file=session_file, path=path, log=log,
+            labels=labels, all_labels=all_labels,
+            objective_field=objective_field)
     if args.multi_label:
         file_labels = [slugify(name) for name in
                        u.objective_field_names(models_or_ensembles, api)]
-    for index in range(0, len(evaluations)):
-        evaluation = evaluations[index]
-        evaluation = r.get_evaluation(evaluation, api, args.verbosity,
-                                      session_file)
-        if r.shared_changed(args.shared, evaluation):
-            evaluation_args = {"shared": args.shared}
-            evaluation = r.update_evaluation(evaluation, evaluation_args,
-                                             args, api=api, path=path,
-                                             session_file=session_file)
+
+    def evaluation_file_name(index, evaluation):
+        """Name of the files where the evaluation is stored
+
+        """
         file_name = output
         if args.multi_label:
             suffix = file_labels[index]
             file_name += "_%s" % suffix
-            evaluation_files.append("%s.json" % file_name)
         if args.test_datasets or args.dataset_off:
-            suffix = evaluation['resource'].replace('evaluation/', '_')
-            file_name += "_%s" % suffix
-            evaluation_files.append("%s.json" % file_name)
-        r.save_evaluation(evaluation, file_name, api)
+            resource_id = (bigml.api.get_resource_id(
+                models_or_ensembles[index]) if args.local_evaluation
+                           else evaluation['resource'])
+            suffix = resource_id.replace('evaluation/', '_')
+            file_name += "_%s" % suffix.replace('/', '_')
+        return file_name
+
+    accumulator = new_accumulator()
+    if args.local_evaluation:
+        finished = enumerate(evaluations)
+    else:
+        finished = saved_evaluations(
+            evaluations, evaluation_file_name, api, args,
+            session_file=session_file, path=path, update_shared=True)
+    for index, evaluation in finished:
+        if args.local_evaluation:
+            r.save_evaluation(evaluation, evaluation_file_name(
+                index, evaluation), api)
+        add_evaluation(accumulator, evaluation_result(evaluation))
     if args.multi_label or args.test_datasets or args.dataset_off:
-        mean_evaluation = average_evaluations(evaluation_files)
+        mean_evaluation = averaged_evaluation(accumulator, len(evaluations))
         r.save_evaluation(mean_evaluation, output, api)
     return resume
 
 
+def cross_validation_file_name(path):
+    """Builds the function that names the files of the cross-validation
+       evaluations after their models
+
+    """
+    def evaluation_file_name(_, evaluation):
+        """Name of the files where the evaluation is stored
+
+        """
+        model_id = evaluation['object']['model']
+        return "%s%s%s__evaluation" % (path, os.sep,
+                                       model_id.replace("/", "_"))
+    return evaluation_file_name
+
+
 def cross_validate(models, dataset, fields, api, args, resume,
                    session_file=None, path=None, log=None):
     """Cross-validates using a MONTE-CARLO variant
 
     """
+    if args.cv_tolerance:
+        return adaptive_cross_validate(models, dataset, fields, api, args,
+                                       resume, session_file=session_file,
+                                       path=path, log=log)
     evaluations, resume = evaluations_process(
         models, [dataset],
         fields, fields, api, args, resume,
         session_file=session_file, path=path, log=log)
     if not resume:
-        evaluation_files = []
-        for evaluation in evaluations:
-            evaluation = r.get_evaluation(evaluation, api, args.verbosity,
-                                          session_file)
-            model_id = evaluation['object']['model']
-            file_name = "%s%s%s__evaluation" % (path, os.sep,
-                                                model_id.replace("/", "_"))
-            evaluation_files.append(file_name + ".json")
-            r.save_evaluation(evaluation, file_name, api)
-        cross_validation = average_evaluations(evaluation_files)
+        accumulator = new_accumulator()
+        for _, evaluation in saved_evaluations(
+                evaluations, cross_validation_file_name(path), api, args,
+                session_file=session_file, path=path):
+            add_evaluation(accumulator, evaluation_result(evaluation))
+        cross_validation = averaged_evaluation(accumulator, len(evaluations))
         file_name = "%s%scross_validation" % (path, os.sep)
         r.save_evaluation(cross_validation, file_name, api)
 
 
+def adaptive_cross_validate(models, dataset, fields, api, args, resume,
+                            session_file=None, path=None, log=None):
+    """Cross-validates using a MONTE-CARLO variant that creates models and
+       evaluations in waves until the confidence interval of the metric is
+       narrower than the --cross-validation-tolerance
+
+    """
+    max_rounds = cross_validation_rounds(args)
+    model_ids = [bigml.api.get_model_id(model) for model in models]
+    evaluations = []
+    if resume:
+        # the waves created before resuming are rebuilt from the models and
+        # evaluations logs, where they are stored in creation order
+        logged_models = c.are_models_created(path, max_rounds)[1]
+        if len(logged_models) > len(model_ids):
+            model_ids = logged_models[0: max_rounds]
+        evaluations = c.are_evaluations_created(path, max_rounds)[1]
+        evaluations = evaluations[0: len(model_ids)]
+    evaluation_args = r.set_evaluation_args(args, fields, fields)
+    model_args = r.set_model_args(args, fields=fields,
+                                  objective_id=args.objective_id_,
+                                  model_fields=args.model_fields_)
+    measure = MeasureAccumulator()
+    metric_key = None
+    accumulator = new_accumulator()
+    evaluated = 0
+    while True:
+        if len(evaluations) < len(model_ids):
+            evaluations.extend(r.create_evaluations(
+                model_ids, [dataset], evaluation_args, args, api, path=path,
+                session_file=session_file, log=log,
+                existing_evaluations=len(evaluations)))
+        values = []
+        for _, evaluation in saved_evaluations(
+                evaluations[evaluated:], cross_validation_file_name(path),
+                api, args, session_file=session_file, path=path):
+            add_evaluation(accumulator, evaluation_result(evaluation))
+            result = evaluation_result(evaluation)['model']
+            if metric_key is None:
+                metric_key = cross_validation_metric(args.cv_metric, result)
+            values.append(result[metric_key])
+        evaluated = len(evaluations)
+        stop, half_width = cross_validation_stop(
+            measure, values, len(model_ids), max_rounds, args.cv_tolerance)
+        message = u.dated("%s after %s evaluations: %.5f +/- %.5f\n" %
+                          (metric_key, measure.count, measure.mean,
+                           half_width))
+        u.log_message(message, log_file=session_file,
+                      console=args.verbosity)
+        if stop:
+            break
+        # next wave of models
+        args.number_of_models = min(args.cv_wave,
+                                    max_rounds - len(model_ids))
+        model_ids.extend(r.create_models(
+            [dataset], [], model_args, args, api, path=path,
+            session_file=session_file, log=log,
+            seed_offset=len(model_ids))[1])
+    message = u.dated("Cross-validation %s after %s of %s rounds (%s rounds"
+                      " saved).\n" %
+                      ("converged" if half_width <= args.cv_tolerance
+                       else "stopped", len(model_ids), max_rounds,
+                       max_rounds - len(model_ids)))
+    u.log_message(message, log_file=session_file, console=args.verbosity)
+    cross_validation = averaged_evaluation(accumulator, evaluated)
+    file_name = "%s%scross_validation" % (path, os.sep)
+    r.save_evaluation(cross_validation, file_name, api)
+
+
+def cross_validation_metric(metric, result):
+    """Key of the metric tracked in adaptive cross-validation. Accuracy
+       and r_squared are used by default
+
+    """
+    if metric is None:
+        metric = "accuracy" if "accuracy" in result else "r_squared"
+    for key in [metric, "average_%s" % metric]:
+        if key in result:
+            return key
+    sys.exit("Failed to find the %s metric in the evaluation results." %
+             metric)
+
+
+def confidence_half_width(measure):
+    """Half width of the confidence interval of the mean of the measure
+
+    """
+    if measure.count < 2:
+        return float('inf')
+    return CONFIDENCE_Z * math.sqrt(
+        measure.sum_of_squares / (measure.count - 1) / measure.count)
+
+
+def cross_validation_stop(measure, values, rounds, max_rounds, tolerance):
+    """Adds the metric values of the last wave of evaluations to the measure
+       and decides whether adaptive cross-validation stops: when the half
+       width of the confidence interval of the mean is within the
+       `tolerance` or the `rounds` reach `max_rounds`. Returns the decision
+       and the half width. A wave with no evaluations would never change
+       the decision, so it is rejected.
+
+    """
+    if not values:
+        sys.exit("Failed to cross-validate: no evaluation was found in the"
+                 " last wave of models.")
+    for value in values:
+        measure.add(value)
+    half_width = confidence_half_width(measure)
+    return half_width <= tolerance or rounds >= max_rounds, half_width
+
+
+def saved_evaluations(evaluations, file_name, api, args, session_file=None,
+                      path=None, update_shared=False):
+    """Retrieves the evaluations and saves them as they finish, using up to
+       --max-parallel-evaluations threads. `file_name(index, evaluation)`
+       names the files of each evaluation. Yields (index, evaluation) pairs
+       in completion order.
+
+    """
+    def save_evaluation(index, evaluation):
+        """Waits for the evaluation to finish and saves it
+
+        """
+        evaluation = r.get_evaluation(evaluation, api, args.verbosity,
+                                      session_file)
+        if update_shared and r.shared_changed(args.shared, evaluation):
+            evaluation_args = {"shared": args.shared}
+            evaluation = r.update_evaluation(evaluation, evaluation_args,
+                                             args, api=api, path=path,
+                                             session_file=session_file)
+        r.save_evaluation(evaluation, file_name(index, evaluation), api)
+        return evaluation
+
+    return run_in_parallel(save_evaluation, list(enumerate(evaluations)),
+                           max_parallel=args.max_parallel_evaluations,
+                           ordered=False)
+
+
 def evaluations_process(models_or_ensembles, datasets,
                         fields, dataset_fields, api, args, resume,
                         session_file=None, path=None, log=None, labels=None,
@@ -138,167 +315,195 @@ def evaluations_process(models_or_ensembles, datasets,
     return evaluations, resume
 
 
-def standard_deviation(points, mean):
-    """Computes the standard deviation
+SPECIAL_CLASS_KEYS = ['class_name', 'present_in_test_data', 'occurrences']
+
+
+class MeasureAccumulator(object):
+    """Accumulates the values of a measure: their sum and the running mean
+       and sum of squared deviations (Welford's method)
 
     """
-    total = float(len(points))
-    if total > 0:
-        return math.sqrt(sum([(point - mean) ** 2 for point in points]) /
-                         total)
-    else:
-        return float('nan')
 
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.sum_of_squares = 0.0
+
+    def add(self, value):
+        """Adds a new value of the measure
 
-def traverse_for_std_dev(tree):
-    """Traverses the tree to find measure lists and compute standard deviation
+        """
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.sum_of_squares += delta * (value - self.mean)
+
+    def standard_deviation(self, average):
+        """Standard deviation of the values around the given average, that
+           can differ from their mean when some evaluations lack the measure
+
+        """
+        if self.count == 0:
+            return float('nan')
+        return math.sqrt(max(self.sum_of_squares + self.count *
+                             (self.mean - average) ** 2, 0.0) / self.count)
+
+
+class ClassAccumulator(object):
+    """Accumulates the per class statistics of a class
 
     """
-    if isinstance(tree, dict):
-        keys = tree.keys()
-        for key in keys:
-            if (isinstance(key, tuple) and
-                    key[0].endswith('_standard_deviation')):
-                tree[key[0]] = standard_deviation(tree[key], tree[key[1]])
-                del tree[key]
-            else:
-                traverse_for_std_dev(tree[key])
-    elif isinstance(tree, list):
-        for subtree in tree:
-            traverse_for_std_dev(subtree)
 
+    def __init__(self, class_name):
+        self.class_name = class_name
+        self.present_in_test_data = False
+        self.absences = 0
+        self.measures = {}
 
-def average_evaluations(evaluation_files):
-    """Reads the contents of the evaluations files and averages its measures
+    def add(self, class_info):
+        """Adds the statistics of the class in a new evaluation
+
+        """
+        flag = class_info['present_in_test_data']
+        # if the class is not present in the evaluation test data set, it
+        # does not count for the measures average
+        if not flag:
+            self.absences += 1
+        self.present_in_test_data = self.present_in_test_data or flag
+        add_measures(self.measures, class_info, SPECIAL_CLASS_KEYS)
+
+    def average(self, number_of_evaluations):
+        """Averaged per class statistics
+
+        """
+        occurrences = int(number_of_evaluations) - self.absences
+        class_info = {'class_name': self.class_name,
+                      'present_in_test_data': self.present_in_test_data,
+                      'occurrences': occurrences}
+        average_measures(class_info, self.measures, occurrences)
+        return class_info
+
+
+def add_measures(measures, component, special_keys=None):
+    """Adds the numeric values in `component` to their accumulators
 
     """
-    averaged_evaluation = {}
-    number_of_evaluations = float(len(evaluation_files))
-    if number_of_evaluations > 0:
-        for evaluation_file in evaluation_files:
-            with open(evaluation_file, 'U') as evaluation_file:
-                evaluation = json.loads(evaluation_file.read())
-                avg_evaluation(averaged_evaluation,
-                               evaluation, number_of_evaluations)
-        traverse_for_std_dev(averaged_evaluation)
-    return averaged_evaluation
+    if special_keys is None:
+        special_keys = []
+    for key, value in component.items():
+        if key not in special_keys and isinstance(value, numbers.Number):
+            if key not in measures:
+                measures[key] = MeasureAccumulator()
+            measures[key].add(value)
+
+
+def average_measures(total, measures, divisor):
+    """Stores the averages and standard deviations of the measures in
+       `total`. Keys are prefixed with `average_` unless they already are.
 
+    """
+    averages = {}
+    for key, measure in measures.items():
+        new_key = (key if key.startswith("average_")
+                   else ("average_%s" % key))
+        # a class absent from all the test data sets has no other divisor
+        averages[key] = measure.total / float(divisor or measure.count)
+        total[new_key] = averages[key]
+    # standard deviations prevail over averages of previous ones
+    for key, measure in measures.items():
+        total["%s_standard_deviation" % key] = measure.standard_deviation(
+            averages[key])
+
+
+def new_accumulator():
+    """Empty accumulator for a group of evaluation measures
+
+    """
+    return {"measures": {}, "groups": {}, "class_names": None,
+            "confusion_matrix": None, "classes": None}
 
-def avg_evaluation(total, component, number_of_evaluations):
-    """Adds a new set of evaluation measures to the cumulative average
+
+def add_evaluation(accumulator, evaluation):
+    """Adds the measures of a new evaluation to the accumulator
 
     """
-    if number_of_evaluations > 0:
-        for key, value in component.items():
-            # Handle the non-averageable values in
-            # classifications' evaluation data
-            if key == "class_names":
-                if not key in total:
-                    total[key] = []
-                total[key].extend(value)
-                total[key] = list(set(total[key]))
-            elif key == "confusion_matrix":
-                if not key in total:
-                    total[key] = value
-                else:
-                    total[key] = add_matrices(total[key], value)
-            elif key == "per_class_statistics":
-                if not key in total:
-                    total[key] = []
-                total[key] = avg_class_statistics(total[key], value,
-                                                  number_of_evaluations)
+    for key, value in evaluation.items():
+        # Handle the non-averageable values in
+        # classifications' evaluation data
+        if key == "class_names":
+            if accumulator["class_names"] is None:
+                accumulator["class_names"] = set()
+            accumulator["class_names"].update(value)
+        elif key == "confusion_matrix":
+            if accumulator["confusion_matrix"] is None:
+                accumulator["confusion_matrix"] = [row[:] for row in value]
             else:
-                # Average numerical values
-                if isinstance(value, numbers.Number):
-                    new_key = (key if key.startswith("average_")
-                               else ("average_%s" % key))
-                    if not new_key in total:
-                        total[new_key] = 0
-                    total[new_key] += value / number_of_evaluations
-                    sd_key = "%s_standard_deviation" % key
-                    if not (sd_key, new_key) in total:
-                        total[(sd_key, new_key)] = []
-                    total[(sd_key, new_key)].append(value)
-                # Handle grouping keys
-                elif isinstance(value, list) or isinstance(value, dict):
-                    if not key in total:
-                        total[key] = [] if isinstance(value, list) else {}
-                    avg_evaluation(total[key], value,
-                                   number_of_evaluations)
-
-
-def add_matrices(matrix_a, matrix_b):
-    """Add two n x n matrices
+                add_matrix(accumulator["confusion_matrix"], value)
+        elif key == "per_class_statistics":
+            if accumulator["classes"] is None:
+                accumulator["classes"] = ([], {})
+            class_list, class_index = accumulator["classes"]
+            for class_info in value:
+                class_name = class_info['class_name']
+                if class_name not in class_index:
+                    class_index[class_name] = ClassAccumulator(class_name)
+                    class_list.append(class_index[class_name])
+                class_index[class_name].add(class_info)
+        # Handle grouping keys
+        elif isinstance(value, dict):
+            if key not in accumulator["groups"]:
+                accumulator["groups"][key] = new_accumulator()
+            add_evaluation(accumulator["groups"][key], value)
+    add_measures(accumulator["measures"], evaluation)
+
+
+def add_matrix(total, matrix):
+    """Adds a n x n matrix to the `total` matrix in place
 
     """
-    return map(lambda i: map(lambda x, y: x + y, matrix_a[i], matrix_b[i]),
-               xrange(len(matrix_a)))
+    for total_row, row in zip(total, matrix):
+        for index, value in enumerate(row):
+            total_row[index] += value
 
 
-def avg_class_statistics(total, component, number_of_evaluations):
-    """Adds a new set of per class evaluation measures to the total average
+def averaged_evaluation(accumulator, number_of_evaluations):
+    """Builds the averaged evaluation from the accumulated measures
 
     """
-    special_keys = ['class_name', 'present_in_test_data', 'occurrences']
-    for class_info in component:
-        class_name = class_info['class_name']
-        found = False
-        for total_class_info in total:
-            if class_name == total_class_info['class_name']:
-                found = True
-                flag = class_info['present_in_test_data']
-                # If the class is not present in the evaluation test data set,
-                # the measures for that class are not affected by it
-                if not flag:
-                    total_class_info['occurrences'] -= 1
-                    occurrences = float(total_class_info['occurrences'])
-                    for key in total_class_info:
-                        # renormalizing previous average count
-                        if not (isinstance(key, tuple) or key in special_keys):
-                            total_class_info[key] *= ((occurrences + 1) /
-                                                      occurrences)
-                if not total_class_info['present_in_test_data']:
-                    total_class_info['present_in_test_data'] = flag
-                occurrences = float(total_class_info['occurrences'])
-                for key in class_info:
-                    if not (isinstance(key, tuple) or key in special_keys):
-                        new_key = (key if key.startswith("average_")
-                                   else ("average_%s" % key))
-                        if new_key in total_class_info:
-                            total_class_info[new_key] += (class_info[key] /
-                                                          occurrences)
-                        else:
-                            total_class_info[new_key] = (class_info[key] /
-                                                         occurrences)
-                        sd_key = "%s_standard_deviation" % key
-                        if not (sd_key, new_key) in total_class_info:
-                            total_class_info[(sd_key, new_key)] = []
-                        total_class_info[
-                            (sd_key, new_key)].append(class_info[key])
-                break
-        if not found:
-            flag = class_info['present_in_test_data']
-            class_info['occurrences'] = int(number_of_evaluations)
-            if not flag:
-                class_info['occurrences'] -= 1
-            keys = class_info.keys()
-            for key in keys:
-                if not key in special_keys:
-                    sd_key = "%s_standard_deviation" % key
-                    if not key.startswith("average_"):
-                        new_key = "average_%s" % key
-                        class_info[new_key] = (float(class_info[key]) /
-                                               class_info['occurrences'])
-                        if not (sd_key, new_key) in class_info:
-                            class_info[(sd_key, new_key)] = []
-                        class_info[(sd_key, new_key)].append(class_info[key])
-                        del class_info[key]
-                    else:
-                        new_key = key
-                        class_info[key] = (float(class_info[key]) /
-                                           class_info['occurrences'])
-                        if not (sd_key, new_key) in class_info:
-                            class_info[(sd_key, new_key)] = []
-                        class_info[(sd_key, new_key)].append(class_info[key])
-            total.append(class_info)
+    total = {}
+    average_measures(total, accumulator["measures"], number_of_evaluations)
+    for key, group in accumulator["groups"].items():
+        total[key] = averaged_evaluation(group, number_of_evaluations)
+    if accumulator["class_names"] is not None:
+        total["class_names"] = list(accumulator["class_names"])
+    if accumulator["confusion_matrix"] is not None:
+        total["confusion_matrix"] = accumulator["confusion_matrix"]
+    if accumulator["classes"] is not None:
+        total["per_class_statistics"] = [
+            class_accumulator.average(number_of_evaluations)
+            for class_accumulator in accumulator["classes"][0]]
     return total
+
+
+def evaluation_result(evaluation):
+    """Evaluation measures in a remote evaluation or local result
+
+    """
+    return evaluation.get('object', evaluation).get('result', evaluation)
+
+
+def average_evaluations(evaluation_files):
+    """Reads the contents of the evaluations files and averages its measures
+
+    """
+    accumulator = new_accumulator()
+    number_of_evaluations = float(len(evaluation_files))
+    if number_of_evaluations == 0:
+        return {}
+    for evaluation_file in evaluation_files:
+        with open(evaluation_file, 'U') as evaluation_file:
+            evaluation = json.loads(evaluation_file.read())
+            add_evaluation(accumulator, evaluation)
+    return averaged_evaluation(accumulator, number_of_evaluations)
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Local evaluation functions for BigMLer
+
+   Models and ensembles are evaluated against CSV files using local
+   predictions. The evaluation measures are accumulated in NumPy arrays
+   and stored in the same format used in BigML's evaluations.
+
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import csv
+import thread
+
+import bigml.api
+
+import bigmler.utils as u
+import bigmler.resources as r
+
+from bigml.model import Model
+from bigml.ensemble import Ensemble
+from bigml.util import get_csv_delimiter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# number of rows predicted before updating the accumulators
+CHUNK_SIZE = 10000
+
+
+def safe_divide(numerator, denominator):
+    """Element-wise division that returns 0 when the denominator is 0
+
+    """
+    denominator = numpy.asarray(denominator, dtype=float)
+    valid = denominator != 0
+    return numpy.where(valid, numerator / numpy.where(valid, denominator, 1),
+                       0.0)
+
+
+class ClassificationAccumulator(object):
+    """Accumulates the confusion matrix of a classification
+
+    """
+
+    def __init__(self, class_names=None):
+        self.class_names = []
+        self.class_index = {}
+        self.confusion = numpy.zeros((0, 0), dtype=numpy.int64)
+        self.add_classes(class_names or [])
+
+    def add_classes(self, class_names):
+        """Adds new classes to the confusion matrix
+
+        """
+        new_classes = [class_name for class_name in class_names
+                       if class_name not in self.class_index]
+        if new_classes:
+            for class_name in new_classes:
+                self.class_index[class_name] = len(self.class_names)
+                self.class_names.append(class_name)
+            size = len(self.class_names)
+            confusion = numpy.zeros((size, size), dtype=numpy.int64)
+            old_size = self.confusion.shape[0]
+            confusion[0: old_size, 0: old_size] = self.confusion
+            self.confusion = confusion
+
+    def add(self, actual, predicted):
+        """Adds the actual and predicted classes of a group of rows
+
+        """
+        if not actual:
+            return
+        self.add_classes(sorted(set(actual) | set(predicted)))
+        size = len(self.class_names)
+        codes = (numpy.array([self.class_index[class_name]
+                              for class_name in actual]) * size +
+                 numpy.array([self.class_index[class_name]
+                              for class_name in predicted]))
+        self.confusion += numpy.bincount(
+            codes, minlength=size * size).reshape(size, size)
+
+    def count(self):
+        """Number of accumulated rows
+
+        """
+        return int(self.confusion.sum())
+
+    def evaluation(self):
+        """Evaluation measures, with classes sorted by name
+
+        """
+        order = sorted(range(len(self.class_names)),
+                       key=lambda index: self.class_names[index])
+        confusion = self.confusion[numpy.ix_(order, order)]
+        total = float(confusion.sum())
+        true_positives = numpy.diag(confusion).astype(float)
+        false_positives = confusion.sum(axis=0) - true_positives
+        false_negatives = confusion.sum(axis=1) - true_positives
+        true_negatives = (total - true_positives - false_positives -
+                          false_negatives)
+        precision = safe_divide(true_positives,
+                                true_positives + false_positives)
+        recall = safe_divide(true_positives, true_positives + false_negatives)
+        f_measure = safe_divide(2 * precision * recall, precision + recall)
+        phi = safe_divide(
+            true_positives * true_negatives -
+            false_positives * false_negatives,
+            numpy.sqrt((true_positives + false_positives) *
+                       (true_positives + false_negatives) *
+                       (true_negatives + false_positives) *
+                       (true_negatives + false_negatives)))
+        accuracy = safe_divide(true_positives + true_negatives, total)
+        per_class_statistics = []
+        for index, class_index in enumerate(order):
+            per_class_statistics.append({
+                "class_name": self.class_names[class_index],
+                "accuracy": float(accuracy[index]),
+                "precision": float(precision[index]),
+                "recall": float(recall[index]),
+                "f_measure": float(f_measure[index]),
+                "phi_coefficient": float(phi[index]),
+                "present_in_test_data": bool(
+                    true_positives[index] + false_negatives[index] > 0)})
+        return {
+            "accuracy": float(safe_divide(true_positives.sum(), total)),
+            "average_precision": float(precision.mean()),
+            "average_recall": float(recall.mean()),
+            "average_f_measure": float(f_measure.mean()),
+            "average_phi": float(phi.mean()),
+            "confusion_matrix": confusion.tolist(),
+            "per_class_statistics": per_class_statistics}
+
+
+class RegressionAccumulator(object):
+    """Accumulates the errors of a regression and the mean and sum of
+       squares of the actual values, which are merged for every group of
+       rows to keep them numerically stable.
+
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.mean = 0.0
+        self.sum_of_squares = 0.0
+        self.absolute_error = 0.0
+        self.squared_error = 0.0
+
+    def add(self, actual, predicted):
+        """Adds the actual and predicted values of a group of rows
+
+        """
+        if not actual:
+            return
+        actual = numpy.asarray(actual, dtype=float)
+        errors = numpy.asarray(predicted, dtype=float) - actual
+        self.absolute_error += float(numpy.abs(errors).sum())
+        self.squared_error += float((errors ** 2).sum())
+        rows = len(actual)
+        total = self.rows + rows
+        mean = float(actual.mean())
+        delta = mean - self.mean
+        self.sum_of_squares += (float(((actual - mean) ** 2).sum()) +
+                                delta ** 2 * self.rows * rows / total)
+        self.mean += delta * rows / total
+        self.rows = total
+
+    def count(self):
+        """Number of accumulated rows
+
+        """
+        return self.rows
+
+    def evaluation(self):
+        """Evaluation measures
+
+        """
+        rows = float(max(self.rows, 1))
+        r_squared = (1 - self.squared_error / self.sum_of_squares
+                     if self.sum_of_squares > 0 else 0.0)
+        return {"mean_absolute_error": self.absolute_error / rows,
+                "mean_squared_error": self.squared_error / rows,
+                "r_squared": r_squared}
+
+
+def get_local_model(model_or_ensemble, api, args):
+    """Retrieves the finished model or ensemble and builds its local version
+
+    """
+    if bigml.api.get_resource_type(model_or_ensemble) == "ensemble":
+        u.check_resource(model_or_ensemble, api.get_ensemble)
+        return Ensemble(model_or_ensemble, api=api,
+                        max_models=args.max_batch_models)
+    model = u.check_resource(model_or_ensemble, api.get_model,
+                             query_string=r.ALL_FIELDS_QS)
+    return Model(model, api=api)
+
+
+def evaluate_file(local_model, test_file, args, test_header=True,
+                  test_separator=","):
+    """Evaluates a local model or ensemble with the rows in a CSV file in a
+       single pass. If the file has no header row, its columns are expected
+       in the order of the model fields.
+
+    """
+    objective_field = local_model.fields[local_model.objective_id]
+    objective_name = objective_field['name']
+    regression = objective_field['optype'] == 'numeric'
+    summary = objective_field.get('summary', {})
+    kwargs = {"by_name": True, "missing_strategy": args.missing_strategy}
+    if isinstance(local_model, Ensemble):
+        kwargs.update({"method": args.method, "median": args.median})
+    if regression:
+        accumulators = {"model": RegressionAccumulator()}
+        baseline_name, baseline = "mean", summary.get("mean")
+        if baseline is not None:
+            accumulators.update({baseline_name: RegressionAccumulator()})
+    else:
+        class_names = [category for category, _ in
+                       summary.get("categories", [])]
+        accumulators = {"model": ClassificationAccumulator(class_names)}
+        baseline_name, baseline = "mode", None
+        if class_names:
+            baseline = max(summary["categories"],
+                           key=lambda category: category[1])[0]
+            accumulators.update({
+                baseline_name: ClassificationAccumulator(class_names)})
+    try:
+        with open(test_file, "U") as test_handler:
+            test_reader = csv.reader(test_handler, delimiter=test_separator,
+                                     lineterminator="\n")
+            if test_header:
+                headers = [header.decode(u.FILE_ENCODING) for header in
+                           test_reader.next()]
+            else:
+                headers = [field['name'] for field in
+                           sorted(local_model.fields.values(),
+                                  key=lambda field: field['column_number'])]
+            try:
+                objective_column = headers.index(objective_name)
+            except ValueError:
+                sys.exit("Failed to find the objective field %s in %s." %
+                         (objective_name, test_file))
+            actual, predicted, non_numeric = [], [], 0
+            for row in test_reader:
+                row = [value.decode(u.FILE_ENCODING) for value in row]
+                if len(row) <= objective_column or \
+                        row[objective_column] == "":
+                    continue
+                objective_value = row[objective_column]
+                if regression:
+                    try:
+                        objective_value = float(objective_value)
+                    except ValueError:
+                        non_numeric += 1
+                        continue
+                input_data = dict(zip(headers, row))
+                del input_data[objective_name]
+                prediction = local_model.predict(input_data, **kwargs)
+                if prediction is None:
+                    continue
+                actual.append(objective_value)
+                predicted.append(prediction)
+                if len(actual) == CHUNK_SIZE:
+                    add_to_accumulators(accumulators, actual, predicted,
+                                        baseline_name, baseline)
+                    actual, predicted = [], []
+            add_to_accumulators(accumulators, actual, predicted,
+                                baseline_name, baseline)
+    except IOError, exc:
+        sys.exit("Failed to read the test file %s: %s" % (test_file,
+                                                           str(exc)))
+    if non_numeric:
+        print ("WARNING: %s rows in %s have a non-numeric objective value and"
+               " have been skipped." % (non_numeric, test_file))
+    if not accumulators["model"].count():
+        sys.exit("No row in %s could be used to evaluate." % test_file)
+    evaluation = dict([(name, accumulator.evaluation()) for
+                       name, accumulator in accumulators.items()])
+    if not regression:
+        evaluation["class_names"] = sorted(
+            accumulators["model"].class_names)
+    return evaluation
+
+
+def add_to_accumulators(accumulators, actual, predicted, baseline_name,
+                        baseline):
+    """Adds a group of rows to the model and baseline accumulators
+
+    """
+    accumulators["model"].add(actual, predicted)
+    if baseline_name in accumulators:
+        accumulators[baseline_name].add(actual, [baseline] * len(actual))
+
+
+def cached_dataset_file(dataset, api, cache_dir):
+    """Downloads the dataset contents to a CSV file in `cache_dir` unless
+       it was downloaded before
+
+    """
+    file_name = os.path.join(cache_dir, "%s.csv" % dataset.replace("/", "_"))
+    if not os.path.exists(file_name):
+        # parallel processes can be downloading the same dataset
+        temp_file = "%s.%s_%s" % (file_name, os.getpid(), thread.get_ident())
+        if not api.download_dataset(dataset, filename=temp_file):
+            sys.exit("Failed to download the dataset %s." % dataset)
+        os.rename(temp_file, file_name)
+    return file_name
+
+
+def local_evaluate(models_or_ensembles, datasets, api, args,
+                   session_file=None, path=None):
+    """Evaluates models or ensembles against datasets using local
+       predictions. The datasets are downloaded once as CSV files in the
+       directory of the --datasets file (or the output directory), and
+       local test files (see `r.local_test`) are read directly.
+       Returns the list of evaluations.
+
+    """
+    if numpy is None:
+        sys.exit("Failed to find the numpy library needed to evaluate"
+                 " locally. Please, install it manually")
+    if args.multi_label:
+        sys.exit("Local evaluations are not available for multi-label"
+                 " models.")
+    if not r.local_test(args) and r.out_of_bag_evaluation(args):
+        # the out of bag sampling of remote evaluations cannot be reproduced
+        sys.exit("Local evaluations need a held-out test set. Please, use"
+                 " --test, --test-split, --test-datasets or"
+                 " --dataset-off, or evaluate remotely.")
+    cache_dir = (u.check_dir(args.datasets) if args.datasets else path)
+    evaluations = []
+    for index, model_or_ensemble in enumerate(models_or_ensembles):
+        model_or_ensemble = bigml.api.get_resource_id(model_or_ensemble)
+        if r.local_test(args):
+            dataset = args.test_set
+            test_file, test_header = dataset, args.test_header
+            test_separator = (args.test_separator.decode("string_escape")
+                              if args.test_separator else
+                              get_csv_delimiter())
+        else:
+            dataset = bigml.api.get_dataset_id(
+                datasets[index] if args.test_dataset_ids or args.dataset_off
+                else datasets[0])
+            test_file = cached_dataset_file(dataset, api, cache_dir)
+            test_header, test_separator = True, ","
+        message = u.dated("Evaluating %s locally with %s.\n" %
+                          (model_or_ensemble, dataset))
+        u.log_message(message, log_file=session_file,
+                      console=args.verbosity)
+        local_model = get_local_model(model_or_ensemble, api, args)
+        evaluations.append(evaluate_file(
+            local_model, test_file, args, test_header=test_header,
+            test_separator=test_separator))
+    return evaluations
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Local sample functions for BigMLer
+
+   The rows of a local CSV file are sampled in a single pass using the same
+   options as the remote samples (see `sampleoutput.sample_query_string`).
+   Random samples are kept in a reservoir, linear samples stop reading
+   as soon as they have enough rows and sorted samples keep only the
+   rows at the top. The statistics in `sampleoutput.STAT_KEYS` are computed
+   with NumPy.
+
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import csv
+import json
+import heapq
+import hashlib
+import random
+import itertools
+
+import bigmler.utils as u
+import bigmler.resources as r
+
+from bigml.fields import DEFAULT_MISSING_TOKENS
+from bigml.util import get_csv_delimiter
+
+from bigmler.sampleoutput import LINEAR_MODE, RANDOM_MODE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# seed used in deterministic mode when no --seed is given
+DETERMINISTIC_SEED = r.SEED
+# options of the remote samples that are ignored in local samples
+UNSUPPORTED_OPTIONS = [("fields_filter", "--fields-filter"),
+                       ("occurrence", "--occurrence"),
+                       ("precision", "--precision")]
+
+
+def to_number(value):
+    """Numeric value of a CSV value or None if it's not a number
+
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def sort_key(column, descending=False):
+    """Key function to sort rows by the values in `column`. Numbers are
+       sorted before text and missing values are placed last.
+
+    """
+    def key(index_row):
+        """Key of an (index, row) pair
+
+        """
+        value = index_row[1][column] if column < len(index_row[1]) else ""
+        if value in DEFAULT_MISSING_TOKENS:
+            return (0 if descending else 2, "")
+        number = to_number(value)
+        if number is None:
+            return (1, value)
+        return (2 if descending else 0, number)
+    return key
+
+
+def file_rows(csv_file, separator):
+    """Iterator over the (index, row) pairs of an open CSV file. The file
+       is closed when all the rows have been read.
+
+    """
+    with csv_file:
+        reader = csv.reader(csv_file, delimiter=separator,
+                            lineterminator="\n")
+        for index, row in enumerate(reader):
+            if row:
+                yield index, [value.decode(u.FILE_ENCODING) for value in row]
+
+
+def read_rows(test_file, separator, header):
+    """Returns the headers and an iterator over the (index, row) pairs of a
+       CSV file
+
+    """
+    rows = file_rows(open(test_file, "U"), separator)
+    try:
+        first_index, first_row = rows.next()
+    except StopIteration:
+        sys.exit("Failed to find any row in %s." % test_file)
+    if header:
+        return first_row, ((index - 1, row) for index, row in rows)
+    headers = [u"field%s" % (column + 1) for column in range(len(first_row))]
+    return headers, itertools.chain([(first_index, first_row)], rows)
+
+
+def unique_rows(rows):
+    """Skips the rows whose contents have already been seen. Only their
+       SHA-1 digests are kept.
+
+    """
+    seen = set()
+    for index, row in rows:
+        row_digest = hashlib.sha1(json.dumps(row)).digest()
+        if row_digest not in seen:
+            seen.add(row_digest)
+            yield index, row
+
+
+def reservoir(rows, size, rng):
+    """Uniform random selection of `size` rows in a single pass over the
+       rows. All of them are kept when `size` is None. The selected rows
+       are returned in random order.
+
+    """
+    selected = []
+    for count, index_row in enumerate(rows):
+        if size is None or count < size:
+            selected.append(index_row)
+        else:
+            position = rng.randint(0, count)
+            if position < size:
+                selected[position] = index_row
+    rng.shuffle(selected)
+    return selected
+
+
+def column_index(headers, name, option):
+    """Column of the field in the headers
+
+    """
+    try:
+        return headers.index(name)
+    except ValueError:
+        sys.exit("Failed to find the field %s used in %s." % (name, option))
+
+
+def select_rows(rows, headers, args):
+    """Selects the sample rows following the --mode, --seed, --rows,
+       --row-offset, --row-order-by and --unique options
+
+    """
+    offset = args.row_offset or 0
+    size = None if args.rows is None else offset + args.rows
+    if args.unique:
+        rows = unique_rows(rows)
+    mode = args.mode
+    if args.row_order_by:
+        if mode is None:
+            mode = LINEAR_MODE
+        elif mode != LINEAR_MODE:
+            print ("WARNING: --row-order-by can only be used with \"linear\""
+                   " --mode. Ignoring --row-order-by.")
+    if mode == LINEAR_MODE:
+        if args.row_order_by:
+            descending = args.row_order_by.startswith("-")
+            name = args.row_order_by[1:] if descending else args.row_order_by
+            key = sort_key(column_index(headers, name, "--row-order-by"),
+                           descending=descending)
+            if size is None:
+                selected = sorted(rows, key=key, reverse=descending)
+            elif descending:
+                selected = heapq.nlargest(size, rows, key=key)
+            else:
+                selected = heapq.nsmallest(size, rows, key=key)
+        else:
+            selected = list(itertools.islice(rows, size))
+    else:
+        seed = args.seed
+        if seed is None and mode != RANDOM_MODE:
+            seed = DETERMINISTIC_SEED
+        selected = reservoir(rows, size, random.Random(seed))
+    return selected[offset:]
+
+
+def numeric_columns(rows, columns):
+    """Matrix of the values in `columns` for the given rows. Missing or
+       non-numeric values are stored as NaN.
+
+    """
+    matrix = numpy.empty((len(rows), len(columns)))
+    for row_number, row in enumerate(rows):
+        for position, column in enumerate(columns):
+            value = row[column] if column < len(row) else ""
+            number = to_number(value) if value not in \
+                DEFAULT_MISSING_TOKENS else None
+            matrix[row_number, position] = (numpy.nan if number is None
+                                             else number)
+    return matrix
+
+
+def average_ranks(values):
+    """Ranks of the values, using the average rank for ties
+
+    """
+    _, inverse, counts = numpy.unique(values, return_inverse=True,
+                                      return_counts=True)
+    ends = numpy.cumsum(counts)
+    return (ends - (counts - 1) / 2.0)[inverse]
+
+
+def statistics(x_values, y_matrix):
+    """Pearson's and Spearman's correlations and linear regression terms
+       between `x_values` and each column in `y_matrix`. Only the rows where
+       both values are numbers are used.
+
+    """
+    x_matrix = numpy.repeat(x_values[:, None], y_matrix.shape[1], axis=1)
+    mask = ~numpy.isnan(x_matrix) & ~numpy.isnan(y_matrix)
+    counts = mask.sum(axis=0).astype(float)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        x_means = numpy.where(mask, x_matrix, 0).sum(axis=0) / counts
+        y_means = numpy.where(mask, y_matrix, 0).sum(axis=0) / counts
+        x_deltas = numpy.where(mask, x_matrix - x_means, 0)
+        y_deltas = numpy.where(mask, y_matrix - y_means, 0)
+        xy_sum = (x_deltas * y_deltas).sum(axis=0)
+        xx_sum = (x_deltas ** 2).sum(axis=0)
+        yy_sum = (y_deltas ** 2).sum(axis=0)
+        pearson = xy_sum / numpy.sqrt(xx_sum * yy_sum)
+        slopes = xy_sum / xx_sum
+        intercepts = y_means - slopes * x_means
+    spearman = numpy.empty(y_matrix.shape[1])
+    for column in range(y_matrix.shape[1]):
+        column_mask = mask[:, column]
+        x_ranks = average_ranks(x_values[column_mask])
+        y_ranks = average_ranks(y_matrix[column_mask, column])
+        x_ranks -= x_ranks.mean() if len(x_ranks) else 0
+        y_ranks -= y_ranks.mean() if len(y_ranks) else 0
+        denominator = numpy.sqrt((x_ranks ** 2).sum() * (y_ranks ** 2).sum())
+        spearman[column] = ((x_ranks * y_ranks).sum() / denominator
+                            if denominator > 0 else numpy.nan)
+    return pearson, spearman, slopes, intercepts
+
+
+def json_value(value):
+    """Float value with NaNs stored as None
+
+    """
+    return None if numpy.isnan(value) else float(value)
+
+
+def stat_info(rows, headers, args):
+    """Statistics for the --stat-fields pair of fields or between the
+       --stat-field and the rest of numeric fields
+
+    """
+    info = {}
+    if args.stat_fields_:
+        if len(args.stat_fields_) != 2:
+            sys.exit("--stat-fields needs two comma-separated field names.")
+        columns = [column_index(headers, name, "--stat-fields") for
+                   name in args.stat_fields_]
+        matrix = numeric_columns(rows, columns)
+        pearson, spearman, slopes, intercepts = statistics(
+            matrix[:, 0], matrix[:, 1:])
+        info.update({"pearson_correlation": json_value(pearson[0]),
+                     "spearman_correlation": json_value(spearman[0]),
+                     "slope": json_value(slopes[0]),
+                     "intercept": json_value(intercepts[0])})
+    if args.stat_field:
+        stat_column = column_index(headers, args.stat_field, "--stat-field")
+        matrix = numeric_columns(rows, range(len(headers)))
+        numeric = [column for column in range(len(headers)) if
+                   column != stat_column and
+                   not numpy.isnan(matrix[:, column]).all() and
+                   all(to_number(row[column]) is not None for row in rows
+                       if column < len(row) and
+                       row[column] not in DEFAULT_MISSING_TOKENS)]
+        pearson, spearman, slopes, intercepts = statistics(
+            matrix[:, stat_column], matrix[:, numeric])
+        names = [headers[column] for column in numeric]
+        for key, values in [("pearson_correlations", pearson),
+                            ("spearman_correlations", spearman),
+                            ("slopes", slopes),
+                            ("intercepts", intercepts)]:
+            info[key] = dict([(name, json_value(value)) for name, value in
+                              zip(names, values)])
+    return info
+
+
+def local_sample_file(test_file, args, path, session_file=None):
+    """Creates the sample file from the rows of a local CSV file
+
+    """
+    if numpy is None and (args.stat_field or args.stat_fields):
+        sys.exit("Failed to find the numpy library needed to compute the"
+                 " sample statistics locally. Please, install it manually")
+    for attribute, option in UNSUPPORTED_OPTIONS:
+        if getattr(args, attribute):
+            print "WARNING: %s is not available in local samples." \
+                " Ignoring %s." % (option, option)
+    separator = (args.training_separator.decode("string_escape")
+                 if args.training_separator else get_csv_delimiter())
+    message = u.dated("Sampling %s locally.\n" % test_file)
+    u.log_message(message, log_file=session_file, console=args.verbosity)
+    try:
+        headers, rows = read_rows(test_file, separator, args.train_header)
+        selected = select_rows(rows, headers, args)
+    except IOError, exc:
+        sys.exit("Failed to read the training file %s: %s" % (test_file,
+                                                               str(exc)))
+    rows = [row for _, row in selected]
+    columns = range(len(headers))
+    if args.row_fields_:
+        columns = [column_index(headers, name, "--row-fields") for
+                   name in args.row_fields_]
+    output_headers = [headers[column] for column in columns]
+    if args.row_index:
+        output_headers.insert(0, "index")
+    with open(args.predictions, "w", 0) as output_file:
+        output = csv.writer(output_file, lineterminator="\n")
+        if args.sample_header:
+            output.writerow([header.encode(u.FILE_ENCODING) for header in
+                             output_headers])
+        for index, row in selected:
+            output_row = [(row[column] if column < len(row) else u"").encode(
+                u.FILE_ENCODING) for column in columns]
+            if args.row_index:
+                output_row.insert(0, index)
+            output.writerow(output_row)
+    if args.stat_field or args.stat_fields:
+        with open(os.path.join(path, "stat_info.json"), "w") as stat_file:
+            json.dump(stat_info(rows, headers, args), stat_file)
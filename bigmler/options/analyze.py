@@ -31,6 +31,13 @@ MAXIMIZE_OPTIONS = [ACCURACY, "precision", "recall", "phi", "f_measure",
                     "r_squared"]
 OPTIMIZE_OPTIONS = [ACCURACY, "precision", "recall", "phi", "f_measure",
                     "mean_squared_error", "mean_absolute_error", "r_squared"]
+LINEAR_SEARCH = "linear"
+BRACKETING_SEARCH = "bracketing"
+GOLDEN_SEARCH = "golden"
+NODES_SEARCH_OPTIONS = [LINEAR_SEARCH, BRACKETING_SEARCH, GOLDEN_SEARCH]
+RANDOM_SEARCH = "random"
+GRID_SEARCH = "grid"
+HYPERPARAMS_SEARCH_OPTIONS = [RANDOM_SEARCH, GRID_SEARCH]
 
 def get_analyze_options(defaults=None):
     """Adding arguments for the analyze subcommand
@@ -81,8 +88,8 @@ def get_analyze_options(defaults=None):
             "dest": 'staleness',
             "type": float,
             "default": defaults.get('staleness', None),
-            "help": ("Limit staleness when using --features"
-                     " analysis.")},
+            "help": ("Limit staleness when using --features, --nodes"
+                     " or --hyperparams analysis.")},
 
         # Penalty per feature in --features analysis
         '--penalty': {
@@ -164,6 +171,114 @@ def get_analyze_options(defaults=None):
                      " threshold analysis. If not set,"
                      " an increase of 100 is used")},
 
+        # Nodes search: strategy used to find the best node threshold
+        '--nodes-search': {
+            "action": 'store',
+            "dest": 'nodes_search',
+            "choices": NODES_SEARCH_OPTIONS,
+            "default": defaults.get('nodes_search', LINEAR_SEARCH),
+            "help": ("Strategy used to search the best node threshold:"
+                     " linear (stops when the score is stale), bracketing"
+                     " (coarse-to-fine) or golden (golden-section search"
+                     " for unimodal scores).")},
+
+        # Max number of k-fold datasets to be created in parallel
+        '--max-parallel-datasets': {
+            "action": 'store',
+            "dest": 'max_parallel_datasets',
+            "type": int,
+            "default": defaults.get('max_parallel_datasets', 1),
+            "help": "Max number of k-fold datasets created in parallel."},
+
+        # Max number of candidates to evaluate in parallel
+        '--max-parallel-candidates': {
+            "action": 'store',
+            "dest": 'max_parallel_candidates',
+            "type": int,
+            "default": defaults.get('max_parallel_candidates', 1),
+            "help": ("Max number of candidate feature subsets, node"
+                     " thresholds or trials whose k-fold cross-validation"
+                     " is evaluated in parallel in --features, --nodes"
+                     " and --hyperparams analysis.")},
+
+        # Screening folds: number of k-fold datasets used in each screening
+        # round of the --features analysis
+        '--screening-folds': {
+            "action": 'store',
+            "dest": 'screening_folds',
+            "default": defaults.get('screening_folds', None),
+            "help": ("Comma-separated list of the number of k-fold datasets"
+                     " used to screen the candidate feature subsets in each"
+                     " round before their full k-fold cross-validation in"
+                     " --features analysis.")},
+
+        # Screening rate: fraction of candidates promoted in each screening
+        # round
+        '--screening-rate': {
+            "action": 'store',
+            "dest": 'screening_rate',
+            "type": float,
+            "default": defaults.get('screening_rate', None),
+            "help": ("Fraction of the screened candidates promoted to the"
+                     " next round in --features analysis. If not set,"
+                     " 0.5 is used.")},
+
+        # Warm start: directory of a previous --features analysis whose
+        # feature subsets are used to start the search
+        '--warm-start': {
+            "action": 'store',
+            "dest": 'warm_start',
+            "default": defaults.get('warm_start', None),
+            "help": ("Output directory of a previous --features analysis"
+                     " (or its features_sets.csv file). Its scored feature"
+                     " subsets are used to start the search.")},
+
+        # Importance seed: the field importances of a baseline model seed
+        # and order the --features analysis search
+        '--importance-seed': {
+            "action": 'store_true',
+            "dest": 'importance_seed',
+            "default": defaults.get('importance_seed', False),
+            "help": ("Uses the field importances of a model built with all"
+                     " the features to seed and order the --features"
+                     " analysis search.")},
+
+        # Hyperparams: Set on the model and ensemble options analysis
+        '--hyperparams': {
+            "action": 'store_true',
+            "dest": 'hyperparams',
+            "default": defaults.get('hyperparams', False),
+            "help": "Model and ensemble options analysis."},
+
+        # Hyperparams search: strategy used to choose the trials
+        '--hyperparams-search': {
+            "action": 'store',
+            "dest": 'hyperparams_search',
+            "choices": HYPERPARAMS_SEARCH_OPTIONS,
+            "default": defaults.get('hyperparams_search', RANDOM_SEARCH),
+            "help": ("Strategy used to choose the trials in --hyperparams"
+                     " analysis: random or grid.")},
+
+        # Hyperparams space: JSON file with the values to be tried for
+        # each option
+        '--hyperparams-space': {
+            "action": 'store',
+            "dest": 'hyperparams_space',
+            "default": defaults.get('hyperparams_space', None),
+            "help": ("Path to a JSON file that contains the list of values"
+                     " to be tried for each option in --hyperparams"
+                     " analysis.")},
+
+        # Max trials: maximum number of trials in --hyperparams analysis
+        '--max-trials': {
+            "action": 'store',
+            "dest": 'max_trials',
+            "type": int,
+            "default": defaults.get('max_trials', None),
+            "help": ("Maximum number of trials in --hyperparams analysis."
+                     " If not set, 20 random trials or the entire grid"
+                     " are used.")},
+
         # Exclude some features from the features analyze
         '--exclude-features': {
             "action": 'store',
@@ -108,6 +108,50 @@ def get_anomaly_options(defaults=None):
             'help': ("Path to a json file describing batch anomaly score"
                      " attributes.")},
 
+        # Number of processes used to compute local anomaly scores
+        '--jobs': {
+            'action': 'store',
+            'dest': 'jobs',
+            'type': int,
+            'default': defaults.get('jobs', 1),
+            'help': ("Number of parallel processes used to compute the"
+                     " local anomaly scores.")},
+
+        # Only the rows with the highest local anomaly scores are stored
+        '--anomaly-top': {
+            'action': 'store',
+            'dest': 'anomaly_top',
+            'type': int,
+            'default': defaults.get('anomaly_top', None),
+            'help': ("Number of test rows with the highest local anomaly"
+                     " scores to be stored, sorted by score.")},
+
+        # Only the rows whose local anomaly score reaches the threshold
+        # are stored
+        '--anomaly-threshold': {
+            'action': 'store',
+            'dest': 'anomaly_threshold',
+            'type': float,
+            'default': defaults.get('anomaly_threshold', None),
+            'help': ("Minimum local anomaly score of the test rows to be"
+                     " stored.")},
+
+        # Only checks whether the local anomaly scores reach the threshold
+        '--anomaly-flag': {
+            'action': 'store_true',
+            'dest': 'anomaly_flag',
+            'default': defaults.get('anomaly_flag', False),
+            'help': ("Stores whether the local anomaly score of each test"
+                     " row reaches the --anomaly-threshold and the score"
+                     " bound that proves it, instead of the score.")},
+
+        # Stores the local anomaly scores (as opposed to --anomaly-flag)
+        '--no-anomaly-flag': {
+            'action': 'store_false',
+            'dest': 'anomaly_flag',
+            'default': defaults.get('anomaly_flag', False),
+            'help': "Stores the local anomaly scores."},
+
         # Creates scores using the training dataset for the anomaly detector
         '--score': {
             'action': 'store_true',
@@ -102,6 +102,15 @@ def get_cluster_options(defaults=None):
                      " related datasets will be generated. All datasets "
                      "will be generated if empty.")},
 
+        # Max number of cluster datasets to be created in parallel
+        '--max-parallel-datasets': {
+            'action': 'store',
+            'dest': 'max_parallel_datasets',
+            'type': int,
+            'default': defaults.get('max_parallel_datasets', 1),
+            'help': ("Max number of --cluster-datasets created in"
+                     " parallel.")},
+
         # The seed to be used in cluster building.
         '--cluster-seed': {
             'action': 'store',
@@ -109,6 +118,14 @@ def get_cluster_options(defaults=None):
             'default': defaults.get('cluster_seed', None),
             'help': "The seed to be used in cluster building."},
 
+        # Adds the distance to the centroid to local centroid predictions.
+        '--centroid-distance': {
+            'action': 'store_true',
+            'dest': 'centroid_distance',
+            'default': defaults.get('centroid_distance', False),
+            'help': ("Adds the distance to the centroid to the local"
+                     " centroid predictions.")},
+
         # The path to a file containing batch prediction attributes.
         '--batch-centroid-attributes': {
             'action': 'store',
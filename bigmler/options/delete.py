@@ -182,6 +182,32 @@ def get_delete_options(defaults=None):
             'default': defaults.get('dry_run', False),
             'help': "Deletes the ids retrieved to be deleted."},
 
+        # Max number of resources to be deleted in parallel.
+        '--max-parallel-deletes': {
+            'action': 'store',
+            'dest': 'max_parallel_deletes',
+            'type': int,
+            'default': defaults.get('max_parallel_deletes', 10),
+            'help': "Max number of resources to be deleted in parallel."},
+
+        # Max number of delete requests per second.
+        '--delete-rate': {
+            'action': 'store',
+            'dest': 'delete_rate',
+            'type': float,
+            'default': defaults.get('delete_rate', None),
+            'help': ("Max number of delete requests per second. Not"
+                     " limited by default.")},
+
+        # Number of retries for the failed deletes.
+        '--delete-retries': {
+            'action': 'store',
+            'dest': 'delete_retries',
+            'type': int,
+            'default': defaults.get('delete_retries', 3),
+            'help': ("Number of retries, with exponential backoff, when"
+                     " the API is busy or fails to delete.")},
+
         # Retrieves the ids of the resources that have been logged in the
         # directory to add them to the delete list.
         '--from-dir': {
@@ -172,6 +172,14 @@ def get_main_options(defaults=None, constants=None):
             'action': 'store_true',
             'help': "Evaluate command."},
 
+        # Evaluates using local predictions instead of remote evaluations.
+        '--local-evaluation': {
+            'action': 'store_true',
+            'dest': 'local_evaluation',
+            'default': defaults.get('local_evaluation', False),
+            'help': ("Evaluates using local predictions. The test datasets"
+                     " are downloaded as CSV files.")},
+
         # Max number of models to create in parallel.
         '--max-parallel-models': {
             "action": 'store',
@@ -186,8 +194,8 @@ def get_main_options(defaults=None, constants=None):
             "dest": 'max_parallel_evaluations',
             "default": defaults.get('max_parallel_evaluations', 1),
             "type": int,
-            "help": ("Max number of evaluations to create in"
-                     " parallel.")},
+            "help": ("Max number of evaluations to create and"
+                     " retrieve in parallel.")},
 
         # The name of the field that represents the objective field (i.e.,
         # class or label) or its column number.
@@ -226,6 +234,38 @@ def get_main_options(defaults=None, constants=None):
             'help': ("Number of evaluations used for"
                      " cross-validation.")},
 
+        # Tolerance of the adaptive cross-validation
+        '--cross-validation-tolerance': {
+            'action': 'store',
+            'dest': 'cv_tolerance',
+            'type': float,
+            'default': defaults.get('cv_tolerance', None),
+            'help': ("Creates the cross-validation evaluations in waves"
+                     " until the half width of the 95% confidence interval"
+                     " of the metric is below this tolerance.")},
+
+        # Number of models and evaluations in each wave of the adaptive
+        # cross-validation
+        '--cross-validation-wave': {
+            'action': 'store',
+            'dest': 'cv_wave',
+            'type': int,
+            'default': defaults.get('cv_wave', 5),
+            'help': ("Number of models and evaluations created in each"
+                     " wave of the adaptive cross-validation.")},
+
+        # Metric used to stop the adaptive cross-validation
+        '--cross-validation-metric': {
+            'action': 'store',
+            'dest': 'cv_metric',
+            'choices': ["accuracy", "precision", "recall", "phi",
+                        "f_measure", "mean_squared_error",
+                        "mean_absolute_error", "r_squared"],
+            'default': defaults.get('cv_metric', None),
+            'help': ("Evaluation measure whose confidence interval stops"
+                     " the adaptive cross-validation. Accuracy or r_squared"
+                     " are used by default.")},
+
         # If a BigML ensemble is provided, the script will use it to generate
         # predictions.
         '--ensemble': {
@@ -28,6 +28,15 @@ def get_sample_options(defaults=None):
         defaults = {}
 
     options = {
+        # Samples the local training file instead of creating a remote
+        # sample.
+        '--local-sample': {
+            'action': 'store_true',
+            'dest': 'local_sample',
+            'default': defaults.get('local_sample', False),
+            'help': ("The sample rows and statistics are computed locally"
+                     " from the CSV file in --train.")},
+
         # Input fields to include in the sample.
         '--sample-fields': {
             "action": 'store',
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 BigML
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Bounded parallel execution of tasks for BigMLer
+
+"""
+from __future__ import absolute_import
+
+import sys
+import time
+import threading
+import Queue
+
+# seconds to wait for a result before checking again (keeps the main thread
+# responsive to keyboard interrupts)
+RESULTS_WAIT = 1
+
+
+def run_in_parallel(function, arguments_list, max_parallel=1, ordered=True):
+    """Runs `function` once per element in `arguments_list` using up to
+       `max_parallel` threads and yields (index, result) pairs, where index
+       is the position of the arguments in the list. If `ordered` the pairs
+       are yielded in the list order, otherwise in completion order.
+
+       Errors (including the `sys.exit` calls used all over BigMLer) raised in
+       a thread are raised again in the caller, and no new tasks are started
+       after an error or after the caller stops iterating.
+
+    """
+    arguments_list = [arguments if isinstance(arguments, tuple)
+                      else (arguments,) for arguments in arguments_list]
+    if max_parallel is None or max_parallel < 2 or len(arguments_list) < 2:
+        for index, arguments in enumerate(arguments_list):
+            yield index, function(*arguments)
+        return
+
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    for index, arguments in enumerate(arguments_list):
+        tasks.put((index, arguments))
+
+    def worker():
+        """Runs tasks till the tasks queue is empty
+
+        """
+        while True:
+            try:
+                index, arguments = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results.put((index, True, function(*arguments)))
+            except BaseException:
+                results.put((index, False, sys.exc_info()))
+
+    for _ in range(min(max_parallel, len(arguments_list))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    finished = {}
+    next_index = 0
+    try:
+        for _ in range(len(arguments_list)):
+            while True:
+                try:
+                    index, success, result = results.get(True, RESULTS_WAIT)
+                    break
+                except Queue.Empty:
+                    pass
+            if not success:
+                raise result[0], result[1], result[2]
+            if not ordered:
+                yield index, result
+                continue
+            finished[index] = result
+            while next_index in finished:
+                yield next_index, finished.pop(next_index)
+                next_index += 1
+    finally:
+        # discarding the tasks that have not been started yet
+        try:
+            while True:
+                tasks.get_nowait()
+        except Queue.Empty:
+            pass
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket that limits the rate of calls to `rate` per
+       second, allowing bursts of up to `capacity` calls
+
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits till a token is available and takes it
+
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
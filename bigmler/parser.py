@@ -130,7 +130,8 @@ under the License.""" % version
         '--randomize': main_options['--randomize'],
         '--no-csv': main_options['--no-csv'],
         '--no-no-csv': main_options['--no-no-csv'],
-        '--to-dataset': main_options['--to-dataset']})
+        '--to-dataset': main_options['--to-dataset'],
+        '--local-evaluation': main_options['--local-evaluation']})
 
     defaults = general_defaults["BigMLer cluster"]
     subcommand_options["cluster"] = get_cluster_options(defaults=defaults)
@@ -209,6 +210,6 @@ under the License.""" % version
         "--max-parallel-evaluations", "--objective", "--tag",
         "--no-tag", "--no-debug", "--no-dev", "--model-fields", "--balance",
         "--verbosity", "--resume", "--stack_level", "--no-balance",
-        "--args-separator", "--name"]
+        "--args-separator", "--name", "--local-evaluation"]
 
     return main_parser, chained_options
@@ -153,6 +153,13 @@ def parse_and_check(command):
     except AttributeError:
         pass
 
+    try:
+        if command_args.cv_wave < 1:
+            parser.error("--cross-validation-wave needs a positive number"
+                         " of models.")
+    except AttributeError:
+        pass
+
     try:
         if command_args.max_categories and (
                 non_compatible(command_args, '--max-categories')):
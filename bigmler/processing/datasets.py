@@ -148,7 +148,8 @@ def dataset_processing(source, api, args, resume,
     datasets = []
     dataset = None
     if (args.training_set or args.source or (
-            hasattr(args, "evaluate") and args.evaluate and args.test_set)):
+            hasattr(args, "evaluate") and args.evaluate and args.test_set
+            and not r.local_test(args))):
         # if resuming, try to extract args.dataset form log files
         if resume:
             message = u.dated("Dataset not found. Resuming.\n")
@@ -162,7 +163,8 @@ def dataset_processing(source, api, args, resume,
     if ((source and not args.has_datasets_ and not args.has_models_
          and not args.no_dataset) or
             (hasattr(args, "evaluate") and args.evaluate and
-             args.test_set and not args.dataset)):
+             args.test_set and not args.dataset and
+             not r.local_test(args))):
         dataset_args = r.set_dataset_args(args, fields,
                                           multi_label_data=multi_label_data)
         dataset = r.create_dataset(source, dataset_args, args, api,
@@ -34,6 +34,16 @@ from bigmler.processing.ensembles import (ensemble_processing,
 MONTECARLO_FACTOR = 200
 
 
+def cross_validation_rounds(args):
+    """Maximum number of models and evaluations in the Monte-Carlo
+       cross-validation
+
+    """
+    if args.number_of_evaluations > 0:
+        return args.number_of_evaluations
+    return int(MONTECARLO_FACTOR * args.cross_validation_rate)
+
+
 def model_per_label(labels, datasets, api, args, resume, fields=None,
                     multi_label_data=None,
                     session_file=None, path=None, log=None):
@@ -122,11 +132,12 @@ def models_processing(datasets, models, model_ids,
             # Cross-validation case: we create 2 * n models to be validated
             # holding out an n% of data
             if args.cross_validation_rate > 0:
-                if args.number_of_evaluations > 0:
-                    args.number_of_models = args.number_of_evaluations
-                else:
-                    args.number_of_models = int(MONTECARLO_FACTOR *
-                                                args.cross_validation_rate)
+                args.number_of_models = cross_validation_rounds(args)
+                # adaptive cross-validation creates the rest of models in
+                # waves while evaluating
+                if args.cv_tolerance:
+                    args.number_of_models = min(args.cv_wave,
+                                                args.number_of_models)
             if resume:
                 resume, model_ids = c.checkpoint(
                     c.are_models_created, path, args.number_of_models,
@@ -138,6 +149,10 @@ def models_processing(datasets, models, model_ids,
                     u.log_message(message, log_file=session_file,
                                   console=args.verbosity)
 
+                if args.cv_tolerance:
+                    # the models of later waves are recovered when
+                    # cross-validating
+                    model_ids = model_ids[0: args.number_of_models]
                 models = model_ids
                 args.number_of_models -= len(model_ids)
             model_args = r.set_model_args(args,
@@ -109,7 +109,8 @@ def source_processing(api, args, resume,
     source = None
     fields = None
     if (args.training_set or (
-            hasattr(args, "evaluate") and args.evaluate and args.test_set)):
+            hasattr(args, "evaluate") and args.evaluate and args.test_set
+            and not r.local_test(args))):
         # If resuming, try to extract args.source form log files
 
         if resume:
@@ -292,13 +292,23 @@ def data_to_source(args):
         data_set = args.training_set
         data_set_header = args.train_header
     elif (hasattr(args, 'evaluate') and args.evaluate and args.test_set
-          and not args.source):
+          and not args.source and not local_test(args)):
         data_set = args.test_set
         data_set_header = args.test_header
 
     return data_set, data_set_header
 
 
+def local_test(args):
+    """Checks whether the test file is to be evaluated locally, with no
+       source or dataset created for it
+
+    """
+    return (hasattr(args, 'evaluate') and args.evaluate and
+            getattr(args, 'local_evaluation', False) and
+            isinstance(args.test_set, basestring) and not args.test_split)
+
+
 def get_source(source, api=None, verbosity=True,
                session_file=None):
     """Retrieves the source in its actual state and its field info
@@ -603,8 +613,9 @@ def set_label_model_args(args, fields, labels, multi_label_data):
 
 def create_models(datasets, model_ids, model_args,
                   args, api=None, path=None,
-                  session_file=None, log=None):
-    """Create remote models
+                  session_file=None, log=None, seed_offset=0):
+    """Create remote models. In cross-validation, `seed_offset` is the
+       number of models created before, whose seeds have been used
 
     """
     if api is None:
@@ -640,7 +651,8 @@ def create_models(datasets, model_ids, model_args,
                 if model_args_list:
                     model_args = model_args_list[i]
                 if args.cross_validation_rate > 0:
-                    new_seed = get_basic_seed(i + existing_models)
+                    new_seed = get_basic_seed(i + existing_models +
+                                              seed_offset)
                     model_args.update(seed=new_seed)
                 # one model per dataset (--max-categories or single model)
                 if (args.max_categories or
@@ -989,6 +1001,27 @@ def map_fields(fields_map, model_fields, dataset_fields):
     return update_map
 
 
+def out_of_bag_evaluation(args):
+    """Returns whether the evaluation uses the out of bag rows of the
+       training dataset, because no other test data is provided
+
+    """
+    # Two cases to use out_of_bag and sample_rate: standard evaluations where
+    # only the training set is provided, and cross_validation
+    # [--dataset|--test] [--model|--models|--model-tag|--ensemble] --evaluate
+    if ((args.dataset or args.test_set)
+            and (args.model or args.models or args.model_tag or
+                 (args.ensemble and args.number_of_models == 1))):
+        return False
+    # [--train|--dataset] --test-split --evaluate
+    if args.test_split > 0 and (args.training_set or args.dataset):
+        return False
+    # --datasets --test-datasets
+    if args.datasets and (args.test_datasets or args.dataset_off):
+        return False
+    return True
+
+
 def set_evaluation_args(args, fields=None,
                         dataset_fields=None, name=None):
     """Return evaluation args dict
@@ -1014,18 +1047,7 @@ def set_evaluation_args(args, fields=None,
         evaluation_args.update(missing_strategy=args.missing_strategy)
 
     update_attributes(evaluation_args, args.json_args.get('evaluation'))
-    # Two cases to use out_of_bag and sample_rate: standard evaluations where
-    # only the training set is provided, and cross_validation
-    # [--dataset|--test] [--model|--models|--model-tag|--ensemble] --evaluate
-    if ((args.dataset or args.test_set)
-            and (args.model or args.models or args.model_tag or
-                 (args.ensemble and args.number_of_models == 1))):
-        return evaluation_args
-    # [--train|--dataset] --test-split --evaluate
-    if args.test_split > 0 and (args.training_set or args.dataset):
-        return evaluation_args
-    # --datasets --test-datasets
-    if args.datasets and (args.test_datasets or args.dataset_off):
+    if not out_of_bag_evaluation(args):
         return evaluation_args
     if args.sample_rate == 1:
         args.sample_rate = EVALUATE_SAMPLE_RATE
@@ -1376,20 +1398,21 @@ def get_clusters(cluster_ids, args, api=None, session_file=None):
     if api is None:
         api = bigml.api.BigML()
     cluster_id = ""
-    clusters = cluster_ids
     cluster_id = cluster_ids[0]
     message = dated("Retrieving %s. %s\n" %
                     (plural("cluster", len(cluster_ids)),
                      get_url(cluster_id)))
     log_message(message, log_file=session_file, console=args.verbosity)
-    # only one cluster to predict at present
-    try:
-        query_string = FIELDS_QS
-        cluster = check_resource(cluster_ids[0], api.get_cluster,
-                                 query_string=query_string)
-    except ValueError, exception:
-        sys.exit("Failed to get a finished cluster: %s" % str(exception))
-    clusters[0] = cluster
+    # all the clusters are used to find the centroids of the test rows
+    clusters = []
+    for cluster_id in cluster_ids:
+        try:
+            query_string = FIELDS_QS
+            cluster = check_resource(cluster_id, api.get_cluster,
+                                     query_string=query_string)
+        except ValueError, exception:
+            sys.exit("Failed to get a finished cluster: %s" % str(exception))
+        clusters.append(cluster)
 
     return clusters, cluster_ids
 
@@ -1650,20 +1673,21 @@ def get_anomalies(anomaly_ids, args, api=None, session_file=None):
     if api is None:
         api = bigml.api.BigML()
     anomaly_id = ""
-    anomalies = anomaly_ids
     anomaly_id = anomaly_ids[0]
     message = dated("Retrieving %s. %s\n" %
                     (plural("anomaly detector", len(anomaly_ids)),
                      get_url(anomaly_id)))
     log_message(message, log_file=session_file, console=args.verbosity)
-    # only one anomaly to predict at present
-    try:
-        query_string = FIELDS_QS
-        anomaly = api.check_resource(anomaly_ids[0],
-                                     query_string=query_string)
-    except ValueError, exception:
-        sys.exit("Failed to get a finished anomaly: %s" % str(exception))
-    anomalies[0] = anomaly
+    # all the anomaly detectors are used to score the test rows
+    anomalies = []
+    for anomaly_id in anomaly_ids:
+        try:
+            query_string = FIELDS_QS
+            anomaly = api.check_resource(anomaly_id,
+                                         query_string=query_string)
+        except ValueError, exception:
+            sys.exit("Failed to get a finished anomaly: %s" % str(exception))
+        anomalies.append(anomaly)
 
     return anomalies, anomaly_ids
 
@@ -33,6 +33,7 @@ from bigmler.command import get_stored_command
 from bigmler.dispatcher import (SESSIONS_LOG, command_handling,
                                 clear_log_files)
 from bigmler.sampleoutput import sample_file
+from bigmler.local_sample import local_sample_file
 from bigmler.reports import clear_reports, upload_reports
 
 COMMAND_LOG = u".bigmler_sample"
@@ -143,6 +144,16 @@ def compute_output(api, args):
         # If --clear_logs the log files are cleared
         clear_log_files([log])
 
+    if args.local_sample:
+        # the sample is extracted from the local training file
+        if not args.training_set or not os.path.isfile(args.training_set):
+            sys.exit("--local-sample needs a local CSV file in --train.")
+        local_sample_file(args.training_set, args, path,
+                          session_file=session_file)
+        u.print_generated_files(path, log_file=session_file,
+                                verbosity=args.verbosity)
+        return
+
     # basic pre-sample step: creating or retrieving the source related info
     source, resume, csv_properties, fields = pms.get_source_info(
         api, args, resume, csv_properties, session_file, path, log)
@@ -192,7 +203,7 @@ def compute_output(api, args):
         fields = psa.get_sample_fields(sample, csv_properties, args)
 
     sample_file(samples[0], fields, args, api, path=path,
-                session_file=session_file)
+                session_file=session_file, resume=resume)
 
     u.print_generated_files(path, log_file=session_file,
                             verbosity=args.verbosity)
@@ -21,15 +21,23 @@ from __future__ import absolute_import
 import csv
 import json
 import os
+import hashlib
 
 
+import bigmler.utils as u
 import bigmler.resources as r
 
+from bigmler.parallel import run_in_parallel
+
 
 STAT_KEYS = ["spearman_correlation", "pearson_correlation", "slope",
              "intercept", "spearman_correlations", "pearson_correlations",
              "slopes", "intercepts"]
 LINEAR_MODE = "linear"
+RANDOM_MODE = "random"
+# rows retrieved in each sample request when --rows is bigger
+SAMPLE_WINDOW = 1000
+MAX_PARALLEL_WINDOWS = 4
 
 def translate_to_id(value, fields):
     """Tries to translate to the corresponding id a field name maybe
@@ -61,9 +69,10 @@ def translate_to_id(value, fields):
         return ids
 
 
-def sample_query_string(args, fields):
+def sample_query_string(args, fields, paged=False):
     """Builds the query string to be used in GET calls to retrieve the
-       sample output
+       sample output. When `paged`, the rows and row offset are left to
+       each window of rows.
 
     """
     query_string = []
@@ -80,9 +89,9 @@ def sample_query_string(args, fields):
         query_string.append('occurrence=true')
     if args.precision is not None:
         query_string.append('precision=%s'% args.precision)
-    if args.rows:
+    if args.rows and not paged:
         query_string.append('rows=%s' % args.rows)
-    if args.row_offset:
+    if args.row_offset and not paged:
         query_string.append('row_offset=%s' % args.row_offset)
     if args.row_order_by:
         if args.mode is None:
@@ -112,27 +121,48 @@ def sample_query_string(args, fields):
     return ";".join(query_string)
 
 
-def sample_file(sample, fields, args, api, path=None, session_file=None):
+def sample_headers(sample_fields, args):
+    """Headers of the sample file
+
+    """
+    headers = [field['name'] for field in sample_fields]
+    if args.row_index or args.occurrence:
+        new_headers = []
+        if args.row_index:
+            new_headers.append("index")
+        if args.occurrence:
+            new_headers.append("occurrences")
+        new_headers.extend(headers)
+        headers = new_headers
+    return headers
+
+
+def is_paged(args):
+    """Checks whether the sample rows are retrieved in windows. The
+       unique rows and statistics must be computed on the entire sample.
+
+    """
+    return (args.rows is not None and args.rows > SAMPLE_WINDOW and
+            not (args.unique or args.stat_field or args.stat_fields))
+
+
+def sample_file(sample, fields, args, api, path=None, session_file=None,
+                resume=False):
     """Creates a file for each sample with the sample rows.
 
     """
+    if is_paged(args):
+        return paged_sample_file(sample, fields, args, api,
+                                 session_file=session_file, resume=resume)
     query_string = sample_query_string(args, fields)
     sample = r.get_samples([sample], args, api,
                             session_file=session_file,
                             query_string=query_string)[0][0]
     output = args.predictions
     output = csv.writer(open(output, 'w', 0), lineterminator="\n")
-    headers = [field['name'] for field in sample['object']['sample']['fields']]
     if args.sample_header:
-        if args.row_index or args.occurrence:
-            new_headers = []
-            if args.row_index:
-                new_headers.append("index")
-            if args.occurrence:
-                new_headers.append("occurrences")
-                new_headers.extend(headers)
-            headers = new_headers
-        output.writerow(headers)
+        output.writerow(sample_headers(sample['object']['sample']['fields'],
+                                       args))
     for row in sample['object']['sample']['rows']:
         output.writerow(row)
     if args.stat_field or args.stat_fields:
@@ -143,3 +173,95 @@ def sample_file(sample, fields, args, api, path=None, session_file=None):
                 stat_info[key] = sample_obj[key]
         with open(os.path.join(path, "stat_info.json"), "w") as stat_file:
             json.dump(stat_info, stat_file)
+
+
+def written_rows(output, header):
+    """Number of complete rows in a partially written sample file. Rows are
+       parsed as CSV, so quoted values can contain new lines. An incomplete
+       last row is removed.
+
+    """
+    with open(output, "rb+") as output_file:
+        contents = output_file.read()
+        # the text after the last new line is incomplete
+        lines = contents.split("\n")[0: -1]
+        consumed = [0]
+
+        def complete_lines():
+            """Lines that end in a new line, counting the bytes read. A last
+               empty line is added to find out whether the last row is cut
+               inside a quoted value.
+
+            """
+            for line in lines:
+                consumed[0] += len(line) + 1
+                yield line + "\n"
+            consumed[0] = None
+            yield "\n"
+
+        rows, end = 0, 0
+        for _ in csv.reader(complete_lines(), lineterminator="\n"):
+            if consumed[0] is None:
+                # rows that need the added line are not complete
+                break
+            rows += 1
+            end = consumed[0]
+        if end < len(contents):
+            output_file.seek(0)
+            output_file.truncate()
+            output_file.write(contents[0: end])
+    return max(rows - 1, 0) if header else rows, rows > 0
+
+
+def get_window(sample, args, api, session_file, query_string, row_offset,
+               rows):
+    """Retrieves a window of `rows` sample rows starting at `row_offset`
+
+    """
+    query_string = ";".join([query for query in [
+        query_string, "rows=%s" % rows, "row_offset=%s" % row_offset]
+                             if query])
+    return r.get_samples([sample], args, api, session_file=session_file,
+                         query_string=query_string)[0][0]
+
+
+def paged_sample_file(sample, fields, args, api, session_file=None,
+                      resume=False):
+    """Writes the sample rows to the output file retrieving windows of
+       SAMPLE_WINDOW rows, MAX_PARALLEL_WINDOWS at a time. Each window is
+       written as soon as the previous ones are. When resuming, the rows
+       already in the output file are not retrieved again.
+
+    """
+    output = args.predictions
+    if args.mode == RANDOM_MODE and not args.seed:
+        # every window must be extracted from the same random sample
+        args.seed = hashlib.md5(os.path.abspath(output)).hexdigest()
+    query_string = sample_query_string(args, fields, paged=True)
+    written, header_written = 0, False
+    if resume and os.path.exists(output):
+        written, header_written = written_rows(output, args.sample_header)
+        message = u.dated("Found %s sample rows. Resuming.\n" % written)
+        u.log_message(message, log_file=session_file,
+                      console=args.verbosity)
+    row_offset = args.row_offset or 0
+    windows = [(sample, args, api, session_file, query_string,
+                row_offset + offset, min(SAMPLE_WINDOW, args.rows - offset))
+               for offset in range(written, args.rows, SAMPLE_WINDOW)]
+    with open(output, 'a' if written or header_written else 'w',
+              0) as output_file:
+        output = csv.writer(output_file, lineterminator="\n")
+        for start in range(0, len(windows), MAX_PARALLEL_WINDOWS):
+            chunk = windows[start: start + MAX_PARALLEL_WINDOWS]
+            for index, window in run_in_parallel(
+                    get_window, chunk, max_parallel=MAX_PARALLEL_WINDOWS):
+                sample_obj = window['object']['sample']
+                if args.sample_header and not header_written:
+                    output.writerow(sample_headers(sample_obj['fields'],
+                                                   args))
+                    header_written = True
+                for row in sample_obj['rows']:
+                    output.writerow(row)
+                # a short window means there are no more rows
+                if len(sample_obj['rows']) < chunk[index][-1]:
+                    return
@@ -75,6 +75,7 @@ class TestReader(object):
         self.headers = None
         self.raw_headers = None
         self.exclude = []
+        self.columns_cache = {}
         if test_set_header:
             self.headers = self.test_reader.next()
             # validate headers against model fields excluding objective_field,
@@ -146,12 +147,41 @@ class TestReader(object):
                 headers = self.raw_headers
             else:
                 headers = [self.fields.fields_by_column_number[column] for
-                           column in self.fields.columns]
+                           column in self.fields.fields_columns]
             return dict(zip(headers, new_row))
         for index in self.exclude:
             del new_row[index]
         return self.fields.pair(new_row, self.headers, self.objective_field)
 
+    def input_columns(self, row, local_model):
+        """Pairs of field id and column of the fields of the local model
+           in rows of the same length as `row`, as used in `dict`
+
+        """
+        key = (len(row), id(local_model))
+        if key not in self.columns_cache:
+            keys = self.dict(range(len(row)), filtering=False)
+            if self.test_set_header:
+                keys = dict([(local_model.inverted_fields[name], column) for
+                             name, column in keys.items() if
+                             name in local_model.inverted_fields])
+            self.columns_cache[key] = [(field_id, column) for
+                                       field_id, column in keys.items() if
+                                       field_id in local_model.fields]
+        return self.columns_cache[key]
+
+    def matches_columns(self, local_model):
+        """Checks whether the fields of the local model are in the columns
+           used to read the test rows. Without headers, the columns are
+           given by the column numbers of the test reader fields.
+
+        """
+        if self.test_set_header:
+            return True
+        columns = self.fields.fields_by_column_number
+        return all([columns.get(field['column_number']) == field_id for
+                    field_id, field in local_model.fields.items()])
+
     def number_of_tests(self):
         """Returns the number of tests in the test file
 
@@ -24,7 +24,9 @@ import fileinput
 import ast
 import glob
 import os
+import re
 import sys
+import time
 import datetime
 
 try:
@@ -36,7 +38,15 @@ import bigml.api
 from bigml.util import console_log, empty_resource
 from bigml.fields import get_fields_structure, Fields
 
+from bigmler.parallel import run_in_parallel, TokenBucket
+
 PAGE_LENGTH = 200
+MAX_PARALLEL_PAGES = 4
+DELETE_RETRIES = 3
+# seconds to wait before the first retry, doubled in each new one
+DELETE_BACKOFF = 1
+DELETE_PROGRESS_STEP = 10
+RESOURCE_TYPE_RE = re.compile(r'^(?:public/|shared/)?([a-z]+)/')
 ATTRIBUTE_NAMES = ['name', 'label', 'description']
 NEW_DIRS_LOG = u".bigmler_dirs"
 BRIEF_MODEL_QS = "exclude=root,fields"
@@ -63,7 +73,7 @@ def read_description(path):
     """Reads a text description from a file.
 
     """
-    return ''.join(fileinput.input([path]))
+    return ''.join(fileinput.FileInput([path]))
 
 
 def read_field_attributes(path):
@@ -107,7 +117,7 @@ def read_types(path):
 
     """
     types_dict = {}
-    for line in fileinput.input([path]):
+    for line in fileinput.FileInput([path]):
         try:
             pair = ast.literal_eval(line)
             types_dict.update({
@@ -156,7 +166,7 @@ def read_fields_map(path):
 
     """
     map_dict = {}
-    for line in fileinput.input([path]):
+    for line in fileinput.FileInput([path]):
         try:
             pair = ast.literal_eval(line)
             map_dict.update({
@@ -179,7 +189,7 @@ def read_resources(path):
 
     """
     resources = []
-    for line in fileinput.input([path]):
+    for line in fileinput.FileInput([path]):
         resources.append(line.rstrip())
     return resources
 
@@ -195,7 +205,7 @@ def read_datasets(path):
 
     """
     datasets = []
-    for line in fileinput.input([path]):
+    for line in fileinput.FileInput([path]):
         datasets.append(line.rstrip())
     return datasets
 
@@ -284,42 +294,120 @@ def read_local_resource(path, csv_properties=None):
     return resource, csv_properties, fields
 
 
-def list_ids(api_function, query_string):
-    """Lists BigML resources filtered by `query_string`.
+def list_page(api_function, query_string, offset):
+    """Lists the page of BigML resources that starts at `offset`.
+
+    """
+    q_s = 'status.code=%s;offset=%s;limit=%s;%s' % (
+        bigml.api.FINISHED, offset, PAGE_LENGTH, query_string)
+    resources = api_function(q_s)
+    return [obj['resource'] for obj in (resources['objects'] or [])]
+
+
+def list_ids(api_function, query_string, max_parallel=MAX_PARALLEL_PAGES):
+    """Lists BigML resources filtered by `query_string`. The first page
+       gives the total count and the rest of pages are retrieved using up
+       to `max_parallel` threads.
 
     """
     q_s = 'status.code=%s;limit=%s;%s' % (
         bigml.api.FINISHED, PAGE_LENGTH, query_string)
     resources = api_function(q_s)
     ids = [obj['resource'] for obj in (resources['objects'] or [])]
-    while (resources['objects'] and
-           (resources['meta']['total_count'] > (resources['meta']['offset'] +
-                                                resources['meta']['limit']))):
-        offset = resources['meta']['offset'] + PAGE_LENGTH
-        q_s = 'status.code=%s;offset=%s;limit=%s;%s' % (
-            bigml.api.FINISHED, offset, PAGE_LENGTH, query_string)
-        resources = api_function(q_s)
-        if resources['objects']:
-            ids.extend([obj['resource'] for obj in resources['objects']])
+    if resources['objects']:
+        meta = resources['meta']
+        offsets = range(meta['offset'] + meta['limit'], meta['total_count'],
+                        PAGE_LENGTH)
+        arguments_list = [(api_function, query_string, offset)
+                          for offset in offsets]
+        for _, page_ids in run_in_parallel(list_page, arguments_list,
+                                           max_parallel=max_parallel):
+            ids.extend(page_ids)
+        # resources created while listing can shift the pages
+        unique_ids = set()
+        ids = [resource_id for resource_id in ids if not
+               (resource_id in unique_ids or unique_ids.add(resource_id))]
     return ids
 
 
-def delete(api, delete_list):
-    """ Deletes the resources given in the list.
+def get_resource_type(resource_id):
+    """Classifies the resource id by its prefix, checking it against the
+       regular expression of its type only. Returns None for invalid ids.
 
     """
-    for resource_id in delete_list:
-        resource_type = None
+    match = RESOURCE_TYPE_RE.match(resource_id)
+    if match is not None:
+        resource_type = match.group(1)
+        resource_re = bigml.api.RESOURCE_RE.get(resource_type)
+        if resource_re is not None and resource_re.match(resource_id):
+            return resource_type
+    return None
+
+
+def delete_resource(api, resource_id, retries=DELETE_RETRIES,
+                    rate_limiter=None):
+    """Deletes a resource, retrying with exponential backoff when the API is
+       busy or fails. Returns True when the resource is deleted or was not
+       found.
+
+    """
+    resource_type = get_resource_type(resource_id)
+    if resource_type is None:
+        return False
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
         try:
-            for resource_type, resource_re in bigml.api.RESOURCE_RE.items():
-                try:
-                    bigml.api.get_resource(resource_re, resource_id)
-                    break
-                except ValueError:
-                    pass
-            api.deleters[resource_type](resource_id)
+            response = api.deleters[resource_type](resource_id)
         except ValueError:
-            console_log("Failed to delete resource %s" % resource_id)
+            return False
+        code = response.get('code')
+        if code in [bigml.api.HTTP_NO_CONTENT, bigml.api.HTTP_NOT_FOUND]:
+            return True
+        if not (code == bigml.api.HTTP_TOO_MANY_REQUESTS or
+                code >= bigml.api.HTTP_INTERNAL_SERVER_ERROR):
+            return False
+        if attempt < retries:
+            time.sleep(DELETE_BACKOFF * 2 ** attempt)
+    return False
+
+
+def delete(api, delete_list, max_parallel=1, rate=None,
+           retries=DELETE_RETRIES, retry_file=None, verbosity=True):
+    """ Deletes the resources given in the list using up to `max_parallel`
+        threads and no more than `rate` deletions per second. The ids of
+        the resources that could not be deleted are appended to
+        `retry_file` and returned.
+
+    """
+    rate_limiter = TokenBucket(rate) if rate else None
+    total = len(delete_list)
+    failed = []
+    start = time.time()
+    arguments_list = [(api, resource_id, retries, rate_limiter)
+                      for resource_id in delete_list]
+    for done, (index, deleted) in enumerate(run_in_parallel(
+            delete_resource, arguments_list, max_parallel=max_parallel,
+            ordered=False)):
+        if not deleted:
+            failed.append(delete_list[index])
+        if verbosity and ((done + 1) % DELETE_PROGRESS_STEP == 0 or
+                          done + 1 == total):
+            elapsed = max(time.time() - start, 1e-6)
+            console_log("Deleted %s of %s resources (%.1f per second,"
+                        " %s failed)" % (done + 1 - len(failed), total,
+                                         (done + 1) / elapsed, len(failed)))
+    if verbosity and total:
+        console_log("\n")
+    if failed:
+        message = "Failed to delete %s resources." % len(failed)
+        if retry_file is not None:
+            with open(retry_file, "a") as retry_handler:
+                retry_handler.write("\n".join(failed) + "\n")
+            message += (" Their ids are stored in %s to retry with"
+                        " --from-file." % retry_file)
+        console_log("%s\n" % message)
+    return failed
 
 
 def check_dir(path):
@@ -328,7 +416,13 @@ def check_dir(path):
     """
     directory = os.path.dirname(path)
     if len(directory) > 0 and not os.path.exists(directory):
-        os.makedirs(directory)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # the directory can be created meanwhile by a parallel task
+            if not os.path.isdir(directory):
+                raise
+            return directory
         sys_log_message(u"%s\n" % os.path.abspath(directory),
                         log_file=NEW_DIRS_LOG)
     return directory
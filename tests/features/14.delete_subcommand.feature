@@ -124,3 +124,14 @@ Feature: Delete resources filtered by user criteria
         Examples:
         | data               | output_dir       | tag1    
         | ../data/iris.csv   | ./scenario_del_9 | my_tag1
+
+
+    Scenario: Successfully grouping the resources to delete in waves:
+        Given I group the resources "<resource_ids>" in delete waves
+        Then the resources are deleted in the waves "<waves>"
+
+        Examples:
+        | resource_ids                                                                                                                                                        | waves                                                                                                              |
+        | source/5540b3e4c0ed0b3b3a000001,dataset/5540b3e4c0ed0b3b3a000002,sample/5540b3e4c0ed0b3b3a000003,model/5540b3e4c0ed0b3b3a000004,prediction/5540b3e4c0ed0b3b3a000005 | predictions, scores and evaluations; models, ensembles, clusters, anomaly detectors and samples; datasets; sources |
+        | dataset/5540b3e4c0ed0b3b3a000002,sample/5540b3e4c0ed0b3b3a000003,dataset/5540b3e4c0ed0b3b3a000002,sample/5540b3e4c0ed0b3b3a000003,dataset/5540b3e4c0ed0b3b3a000001  | models, ensembles, clusters, anomaly detectors and samples; datasets                                               |
+        | project/5540b3e4c0ed0b3b3a000006,source/5540b3e4c0ed0b3b3a000001,library/5540b3e4c0ed0b3b3a000007                                                                   | sources; other resources                                                                                           |
@@ -0,0 +1,27 @@
+Feature: Find the centroids of test data in batches
+    In order to find the centroids of many rows at once
+    I need to create a cluster
+    Then I need to check that the centroid scorer finds the same centroids as the local cluster
+
+    Scenario: Successfully finding the centroids of test data by comparing with every centroid:
+        Given I create BigML resources uploading train "<data>" file to create centroids for "<test>" and log predictions in "<output>"
+        And I check that the source has been created
+        And I check that the dataset has been created
+        And I check that the cluster has been created
+        Then the centroid scorer finds the same centroids as the local cluster for "<test>"
+
+        Examples:
+        | data               | test               | output                           |
+        | ../data/grades.csv | ../data/grades.csv | ./scenario_cs_1/centroids.csv |
+        | ../data/diabetes.csv   | ../data/diabetes.csv   | ./scenario_cs_2/centroids.csv   |
+
+    Scenario: Successfully finding the centroids of test data using the centroids index:
+        Given I create BigML resources uploading train "<data>" file to create <k> centroids for "<test>" and log predictions in "<output>"
+        And I check that the source has been created
+        And I check that the dataset has been created
+        And I check that the cluster has been created
+        Then the indexed centroid scorer finds the same centroids as the local cluster for "<test>"
+
+        Examples:
+        | data                 | k   | test                 | output                        |
+        | ../data/diabetes.csv | 150 | ../data/diabetes.csv | ./scenario_cs_3/centroids.csv |
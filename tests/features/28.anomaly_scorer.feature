@@ -0,0 +1,80 @@
+Feature: Compute the anomaly scores of test data in batches
+    In order to compute the anomaly scores of many rows at once
+    I need to create an anomaly detector
+    Then I need to check that the anomaly scorer gives the same scores as the local anomaly detector
+
+    Scenario: Successfully computing the anomaly scores of test data:
+        Given I create BigML resources uploading train "<data>" file to create anomaly scores for "<test>" and log predictions in "<output>"
+        And I check that the source has been created
+        And I check that the dataset has been created
+        And I check that the anomaly detector has been created
+        Then the anomaly scorer gives the same scores as the local anomaly detector for "<test>"
+
+        Examples:
+        | data                 | test                 | output                               |
+        | ../data/tiny_kdd.csv | ../data/test_kdd.csv | ./scenario_as_1/anomaly_scores.csv |
+
+    Scenario: Successfully flagging the test data whose anomaly score reaches a threshold:
+        Given I create BigML resources uploading train "<data>" file to create anomaly scores for "<test>" and log predictions in "<output>"
+        And I check that the source has been created
+        And I check that the dataset has been created
+        And I check that the anomaly detector has been created
+        Then the anomaly scorer flags the rows whose score reaches <threshold> in "<test>"
+
+        Examples:
+        | data                 | test                 | output                               | threshold |
+        | ../data/tiny_kdd.csv | ../data/test_kdd.csv | ./scenario_as_2/anomaly_scores.csv | 0.5       |
+        | ../data/tiny_kdd.csv | ../data/test_kdd.csv | ./scenario_as_3/anomaly_scores.csv | 0.6       |
+
+    Scenario: Successfully computing the same local anomaly scores with several jobs:
+        Given I have the local anomaly detector in "<anomaly>"
+        When I compute the local anomaly scores of "<test>" in "<output>" using options "<options>"
+        And I compute the local anomaly scores of "<test>" in "<output_jobs>" using options "<options> --jobs <jobs>"
+        Then the local anomaly scores are computed
+        And the files "<output>" and "<output_jobs>" are identical
+
+        Examples:
+        | anomaly                         | test                        | output                             | output_jobs                             | options                                    | jobs |
+        | ./check_files/anomaly_iris.json | ../data/test_iris_notes.csv | ./scenario_as_4/anomaly_scores.csv | ./scenario_as_4/anomaly_scores_jobs.csv | --prediction-info full --prediction-header | 3    |
+        | ./check_files/anomaly_iris.json | ../data/test_iris_notes.csv | ./scenario_as_5/anomaly_scores.csv | ./scenario_as_5/anomaly_scores_jobs.csv | --prediction-info full --prediction-header | 20   |
+        | ./check_files/anomaly_iris.json | ../data/test_iris_nh.csv    | ./scenario_as_6/anomaly_scores.csv | ./scenario_as_6/anomaly_scores_jobs.csv | --no-test-header                           | 4    |
+        | ./check_files/anomaly_iris.json | ../data/test_iris_notes.csv | ./scenario_as_7/anomaly_scores.csv | ./scenario_as_7/anomaly_scores_jobs.csv | --anomaly-top 4                            | 3    |
+        | ./check_files/anomaly_iris.json | ../data/test_iris_notes.csv | ./scenario_as_8/anomaly_scores.csv | ./scenario_as_8/anomaly_scores_jobs.csv | --anomaly-threshold 0.8 --anomaly-flag     | 3    |
+
+    Scenario: Successfully keeping the top anomalous rows:
+        Given I read the anomaly scores of <columns> anomaly detectors in "<scores>"
+        When I filter the anomaly scores using options "<options>"
+        Then the filtered rows are the rows with the highest scores in order
+
+        Examples:
+        | scores                                | columns | options                                   |
+        | ./check_files/anomaly_scores_ties.csv | 1       | --anomaly-top 5                           |
+        | ./check_files/anomaly_scores_ties.csv | 2       | --anomaly-top 6                           |
+        | ./check_files/anomaly_scores_ties.csv | 1       | --anomaly-threshold 0.6                   |
+        | ./check_files/anomaly_scores_ties.csv | 2       | --anomaly-top 4 --anomaly-threshold 0.6   |
+        | ./check_files/anomaly_scores_ties.csv | 2       | --anomaly-top 20 --anomaly-threshold 0.62 |
+
+    Scenario: Successfully merging the top anomalous rows scored in parts:
+        Given I read the anomaly scores of <columns> anomaly detectors in "<scores>"
+        When I filter the anomaly scores using options "<options>"
+        And I merge the top rows of the anomaly scores filtered in <parts> parts in "<output_dir>"
+        Then the merged rows are the filtered rows
+
+        Examples:
+        | scores                                | columns | options                                 | parts | output_dir       |
+        | ./check_files/anomaly_scores_ties.csv | 1       | --anomaly-top 5                         | 3     | ./scenario_as_9  |
+        | ./check_files/anomaly_scores_ties.csv | 2       | --anomaly-top 6                         | 4     | ./scenario_as_10 |
+        | ./check_files/anomaly_scores_ties.csv | 2       | --anomaly-top 4 --anomaly-threshold 0.6 | 3     | ./scenario_as_11 |
+        | ./check_files/anomaly_scores_ties.csv | 1       | --anomaly-top 3                         | 20    | ./scenario_as_12 |
+
+    Scenario: Successfully matching the test columns of several anomaly detectors:
+        Given I have the local anomaly detector in "<anomaly>"
+        And I add a copy of the local anomaly detector with its fields in <columns> columns
+        When I compute the local anomaly scores of "<test>" in "<output>" using options "<options>"
+        Then the local anomaly scores are <computed>
+
+        Examples:
+        | anomaly                         | columns  | test                        | output                              | options          | computed     |
+        | ./check_files/anomaly_iris.json | the same | ../data/test_iris_nh.csv    | ./scenario_as_13/anomaly_scores.csv | --no-test-header | computed     |
+        | ./check_files/anomaly_iris.json | other    | ../data/test_iris_nh.csv    | ./scenario_as_14/anomaly_scores.csv | --no-test-header | not computed |
+        | ./check_files/anomaly_iris.json | other    | ../data/test_iris_notes.csv | ./scenario_as_15/anomaly_scores.csv |                  | computed     |
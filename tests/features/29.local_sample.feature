@@ -0,0 +1,70 @@
+Feature: Sample the rows of a local file
+    In order to sample the rows of a local file
+    I need to read the rows of the file
+    Then I need to select the sample rows and compute their statistics
+
+    Scenario: Successfully selecting the rows of a local file in linear mode:
+        Given I read the rows of "<data>"
+        And I select the sample rows using options "<sample_options>"
+        Then the selected rows are the rows <first> to <last> of the file
+
+        Examples:
+        | data             | sample_options                              | first | last |
+        | ../data/iris.csv | --mode linear --rows 10 --row-offset 10     | 10    | 19   |
+        | ../data/iris.csv | --mode linear                               | 0     | 149  |
+
+    Scenario: Successfully selecting the rows of a local file sorted by a field:
+        Given I read the rows of "<data>"
+        And I select the sample rows using options "<sample_options>"
+        Then the selected rows are <count> different rows of the file
+        And the selected rows are sorted by "<field>"
+
+        Examples:
+        | data             | sample_options                                          | count | field         |
+        | ../data/iris.csv | --row-order-by="-petal length" --rows 20                | 20    | -petal length |
+        | ../data/iris.csv | --row-order-by="sepal width" --rows 30 --row-offset 5   | 30    | sepal width   |
+
+    Scenario: Successfully selecting the rows of a local file at random:
+        Given I read the rows of "<data>"
+        And I select the sample rows using options "<sample_options>"
+        Then the selected rows are <count> different rows of the file
+        And the same rows are selected again
+
+        Examples:
+        | data             | sample_options                  | count |
+        | ../data/iris.csv | --rows 20                       | 20    |
+        | ../data/iris.csv | --mode deterministic --rows 40  | 40    |
+        | ../data/iris.csv | --seed BigML --rows 200         | 150   |
+
+    Scenario: Successfully selecting the unique rows of a local file:
+        Given I read the rows of "<data>"
+        And I select the sample rows using options "<sample_options>"
+        Then the selected rows have no repeated contents
+
+        Examples:
+        | data             | sample_options           |
+        | ../data/iris.csv | --mode linear --unique   |
+        | ../data/iris.csv | --unique                 |
+
+    Scenario: Successfully computing the statistics of a local file:
+        Given I read the rows of "<data>"
+        Then the local statistics of "<field>" are like in "<sample_JSON>"
+
+        Examples:
+        | data             | field        | sample_JSON                   |
+        | ../data/iris.csv | petal length | ./check_files/stat_info.json  |
+
+    Scenario: Successfully counting the rows of a partially written sample file:
+        Given I copy the first <size> bytes of "<data>" to "<output>"
+        When I count the sample rows written in the file <headers> headers
+        Then <rows> complete rows are found and the incomplete row is removed
+
+        Examples:
+        | data                        | size | output                     | headers | rows |
+        | ../data/test_iris_notes.csv | 351  | ./scenario_ls_1/sample.csv | with    | 10   |
+        | ../data/test_iris_notes.csv | 160  | ./scenario_ls_1/sample.csv | with    | 3    |
+        | ../data/test_iris_notes.csv | 160  | ./scenario_ls_1/sample.csv | without | 4    |
+        | ../data/test_iris_notes.csv | 136  | ./scenario_ls_1/sample.csv | with    | 2    |
+        | ../data/test_iris_notes.csv | 234  | ./scenario_ls_1/sample.csv | with    | 5    |
+        | ../data/test_iris_notes.csv | 56   | ./scenario_ls_1/sample.csv | with    | 0    |
+        | ../data/test_iris_notes.csv | 20   | ./scenario_ls_1/sample.csv | with    | 0    |
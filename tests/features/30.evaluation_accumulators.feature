@@ -0,0 +1,56 @@
+Feature: Accumulate the measures of evaluations
+    In order to average evaluations
+    I need to accumulate their measures
+    Then I need to check that the averages and standard deviations are right
+
+    Scenario: Successfully averaging evaluations:
+        Given I average the evaluations in "<evaluation_files>"
+        Then the averaged measures are the means and standard deviations of the evaluations measures
+
+        Examples:
+        | evaluation_files |
+        | ./check_files/evaluation_iris.json,./check_files/evaluation_iris2.json,./check_files/evaluation_iris_nulls.json |
+        | ./check_files/evaluation_iris.json,./check_files/evaluation_iris_absent.json,./check_files/evaluation_iris_nulls.json,./check_files/evaluation_iris_absent.json |
+        | ./check_files/evaluation_iris_absent.json |
+
+    Scenario: Successfully accumulating the results of a classification:
+        Given I accumulate the classification results in "<actual_file>" as actual values and in "<predicted_file>" as predicted values in chunks of <chunk_size> rows
+        Then the accumulated classification measures are computed from the confusion matrix
+
+        Examples:
+        | actual_file                        | predicted_file                           | chunk_size |
+        | ./check_files/predictions_iris.csv | ./check_files/predictions_iris_nulls.csv | 7          |
+        | ./check_files/predictions_iris.csv | ./check_files/predictions_iris_nulls.csv | 100        |
+        | ./check_files/predictions_iris.csv | ./check_files/predictions_iris_p.csv     | 4          |
+
+    Scenario: Successfully accumulating the results of a regression:
+        Given I accumulate the regression results in "<actual_file>" as actual values and in "<predicted_file>" as predicted values in chunks of <chunk_size> rows
+        Then the accumulated regression measures are computed from the errors
+
+        Examples:
+        | actual_file                          | predicted_file                                 | chunk_size |
+        | ./check_files/predictions_grades.csv | ./check_files/predictions_grades_median_e.csv  | 5          |
+        | ./check_files/predictions_grades.csv | ./check_files/predictions_grades_median_e.csv  | 100        |
+
+    Scenario: Successfully deciding when adaptive cross-validation stops:
+        Given I cross-validate the metric values "<values>" in waves of <wave> till the confidence interval is within <tolerance> or <max_rounds> rounds are reached
+        Then cross-validation <result> after <rounds> rounds
+        And the same decisions are taken when resuming after each wave
+        And a wave with no metric values is rejected
+
+        Examples:
+        | values                                                                     | wave | tolerance | max_rounds | result    | rounds |
+        | 0.93,0.88,0.95,0.90,0.86,0.91,0.92,0.89,0.90,0.91,0.90,0.92,0.91,0.89,0.90 | 5    | 0.012     | 20         | converges | 15     |
+        | 0.93,0.88,0.95,0.90,0.86,0.91,0.92,0.89,0.90,0.91,0.90,0.92,0.91,0.89,0.90 | 5    | 0.02      | 20         | converges | 10     |
+        | 0.7,0.95,0.6,0.9,0.8,0.65,0.99,0.75,0.85,0.7                               | 5    | 0.05      | 10         | stops     | 10     |
+        | 0.9,0.9,0.8                                                                | 1    | 0.01      | 10         | converges | 2      |
+
+    Scenario: Successfully averaging the evaluations saved as they finish:
+        Given I save the evaluations in "<evaluation_files>" with up to <max_parallel> parallel tasks in "<output_dir>"
+        Then the evaluations are saved <order> and averaged as when retrieved one by one
+
+        Examples:
+        | evaluation_files                                                                                                                                          | max_parallel | output_dir      | order          |
+        | ./check_files/evaluation_iris.json,./check_files/evaluation_iris2.json,./check_files/evaluation_iris_nulls.json,./check_files/evaluation_iris_absent.json | 1            | ./scenario_ea_1 | in order       |
+        | ./check_files/evaluation_iris.json,./check_files/evaluation_iris2.json,./check_files/evaluation_iris_nulls.json,./check_files/evaluation_iris_absent.json | 4            | ./scenario_ea_2 | as they finish |
+        | ./check_files/evaluation_iris.json,./check_files/evaluation_kfold.json,./check_files/evaluation_iris2.json                                                | 3            | ./scenario_ea_3 | as they finish |
@@ -0,0 +1,54 @@
+Feature: Run tasks in parallel
+    In order to create resources in parallel
+    I need to run tasks in a bounded number of threads
+    Then I need to check their results, errors and rate
+
+    Scenario: Successfully running tasks in parallel:
+        Given I run <tasks> tasks taking up to <delay> seconds with up to <max_parallel> parallel threads <order>
+        Then the results of all the tasks are yielded <results>
+        And no more than <max_parallel> tasks ran at the same time
+        And the tasks took less than <seconds> seconds
+
+        Examples:
+        | tasks | delay | max_parallel | order           | results  | seconds |
+        | 20    | 0.5   | 4            | in order        | in order | 4       |
+        | 20    | 0.5   | 4            | as they finish  | once     | 4       |
+        | 20    | 0.1   | 1            | in order        | in order | 3       |
+
+    Scenario: Successfully stopping the tasks run in parallel after an error:
+        Given I run <tasks> tasks taking up to <delay> seconds with up to <max_parallel> parallel threads and task <failing> fails
+        Then the error of task <failing> is raised and no more than <started> tasks are started
+
+        Examples:
+        | tasks | delay | max_parallel | failing | started |
+        | 20    | 0.5   | 2            | 3       | 6       |
+
+    Scenario: Successfully limiting the rate of calls:
+        Given I acquire <tokens> tokens from a bucket with rate <rate> and capacity <capacity> using <threads> threads
+        Then the tokens took from <minimum> to <maximum> seconds
+
+        Examples:
+        | tokens | rate | capacity | threads | minimum | maximum |
+        | 25     | 10   | 5        | 4       | 1.9     | 3       |
+        | 5      | 10   | 5        | 4       | 0       | 0.5     |
+
+    Scenario: Successfully logging the datasets of the centroids as they are created:
+        Given I create the datasets of <centroids> centroids with up to <max_parallel> parallel tasks logging in "<output_dir>"
+        Then the datasets are logged <order>
+
+        Examples:
+        | centroids | max_parallel | output_dir      | order                  |
+        | 6         | 1            | ./scenario_pa_1 | in the centroids order |
+        | 6         | 3            | ./scenario_pa_2 | as they are created    |
+
+    Scenario: Successfully listing the pages of resources in parallel:
+        Given I list <pages> pages of resources with up to <max_parallel> parallel threads while <created> resources are created
+        Then every resource is listed once in the listing order after <calls> calls
+
+        Examples:
+        | pages | max_parallel | created | calls |
+        | 3.5   | 4            | 0       | 4     |
+        | 3.5   | 1            | 0       | 4     |
+        | 3     | 2            | 0       | 3     |
+        | 0.5   | 4            | 0       | 1     |
+        | 3.5   | 4            | 3       | 4     |
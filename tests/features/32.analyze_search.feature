@@ -0,0 +1,87 @@
+Feature: Search the best settings in the analyze subcommand
+    In order to find the best settings for the models
+    I need to search the candidates in the analyze subcommand
+    Then I need to check that the best candidate is found
+
+    Scenario: Successfully searching the best node threshold:
+        Given I search the best of <count> node thresholds using the <search> search for scores that peak at <peak> with a plateau of <plateau> thresholds
+        Then the best node threshold is the one found by the linear search using fewer probes
+        And no node threshold is probed twice
+
+        Examples:
+        | count | search     | peak | plateau |
+        | 40    | bracketing | 20   | 1       |
+        | 40    | golden     | 20   | 1       |
+        | 40    | bracketing | 30   | 4       |
+        | 40    | golden     | 30   | 4       |
+        | 100   | bracketing | 70   | 1       |
+        | 100   | golden     | 70   | 1       |
+        | 25    | bracketing | 15   | 2       |
+        | 25    | golden     | 15   | 2       |
+
+    Scenario: Successfully reusing the stored evaluations:
+        Given I memoize the evaluation in "<evaluation>" for the model fields "<fields>" and options "<options>" in "<output_dir>"
+        And I add a truncated line to the memo
+        Then the evaluation is reused for the model fields "<same_fields>" and options "<options>"
+        And the evaluation is not reused for the model fields "<other_fields>" and options "<options>"
+        And the evaluation is not reused for the model fields "<fields>" and options "<other_options>"
+        And the memo has 1 evaluations
+        And I memoize the evaluation again for the model fields "<other_fields>" and options "<options>"
+        And the evaluation is reused for the model fields "<other_fields>" and options "<options>"
+        And the memo has 2 evaluations
+
+        Examples:
+        | evaluation                         | fields                   | options                                  | output_dir      | same_fields              | other_fields | other_options                            |
+        | ./check_files/evaluation_iris.json | petal length,petal width | --objective species                      | ./scenario_an_1 | petal width,petal length | petal width  | --objective species --balance            |
+        | ./check_files/evaluation_iris.json |                          | --objective species --node-threshold 100 | ./scenario_an_2 |                          | petal width  | --objective species --node-threshold 200 |
+
+    Scenario: Successfully choosing the hyperparameters trials in the grid order:
+        Given I compute the hyperparameters trials using options "<options>"
+        Then the trials are the different settings of the grid in order
+
+        Examples:
+        | options                                                                            |
+        | --hyperparams-search grid                                                          |
+        | --hyperparams-search grid --max-trials 30                                          |
+        | --hyperparams-search grid --hyperparams-space ./check_files/hyperparams_space.json |
+
+    Scenario: Successfully choosing the hyperparameters trials at random:
+        Given I compute the hyperparameters trials using options "<options>"
+        Then the trials are <count> shuffled settings of the grid that are the same in every search
+
+        Examples:
+        | options                                                                              | count |
+        | --hyperparams-search random                                                          | 20    |
+        | --hyperparams-search random --max-trials 50                                          | 50    |
+        | --hyperparams-search random --hyperparams-space ./check_files/hyperparams_space.json | 6     |
+
+    Scenario: Successfully ranking the hyperparameters trials:
+        Given I search the best hyperparameters using options "<options>" with synthetic scores in "<output_dir>"
+        Then the evaluated trials are ranked by score in "<output_dir>"
+        And <count> trials are evaluated and the model options are restored
+
+        Examples:
+        | options                                                                                           | output_dir      | count |
+        | --hyperparams-search grid --hyperparams-space ./check_files/hyperparams_space.json --staleness 20 | ./scenario_an_3 | 6     |
+        | --hyperparams-search random --max-parallel-candidates 4 --staleness 5                             | ./scenario_an_4 | 8     |
+
+    Scenario: Successfully creating the datasets of the folds in parallel:
+        Given I create the datasets of <folds> folds with up to <max_parallel> parallel tasks in "<output_dir>"
+        Then the datasets of the folds are stored in the fold order
+
+        Examples:
+        | folds | max_parallel | output_dir      |
+        | 5     | 1            | ./scenario_an_5 |
+        | 5     | 5            | ./scenario_an_6 |
+        | 10    | 3            | ./scenario_an_7 |
+
+    Scenario: Successfully resuming the creation of the datasets of the folds:
+        Given I create the datasets of <folds> folds with up to <max_parallel> parallel tasks in "<output_dir>" and fold <failing> fails
+        And I resume the creation of the datasets of the folds
+        Then the datasets of the folds are stored in the fold order
+        And only the datasets of the folds that were not created are created again
+
+        Examples:
+        | folds | max_parallel | output_dir      | failing |
+        | 5     | 2            | ./scenario_an_8 | 2       |
+        | 10    | 4            | ./scenario_an_9 | 5       |
@@ -0,0 +1,476 @@
+import os
+import sys
+import csv
+import json
+import time
+import shlex
+import argparse
+import itertools
+from lettuce import step, world
+import bigmler.analyze.k_fold_cv as k_fold_cv
+from bigmler.analyze.k_fold_cv import (
+    better_node_threshold, linear_nodes_search, bracketing_nodes_search,
+    golden_nodes_search, evaluation_memo_key, memoized_evaluation,
+    memoize_evaluation, load_evaluations_memo, hyperparams_space,
+    hyperparams_trials, best_hyperparams, create_kfold_datasets,
+    set_subcommand_file, retrieve_subcommands, DEFAULT_STALENESS,
+    DEFAULT_NODES_PROBES, DEFAULT_RANDOM_TRIALS, ENSEMBLE_HYPERPARAMS,
+    MEMO_LOG, TRIALS_LOG)
+
+
+NODES_SEARCHES = {
+    "linear": lambda evaluate, thresholds, state: linear_nodes_search(
+        evaluate, thresholds, state, DEFAULT_STALENESS),
+    "bracketing": lambda evaluate, thresholds, state: bracketing_nodes_search(
+        evaluate, thresholds, state, DEFAULT_NODES_PROBES),
+    "golden": golden_nodes_search}
+
+
+def node_threshold_score(index, peak, plateau):
+    """Synthetic score of the node threshold in `index`: it grows till the
+       `peak` and decreases after a `plateau` of thresholds whose scores
+       differ less than EPSILON
+
+    """
+    if peak <= index < peak + plateau:
+        return 0.9 + 0.0002 * (index - peak)
+    return 0.9 - 0.01 * max(index - peak - plateau + 1, peak - index)
+
+
+def search_nodes(search, thresholds, peak, plateau):
+    """Runs the node threshold search using the synthetic scores and
+       returns the search state and the probed indexes
+
+    """
+    state = {"scores": {}, "best_index": None, "best_score": - float('inf')}
+    probes = []
+
+    def evaluate(indexes):
+        """Scores the thresholds in `indexes` that were not probed before
+
+        """
+        for index in sorted(set(indexes)):
+            if index in state["scores"]:
+                continue
+            probes.append(index)
+            score = node_threshold_score(index, peak, plateau)
+            state["scores"][index] = score
+            best_threshold = (None if state["best_index"] is None
+                              else thresholds[state["best_index"]])
+            if better_node_threshold(score, thresholds[index],
+                                     state["best_score"], best_threshold):
+                state["best_index"] = index
+                state["best_score"] = score
+
+    NODES_SEARCHES[search](evaluate, thresholds, state)
+    return state, probes
+
+
+@step(r'I search the best of (\d+) node thresholds using the (linear|bracketing|golden) search for scores that peak at (\d+) with a plateau of (\d+) thresholds')
+def i_search_nodes(step, count=None, search=None, peak=None, plateau=None):
+    if count is None or search is None or peak is None or plateau is None:
+        assert False
+    world.thresholds = range(3, 3 + 100 * int(count), 100)
+    world.nodes_peak = (int(peak), int(plateau))
+    world.nodes_state, world.nodes_probes = search_nodes(
+        search, world.thresholds, int(peak), int(plateau))
+
+
+@step(r'the best node threshold is the one found by the linear search using fewer probes')
+def i_check_best_node_threshold(step):
+    state, probes = search_nodes("linear", world.thresholds,
+                                 *world.nodes_peak)
+    if world.nodes_state["best_index"] != state["best_index"]:
+        assert False, "Best node threshold: %s, expected %s" % (
+            world.thresholds[world.nodes_state["best_index"]],
+            world.thresholds[state["best_index"]])
+    # scores closer than EPSILON are resolved in favour of the smaller one
+    if state["best_index"] != world.nodes_peak[0]:
+        assert False, "Best node threshold: %s, expected %s" % (
+            world.thresholds[state["best_index"]],
+            world.thresholds[world.nodes_peak[0]])
+    if len(world.nodes_probes) >= len(probes):
+        assert False, "%s probes, %s in the linear search" % (
+            len(world.nodes_probes), len(probes))
+    assert True
+
+
+@step(r'no node threshold is probed twice')
+def i_check_node_probes(step):
+    if len(set(world.nodes_probes)) != len(world.nodes_probes) or \
+            not set(world.nodes_probes) <= set(range(len(world.thresholds))):
+        assert False, "Probed indexes: %s" % world.nodes_probes
+    assert True
+
+
+MEMO_DATASETS = ["dataset/5540b3e4c0ed0b3b3a000001",
+                 "dataset/5540b3e4c0ed0b3b3a000002"]
+
+
+def memo_key(model_fields, model_options):
+    """Memo key of the evaluation of the test datasets for the model fields
+       and options
+
+    """
+    args = argparse.Namespace(args_separator=",", optimize="accuracy",
+                              optimize_category=None)
+    return evaluation_memo_key(MEMO_DATASETS, model_fields or None,
+                               model_options.split(), args)
+
+
+def use_memo(memo_file):
+    """Reloads the evaluations memo from the memo file. The memo is stored
+       in the current directory, so its name is temporarily changed.
+
+    """
+    k_fold_cv.MEMO_LOG = memo_file
+    try:
+        return load_evaluations_memo()
+    finally:
+        k_fold_cv.MEMO_LOG = MEMO_LOG
+
+
+@step(r'I memoize the evaluation in "(.*)" for the model fields "(.*)" and options "(.*)" in "(.*)"')
+def i_memoize_evaluation(step, evaluation_file=None, model_fields=None,
+                         model_options=None, output_dir=None):
+    if evaluation_file is None or model_fields is None or \
+            model_options is None or output_dir is None:
+        assert False
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    world.memo_file = os.path.join(output_dir, MEMO_LOG)
+    if os.path.exists(world.memo_file):
+        os.remove(world.memo_file)
+    with open(evaluation_file) as evaluation_handler:
+        world.memo_evaluation = json.load(evaluation_handler)
+    k_fold_cv.MEMO_LOG = world.memo_file
+    try:
+        load_evaluations_memo()
+        memoize_evaluation(memo_key(model_fields, model_options),
+                           world.memo_evaluation)
+    finally:
+        k_fold_cv.MEMO_LOG = MEMO_LOG
+
+
+@step(r'I add a truncated line to the memo')
+def i_truncate_memo(step):
+    line = json.dumps([memo_key("", "--node-threshold 1000"),
+                       {"model": world.memo_evaluation["model"]}])
+    with open(world.memo_file, "a") as memo_handler:
+        memo_handler.write(line[0: len(line) / 2])
+
+
+@step(r'I memoize the evaluation again for the model fields "(.*)" and options "(.*)"')
+def i_memoize_evaluation_again(step, model_fields=None, model_options=None):
+    if model_fields is None or model_options is None:
+        assert False
+    k_fold_cv.MEMO_LOG = world.memo_file
+    try:
+        load_evaluations_memo()
+        memoize_evaluation(memo_key(model_fields, model_options),
+                           world.memo_evaluation)
+    finally:
+        k_fold_cv.MEMO_LOG = MEMO_LOG
+
+
+@step(r'the evaluation is (reused|not reused) for the model fields "(.*)" and options "(.*)"')
+def i_check_memoized_evaluation(step, reused=None, model_fields=None,
+                                model_options=None):
+    if reused is None or model_fields is None or model_options is None:
+        assert False
+    use_memo(world.memo_file)
+    evaluation = memoized_evaluation(memo_key(model_fields, model_options))
+    expected = ({"model": world.memo_evaluation["model"]} if
+                reused == "reused" else None)
+    if evaluation != expected:
+        assert False, "Memoized evaluation: %s, expected %s" % (evaluation,
+                                                                 expected)
+    assert True
+
+
+@step(r'the memo has (\d+) evaluations')
+def i_check_memo_size(step, count=None):
+    if count is None:
+        assert False
+    memo = use_memo(world.memo_file)
+    if len(memo) != int(count):
+        assert False, "The memo has %s evaluations" % len(memo)
+    assert True
+
+
+# model options before the hyperparameters search
+MODEL_OPTIONS = {"number_of_models": 1, "sample_rate": 1.0,
+                 "randomize": False, "balance": False,
+                 "missing_splits": False, "pruning": None}
+
+
+def hyperparams_args(options):
+    """Namespace with the hyperparameters search options in the options
+       string and the default model options
+
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hyperparams-search', default='random')
+    parser.add_argument('--hyperparams-space')
+    parser.add_argument('--max-trials', type=int)
+    parser.add_argument('--max-parallel-candidates', type=int, default=1)
+    parser.add_argument('--staleness', type=int)
+    args = parser.parse_args(shlex.split(options))
+    for option, value in MODEL_OPTIONS.items():
+        setattr(args, option, value)
+    args.model_fields = None
+    args.optimize = "accuracy"
+    args.verbosity = 0
+    return args
+
+
+def grid_trials(args):
+    """Different settings in the grid, once the ensemble options of single
+       models are set to their defaults
+
+    """
+    space = hyperparams_space(args)
+    trials = []
+    for values in itertools.product(*[values for _, values in space]):
+        settings = dict(zip([option for option, _ in space], values))
+        if settings.get("number_of_models", args.number_of_models) < 2:
+            for option, value in ENSEMBLE_HYPERPARAMS.items():
+                if option in settings:
+                    settings[option] = value
+        if settings not in trials:
+            trials.append(settings)
+    return trials
+
+
+def trial_score(settings):
+    """Synthetic score of a trial. Many trials get the same score.
+
+    """
+    return (0.8 + (0.1 if settings.get("balance") else 0) +
+            (0.05 if settings.get("number_of_models", 1) > 1 else 0))
+
+
+@step(r'I compute the hyperparameters trials using options "(.*)"')
+def i_compute_trials(step, options=None):
+    if options is None:
+        assert False
+    world.trials_args = hyperparams_args(options)
+    world.trials = hyperparams_trials(world.trials_args)
+
+
+@step(r'the trials are the different settings of the grid in order')
+def i_check_grid_trials(step):
+    expected = grid_trials(world.trials_args)
+    expected = expected[0: world.trials_args.max_trials]
+    if world.trials != expected:
+        assert False, "Trials:\n%s\nExpected trials:\n%s" % (world.trials,
+                                                              expected)
+    assert True
+
+
+@step(r'the trials are (\d+) shuffled settings of the grid that are the same in every search')
+def i_check_random_trials(step, count=None):
+    if count is None:
+        assert False
+    grid = grid_trials(world.trials_args)
+    max_trials = world.trials_args.max_trials or DEFAULT_RANDOM_TRIALS
+    if len(world.trials) != int(count) or \
+            int(count) != min(max_trials, len(grid)):
+        assert False, "%s trials, expected %s" % (len(world.trials), count)
+    for settings in world.trials:
+        if settings not in grid or world.trials.count(settings) > 1:
+            assert False, "Unexpected trial: %s" % settings
+    if world.trials == grid[0: len(world.trials)]:
+        assert False, "The trials are not shuffled"
+    trials = hyperparams_trials(world.trials_args)
+    if trials != world.trials:
+        assert False, "Trials:\n%s\nExpected trials:\n%s" % (trials,
+                                                              world.trials)
+    assert True
+
+
+@step(r'I search the best hyperparameters using options "(.*)" with synthetic scores in "(.*)"')
+def i_search_hyperparams(step, options=None, output_dir=None):
+    if options is None or output_dir is None:
+        assert False
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    args = hyperparams_args(options)
+    args.output_dir = output_dir
+    world.trials_args = args
+    world.evaluated_trials = []
+
+    def evaluate_candidates(datasets_file, args, candidates, common_options,
+                            penalty=0, metric="accuracy", resume=False,
+                            subdir="kfold"):
+        """Sets the model options of the candidates in args, as the k-fold
+           evaluations do, and returns their synthetic scores
+
+        """
+        scores = []
+        for counter, _, settings in candidates:
+            for option, value in settings.items():
+                setattr(args, option, value)
+            world.evaluated_trials.append((counter, settings))
+            score = trial_score(settings)
+            scores.append((score, score, metric))
+        return scores, resume
+
+    kfold_evaluate_candidates = k_fold_cv.kfold_evaluate_candidates
+    k_fold_cv.kfold_evaluate_candidates = evaluate_candidates
+    try:
+        best_hyperparams(None, args, [], staleness=args.staleness)
+    finally:
+        k_fold_cv.kfold_evaluate_candidates = kfold_evaluate_candidates
+
+
+@step(r'the evaluated trials are ranked by score in "(.*)"')
+def i_check_ranked_trials(step, output_dir=None):
+    if output_dir is None:
+        assert False
+    with open(os.path.join(output_dir, TRIALS_LOG)) as trials_handler:
+        rows = list(csv.reader(trials_handler))
+    options = rows[0][2: -2]
+    ranked = [(int(row[1]), float(row[-2])) for row in rows[1:]]
+    # ties are resolved in favour of the first trial
+    expected = sorted([(counter, trial_score(settings)) for
+                       counter, settings in world.evaluated_trials],
+                      key=lambda item: (- item[1], item[0]))
+    if ranked != expected or \
+            [int(row[0]) for row in rows[1:]] != range(1, len(rows)):
+        assert False, "Ranked trials:\n%s\nExpected:\n%s" % (rows, expected)
+    settings = dict(world.evaluated_trials)
+    for row in rows[1:]:
+        if row[2: -2] != [str(settings[int(row[1])][option]) for
+                          option in options]:
+            assert False, "Trial %s: %s" % (row[1], row)
+    assert True
+
+
+@step(r'(\d+) trials are evaluated and the model options are restored')
+def i_check_restored_options(step, count=None):
+    if count is None:
+        assert False
+    if len(world.evaluated_trials) != int(count):
+        assert False, "%s trials evaluated" % len(world.evaluated_trials)
+    for option, value in MODEL_OPTIONS.items():
+        if getattr(world.trials_args, option) != value:
+            assert False, "%s: %s, expected %s" % (
+                option, getattr(world.trials_args, option), value)
+    assert True
+
+
+def fold_dataset_id(index):
+    """Id of the dataset generated for the index-th fold
+
+    """
+    return "dataset/5540b3e4c0ed0b3b3a%06d" % index
+
+
+def create_folds(folds, max_parallel, output_dir, failing=None,
+                 resume=False):
+    """Creates the datasets of the folds using a main dispatcher that
+       stores a finished dataset in each fold directory. The last folds
+       finish first and the `failing` fold exits.
+
+    """
+    world.created_folds = []
+
+    def main_dispatcher(args):
+        """Stores the fold dataset in the --output-dir directory
+
+        """
+        fold_dir = args[args.index("--output-dir") + 1]
+        index = int(os.path.basename(fold_dir)[len("fold"):])
+        world.created_folds.append(index)
+        time.sleep(0.05 * (folds - index))
+        if index == failing:
+            sys.exit("Failed to create the dataset of fold %s." % index)
+        if not os.path.exists(fold_dir):
+            os.makedirs(fold_dir)
+        dataset_id = fold_dataset_id(index)
+        with open(os.path.join(fold_dir, dataset_id.replace("/", "_")),
+                  "w") as dataset_handler:
+            json.dump({"resource": dataset_id,
+                       "object": {"status": {"code": 5}}}, dataset_handler)
+        with open(os.path.join(fold_dir, "dataset_gen"), "w") as \
+                dataset_handler:
+            dataset_handler.write("%s\n" % dataset_id)
+
+    args = argparse.Namespace(output_dir=output_dir, verbosity=0,
+                              max_parallel_datasets=max_parallel)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    set_subcommand_file(output_dir)
+    if resume:
+        retrieve_subcommands()
+    dispatcher = k_fold_cv.main_dispatcher
+    k_fold_cv.main_dispatcher = main_dispatcher
+    try:
+        world.datasets_file, _ = create_kfold_datasets(
+            "dataset/5540b3e4c0ed0b3b3a000001", args,
+            [os.path.join(output_dir, "kfold_dataset-%s.json" % index) for
+             index in range(folds)], [], resume=resume)
+    finally:
+        k_fold_cv.main_dispatcher = dispatcher
+
+
+@step(r'I create the datasets of (\d+) folds with up to (\d+) parallel tasks in "(.*)"$')
+def i_create_fold_datasets(step, folds=None, max_parallel=None,
+                           output_dir=None):
+    if folds is None or max_parallel is None or output_dir is None:
+        assert False
+    world.folds = int(folds)
+    world.fold_args = (int(max_parallel), output_dir)
+    create_folds(world.folds, int(max_parallel), output_dir)
+
+
+@step(r'I create the datasets of (\d+) folds with up to (\d+) parallel tasks in "(.*)" and fold (\d+) fails')
+def i_create_failing_fold_datasets(step, folds=None, max_parallel=None,
+                                   output_dir=None, failing=None):
+    if folds is None or max_parallel is None or output_dir is None or \
+            failing is None:
+        assert False
+    world.folds = int(folds)
+    world.fold_args = (int(max_parallel), output_dir)
+    try:
+        create_folds(world.folds, int(max_parallel), output_dir,
+                     failing=int(failing))
+    except SystemExit:
+        pass
+    else:
+        assert False, "The datasets of the folds were created"
+
+
+@step(r'I resume the creation of the datasets of the folds')
+def i_resume_fold_datasets(step):
+    world.failed_folds = [index for index in range(world.folds) if
+                          not os.path.exists(os.path.join(
+                              world.fold_args[1], "test", "fold%s" % index,
+                              "dataset_gen"))]
+    create_folds(world.folds, world.fold_args[0], world.fold_args[1],
+                 resume=True)
+
+
+@step(r'the datasets of the folds are stored in the fold order')
+def i_check_fold_datasets(step):
+    with open(world.datasets_file) as datasets_handler:
+        dataset_ids = datasets_handler.read().split()
+    if dataset_ids != [fold_dataset_id(index) for
+                       index in range(world.folds)]:
+        assert False, "Fold datasets: %s" % dataset_ids
+    test_dir = os.path.dirname(world.datasets_file)
+    for dataset_id in dataset_ids:
+        if not os.path.exists(os.path.join(test_dir,
+                                           dataset_id.replace("/", "_"))):
+            assert False, "%s was not stored in %s" % (dataset_id, test_dir)
+    assert True
+
+
+@step(r'only the datasets of the folds that were not created are created again')
+def i_check_resumed_folds(step):
+    if not world.failed_folds or \
+            sorted(world.created_folds) != world.failed_folds:
+        assert False, "Created folds: %s, expected %s" % (
+            world.created_folds, world.failed_folds)
+    assert True
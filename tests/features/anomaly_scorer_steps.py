@@ -0,0 +1,254 @@
+import os
+import csv
+import json
+import shlex
+import argparse
+import StringIO
+from lettuce import step, world
+from bigml.anomaly import Anomaly
+from bigml.fields import Fields
+from bigmler.anomaly_scorer import AnomalyScorer
+from bigmler.anomaly_score import (anomaly_score, ScoreFilter, merge_top_rows,
+                                   NO_ANOMALY_SCORE)
+from centroid_scorer_steps import read_input_data
+
+
+def parse_rows(scorer, local_anomaly, test):
+    """Input data and parsed values of the rows in the test file. Rows that
+       cannot be parsed must fail to be scored by the local anomaly
+       detector too.
+
+    """
+    rows = []
+    for input_data in read_input_data(test, local_anomaly.fields):
+        try:
+            rows.append((input_data, scorer.parse(dict(input_data))))
+        except Exception:
+            try:
+                local_anomaly.anomaly_score(dict(input_data), by_name=False)
+            except Exception:
+                continue
+            assert False, "No anomaly score found for %s" % input_data
+    return rows
+
+
+@step(r'the anomaly scorer gives the same scores as the local anomaly detector for "(.*)"')
+def i_check_scorer_scores(step, test=None):
+    if test is None:
+        assert False
+    local_anomaly = Anomaly(world.anomaly)
+    scorer = AnomalyScorer(local_anomaly)
+    rows = parse_rows(scorer, local_anomaly, test)
+    scores = scorer.scores([parsed for _, parsed in rows])
+    if len(scores) != len(rows):
+        assert False, "scores: %s, rows: %s" % (len(scores), len(rows))
+    for (input_data, _), score in zip(rows, scores):
+        local_score = local_anomaly.anomaly_score(dict(input_data),
+                                                  by_name=False)
+        if abs(local_score - score) > 1e-12:
+            assert False, ("Found score %s, expected %s for %s" %
+                           (score, local_score, input_data))
+    assert True
+
+
+@step(r'the anomaly scorer flags the rows whose score reaches (\d*\.\d+) in "(.*)"')
+def i_check_scorer_flags(step, threshold=None, test=None):
+    if threshold is None or test is None:
+        assert False
+    threshold = float(threshold)
+    local_anomaly = Anomaly(world.anomaly)
+    scorer = AnomalyScorer(local_anomaly)
+    rows = parse_rows(scorer, local_anomaly, test)
+    flags = scorer.threshold_flags([parsed for _, parsed in rows], threshold)
+    if len(flags) != len(rows):
+        assert False, "flags: %s, rows: %s" % (len(flags), len(rows))
+    for (input_data, _), (flag, bound) in zip(rows, flags):
+        local_score = local_anomaly.anomaly_score(dict(input_data),
+                                                  by_name=False)
+        # the bound is a lower bound of the flagged scores and an upper
+        # bound of the rest
+        if (flag != (local_score >= threshold) or
+                (flag and bound > local_score + 1e-12) or
+                (not flag and bound < local_score - 1e-12)):
+            assert False, ("Found flag %s with bound %s, expected score %s"
+                           " for %s" % (flag, bound, local_score,
+                                        input_data))
+    assert True
+
+
+def anomaly_score_args(options):
+    """Namespace with the local anomaly scoring options in the options string
+
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--no-test-header', action='store_false',
+                        dest='test_header', default=True)
+    parser.add_argument('--test-separator', default=',')
+    parser.add_argument('--prediction-info', default='normal')
+    parser.add_argument('--prediction-header', action='store_true',
+                        default=False)
+    parser.add_argument('--prediction-fields')
+    parser.add_argument('--anomaly-top', type=int)
+    parser.add_argument('--anomaly-threshold', type=float)
+    parser.add_argument('--anomaly-flag', action='store_true',
+                        default=False)
+    return parser.parse_args(shlex.split(options))
+
+
+@step(r'I have the local anomaly detector in "(.*)"')
+def i_have_local_anomaly(step, anomaly_file=None):
+    if anomaly_file is None:
+        assert False
+    with open(anomaly_file) as anomaly_handler:
+        world.anomaly = json.load(anomaly_handler)
+    world.anomalies = [world.anomaly]
+
+
+@step(r'I add a copy of the local anomaly detector with its fields in (the same|other) columns')
+def i_add_anomaly_copy(step, columns=None):
+    if columns is None:
+        assert False
+    anomaly = json.loads(json.dumps(world.anomaly))
+    anomaly['resource'] = "anomaly/%024d" % len(world.anomalies)
+    if columns == "other":
+        fields = anomaly['object']['model']['fields']
+        for field in fields.values():
+            field['column_number'] = ((field['column_number'] + 1) %
+                                      len(fields))
+    world.anomalies.append(anomaly)
+
+
+@step(r'I compute the local anomaly scores of "(.*)" in "(.*)" using options "(.*)"')
+def i_compute_local_anomaly_scores(step, test=None, output=None,
+                                   options=None):
+    if test is None or output is None or options is None:
+        assert False
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    args = anomaly_score_args(options)
+    args.test_set = test
+    args.predictions = output
+    args.verbosity = 0
+    world.anomaly_score_error = None
+    try:
+        anomaly_score(world.anomalies,
+                      Fields(world.anomaly['object']['model']['fields']),
+                      args)
+    except SystemExit, exc:
+        world.anomaly_score_error = str(exc)
+
+
+@step(r'the local anomaly scores are (computed|not computed)')
+def i_check_anomaly_score_error(step, computed=None):
+    if computed is None:
+        assert False
+    if (world.anomaly_score_error is None) != (computed == "computed"):
+        assert False, "Anomaly scores error: %s" % world.anomaly_score_error
+    assert True
+
+
+@step(r'the files "(.*)" and "(.*)" are identical')
+def i_check_identical_files(step, output=None, other_output=None):
+    if output is None or other_output is None:
+        assert False
+    with open(output, "rb") as output_file:
+        contents = output_file.read()
+    with open(other_output, "rb") as output_file:
+        other_contents = output_file.read()
+    if not contents or contents != other_contents:
+        assert False, "%s:\n%s\n%s:\n%s" % (output, contents, other_output,
+                                            other_contents)
+    assert True
+
+
+def filter_scores(rows, args, columns):
+    """Rows kept by the --anomaly-top and --anomaly-threshold filter
+
+    """
+    output = StringIO.StringIO()
+    score_filter = ScoreFilter(csv.writer(output, lineterminator="\n"),
+                               top=args.anomaly_top,
+                               threshold=args.anomaly_threshold,
+                               columns=columns)
+    for row in rows:
+        score_filter.writerow(row)
+    score_filter.close()
+    return output.getvalue()
+
+
+@step(r'I read the anomaly scores of (\d+) anomaly detectors in "(.*)"')
+def i_read_anomaly_scores(step, columns=None, scores_file=None):
+    if columns is None or scores_file is None:
+        assert False
+    world.score_columns = int(columns)
+    with open(scores_file, "U") as scores_handler:
+        world.scored_rows = [
+            row[0: -world.score_columns] +
+            [score if score == NO_ANOMALY_SCORE else float(score) for
+             score in row[-world.score_columns:]] for
+            row in csv.reader(scores_handler)]
+
+
+@step(r'I filter the anomaly scores using options "(.*)"')
+def i_filter_anomaly_scores(step, options=None):
+    if options is None:
+        assert False
+    world.score_args = anomaly_score_args(options)
+    world.filtered_scores = filter_scores(world.scored_rows, world.score_args,
+                                          world.score_columns)
+
+
+@step(r'I merge the top rows of the anomaly scores filtered in (\d+) parts in "(.*)"')
+def i_merge_top_rows(step, parts=None, output_dir=None):
+    if parts is None or output_dir is None:
+        assert False
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    parts = int(parts)
+    rows = world.scored_rows
+    part_files = []
+    for index in range(parts):
+        part_file = os.path.join(output_dir, "anomaly_scores.part%s" % index)
+        with open(part_file, "w") as part_handler:
+            part_handler.write(filter_scores(
+                rows[len(rows) * index / parts:
+                     len(rows) * (index + 1) / parts],
+                world.score_args, world.score_columns))
+        part_files.append(part_file)
+    output = StringIO.StringIO()
+    merge_top_rows(part_files, output, world.score_args.anomaly_top,
+                   columns=world.score_columns)
+    world.merged_scores = output.getvalue()
+
+
+@step(r'the filtered rows are the rows with the highest scores in order')
+def i_check_filtered_scores(step):
+    args = world.score_args
+    scored = []
+    for row in world.scored_rows:
+        scores = [score for score in row[-world.score_columns:] if
+                  score != NO_ANOMALY_SCORE]
+        if scores and (args.anomaly_threshold is None or
+                       max(scores) >= args.anomaly_threshold):
+            scored.append((max(scores), row))
+    if args.anomaly_top:
+        # the sort is stable, so rows with the same score keep their order
+        scored = sorted(scored, key=lambda item: -item[0])
+        scored = scored[0: args.anomaly_top]
+    output = StringIO.StringIO()
+    csv.writer(output, lineterminator="\n").writerows(
+        [row for _, row in scored])
+    if world.filtered_scores != output.getvalue():
+        assert False, "Filtered rows:\n%s\nExpected rows:\n%s" % (
+            world.filtered_scores, output.getvalue())
+    assert True
+
+
+@step(r'the merged rows are the filtered rows')
+def i_check_merged_scores(step):
+    if world.merged_scores != world.filtered_scores:
+        assert False, "Merged rows:\n%s\nFiltered rows:\n%s" % (
+            world.merged_scores, world.filtered_scores)
+    assert True
@@ -0,0 +1,81 @@
+import csv
+from lettuce import step, world
+from bigml.cluster import Cluster
+from bigmler.centroid_scorer import CentroidScorer
+from basic_cluster_prediction_steps import shell_execute
+
+
+def read_input_data(test, fields):
+    """Rows of a CSV file with headers as dicts keyed by field id
+
+    """
+    ids = dict([(field['name'], field_id) for field_id, field in
+                fields.items()])
+    with open(test, "U") as test_file:
+        reader = csv.DictReader(test_file, lineterminator="\n")
+        return [dict([(ids[name], value) for name, value in row.items()
+                      if name in ids]) for row in reader]
+
+
+def check_centroids(scorer, local_cluster, test):
+    """Compares the centroids found by the scorer for every row in the
+       test file with the ones found by the local cluster
+
+    """
+    rows = []
+    for input_data in read_input_data(test, local_cluster.fields):
+        try:
+            rows.append((input_data, scorer.parse(dict(input_data))))
+        except Exception:
+            # rows with missing numeric values have no centroid
+            try:
+                local_cluster.centroid(dict(input_data), by_name=False)
+            except Exception:
+                continue
+            assert False, "No centroid found for %s" % input_data
+    centroids = scorer.centroids([parsed for _, parsed in rows])
+    if len(centroids) != len(rows):
+        assert False, "centroids: %s, rows: %s" % (len(centroids), len(rows))
+    for (input_data, _), (name, distance) in zip(rows, centroids):
+        centroid = local_cluster.centroid(dict(input_data), by_name=False)
+        if (centroid['centroid_name'] != name or
+                abs(centroid['distance'] - distance) > 1e-9):
+            assert False, ("Found %s at %s, expected %s at %s for %s" %
+                           (name, distance, centroid['centroid_name'],
+                            centroid['distance'], input_data))
+    assert True
+
+
+@step(r'I create BigML resources uploading train "(.*?)" file to create (\d+) centroids for "(.*?)" and log predictions in "([^"]*)"$')
+def i_create_k_cluster_resources(step, data=None, k=None, test=None,
+                                 output=None):
+    if data is None or k is None or test is None or output is None:
+        assert False
+    command = ("bigmler cluster --train " + data + " --test " + test +
+               " --k " + k +
+               " --store --output " + output)
+    shell_execute(command, output, test=test)
+
+
+@step(r'the centroid scorer finds the same centroids as the local cluster for "(.*)"')
+def i_check_scorer_centroids(step, test=None):
+    if test is None:
+        assert False
+    local_cluster = Cluster(world.cluster)
+    scorer = CentroidScorer(local_cluster)
+    if scorer.leaves is not None:
+        assert False, "The scorer uses an index for %s centroids" % \
+            len(local_cluster.centroids)
+    check_centroids(scorer, local_cluster, test)
+
+
+@step(r'the indexed centroid scorer finds the same centroids as the local cluster for "(.*)"')
+def i_check_indexed_scorer_centroids(step, test=None):
+    if test is None:
+        assert False
+    local_cluster = Cluster(world.cluster)
+    scorer = CentroidScorer(local_cluster)
+    if scorer.leaves is None:
+        assert False, "The scorer uses no index for %s centroids" % \
+            len(local_cluster.centroids)
+    check_centroids(scorer, local_cluster, test)
@@ -6,6 +6,7 @@ from lettuce import step, world
 from subprocess import check_call, CalledProcessError
 from bigml.api import check_resource, HTTP_NOT_FOUND
 from bigmler.checkpoint import file_number_of_lines
+from bigmler.delete.dispatcher import delete_waves, DELETE_WAVES
 from common_steps import (check_debug, store_init_resources,
                           store_final_resources, check_init_equals_final)
 from basic_test_prediction_steps import shell_execute
@@ -250,3 +251,37 @@ def i_delete_resources_from_dir(step):
 def i_check_equal_number_of_resources(step):
     store_final_resources()
     check_init_equals_final()
+
+
+@step(r'I group the resources "(.*)" in delete waves')
+def i_group_delete_waves(step, resource_ids=None):
+    if resource_ids is None:
+        assert False
+    world.delete_ids = resource_ids.split(",")
+    world.delete_waves = delete_waves(world.delete_ids)
+
+
+@step(r'the resources are deleted in the waves "(.*)"')
+def i_check_delete_waves(step, waves=None):
+    if waves is None:
+        assert False
+    wave_names = [name for name, _ in world.delete_waves]
+    if wave_names != waves.split("; "):
+        assert False, "Waves: %s, expected %s" % (wave_names, waves)
+    wave_types = dict(DELETE_WAVES)
+    resource_ids = []
+    for name, wave_ids in world.delete_waves:
+        if wave_ids != sorted(set(wave_ids)):
+            assert False, "%s: %s" % (name, wave_ids)
+        for resource_id in wave_ids:
+            resource_type = resource_id.split("/")[0]
+            if resource_type not in wave_types.get(name, [resource_type]) or \
+                    (name not in wave_types and any(
+                        [resource_type in types for
+                         types in wave_types.values()])):
+                assert False, "%s deleted in %s" % (resource_id, name)
+        resource_ids.extend(wave_ids)
+    if sorted(resource_ids) != sorted(set(world.delete_ids)):
+        assert False, "Deleted: %s, expected %s" % (
+            resource_ids, sorted(set(world.delete_ids)))
+    assert True
@@ -0,0 +1,389 @@
+import os
+import csv
+import json
+import math
+import time
+import argparse
+from lettuce import step, world
+import bigmler.resources as r
+from bigmler.evaluation import (average_evaluations, cross_validation_stop,
+                                MeasureAccumulator, CONFIDENCE_Z,
+                                saved_evaluations, new_accumulator,
+                                add_evaluation, averaged_evaluation,
+                                evaluation_result)
+from bigmler.local_evaluation import (ClassificationAccumulator,
+                                      RegressionAccumulator)
+
+
+SPECIAL_CLASS_KEYS = ['class_name', 'present_in_test_data', 'occurrences']
+
+
+def check_value(name, value, expected):
+    """Compares a computed measure with its expected value
+
+    """
+    if abs(value - expected) > 1e-9:
+        assert False, "%s: %s, expected %s" % (name, value, expected)
+
+
+def check_measures(name, averaged, measures, divisor):
+    """Checks the averages and standard deviations of the lists of values
+       in `measures` around the average given by `divisor`
+
+    """
+    for key, values in measures.items():
+        average_key = (key if key.startswith("average_") else
+                       "average_%s" % key)
+        average = sum(values) / float(divisor)
+        deviation = math.sqrt(sum([(value - average) ** 2 for
+                                   value in values]) / len(values))
+        check_value("%s %s" % (name, average_key), averaged[average_key],
+                    average)
+        check_value("%s %s_standard_deviation" % (name, key),
+                    averaged["%s_standard_deviation" % key], deviation)
+
+
+@step(r'I average the evaluations in "(.*)"')
+def i_average_evaluations(step, evaluation_files=None):
+    if evaluation_files is None:
+        assert False
+    world.evaluations = []
+    world.evaluation_files = evaluation_files.split(",")
+    for evaluation_file in world.evaluation_files:
+        with open(evaluation_file) as evaluation_handler:
+            world.evaluations.append(json.load(evaluation_handler))
+    world.averaged = average_evaluations(world.evaluation_files)
+
+
+@step(r'the averaged measures are the means and standard deviations of the evaluations measures')
+def i_check_averaged_measures(step):
+    evaluations = world.evaluations
+    for group in ["model", "mode", "random"]:
+        averaged = world.averaged[group]
+        components = [evaluation[group] for evaluation in evaluations]
+        measures = {}
+        for component in components:
+            for key, value in component.items():
+                if isinstance(value, (int, float)) and \
+                        not isinstance(value, bool):
+                    measures.setdefault(key, []).append(value)
+        check_measures(group, averaged, measures, len(evaluations))
+        matrix = [[sum(values) for values in zip(*rows)] for rows in
+                  zip(*[component["confusion_matrix"] for
+                        component in components])]
+        if averaged["confusion_matrix"] != matrix:
+            assert False, "%s confusion matrix: %s, expected %s" % (
+                group, averaged["confusion_matrix"], matrix)
+        for class_info in averaged["per_class_statistics"]:
+            class_name = class_info["class_name"]
+            classes = [info for component in components for info in
+                       component["per_class_statistics"] if
+                       info["class_name"] == class_name]
+            occurrences = len([info for info in classes if
+                               info["present_in_test_data"]])
+            if class_info["occurrences"] != occurrences or \
+                    class_info["present_in_test_data"] != (occurrences > 0):
+                assert False, "%s %s occurrences: %s, expected %s" % (
+                    group, class_name, class_info["occurrences"],
+                    occurrences)
+            measures = {}
+            for info in classes:
+                for key, value in info.items():
+                    if key not in SPECIAL_CLASS_KEYS:
+                        measures.setdefault(key, []).append(value)
+            check_measures("%s %s" % (group, class_name), class_info,
+                           measures, occurrences or len(classes))
+    class_names = set([class_name for evaluation in evaluations for
+                       class_name in evaluation["class_names"]])
+    if set(world.averaged["class_names"]) != class_names:
+        assert False, "class names: %s, expected %s" % (
+            world.averaged["class_names"], list(class_names))
+    assert True
+
+
+def first_column(file_name, numeric=False):
+    """Values in the first column of a CSV file with no headers
+
+    """
+    with open(file_name, "U") as file_handler:
+        return [float(row[0]) if numeric else row[0] for row in
+                csv.reader(file_handler, lineterminator="\n")]
+
+
+@step(r'I accumulate the (classification|regression) results in "(.*)" as actual values and in "(.*)" as predicted values in chunks of (\d+) rows')
+def i_accumulate_results(step, kind=None, actual_file=None,
+                         predicted_file=None, chunk_size=None):
+    if kind is None or actual_file is None or predicted_file is None or \
+            chunk_size is None:
+        assert False
+    regression = kind == "regression"
+    world.actual = first_column(actual_file, regression)
+    world.predicted = first_column(predicted_file, regression)
+    accumulator = (RegressionAccumulator() if regression else
+                   ClassificationAccumulator())
+    chunk_size = int(chunk_size)
+    for start in range(0, len(world.actual), chunk_size):
+        accumulator.add(world.actual[start: start + chunk_size],
+                        world.predicted[start: start + chunk_size])
+    if accumulator.count() != len(world.actual):
+        assert False, "Accumulated rows: %s, expected %s" % (
+            accumulator.count(), len(world.actual))
+    world.local_evaluation = accumulator.evaluation()
+
+
+@step(r'the accumulated classification measures are computed from the confusion matrix')
+def i_check_classification_measures(step):
+    evaluation = world.local_evaluation
+    pairs = zip(world.actual, world.predicted)
+    class_names = sorted(set(world.actual) | set(world.predicted))
+    matrix = [[pairs.count((actual, predicted)) for predicted in
+               class_names] for actual in class_names]
+    if evaluation["confusion_matrix"] != matrix:
+        assert False, "confusion matrix: %s, expected %s" % (
+            evaluation["confusion_matrix"], matrix)
+    total = float(len(pairs))
+    check_value("accuracy", evaluation["accuracy"],
+                sum([matrix[index][index] for
+                     index in range(len(class_names))]) / total)
+    measures = {}
+    for index, class_info in enumerate(evaluation["per_class_statistics"]):
+        if class_info["class_name"] != class_names[index]:
+            assert False, "class %s: %s, expected %s" % (
+                index, class_info["class_name"], class_names[index])
+        true_positives = matrix[index][index]
+        false_positives = sum([row[index] for row in matrix]) - \
+            true_positives
+        false_negatives = sum(matrix[index]) - true_positives
+        true_negatives = total - true_positives - false_positives - \
+            false_negatives
+        precision = (float(true_positives) /
+                     (true_positives + false_positives)
+                     if true_positives + false_positives else 0.0)
+        recall = (float(true_positives) / (true_positives + false_negatives)
+                  if true_positives + false_negatives else 0.0)
+        denominator = math.sqrt((true_positives + false_positives) *
+                                (true_positives + false_negatives) *
+                                (true_negatives + false_positives) *
+                                (true_negatives + false_negatives))
+        expected = {
+            "accuracy": (true_positives + true_negatives) / total,
+            "precision": precision,
+            "recall": recall,
+            "f_measure": (2 * precision * recall / (precision + recall)
+                          if precision + recall else 0.0),
+            "phi_coefficient": ((true_positives * true_negatives -
+                                 false_positives * false_negatives) /
+                                denominator if denominator else 0.0)}
+        for key, value in expected.items():
+            check_value("%s %s" % (class_names[index], key),
+                        class_info[key], value)
+            measures.setdefault(key, []).append(value)
+        if class_info["present_in_test_data"] != (
+                class_names[index] in world.actual):
+            assert False, "%s present_in_test_data: %s" % (
+                class_names[index], class_info["present_in_test_data"])
+    for key, name in [("precision", "average_precision"),
+                      ("recall", "average_recall"),
+                      ("f_measure", "average_f_measure"),
+                      ("phi_coefficient", "average_phi")]:
+        check_value(name, evaluation[name],
+                    sum(measures[key]) / len(measures[key]))
+    assert True
+
+
+@step(r'the accumulated regression measures are computed from the errors')
+def i_check_regression_measures(step):
+    evaluation = world.local_evaluation
+    actual, predicted = world.actual, world.predicted
+    rows = float(len(actual))
+    errors = [prediction - value for value, prediction in
+              zip(actual, predicted)]
+    mean = sum(actual) / rows
+    sum_of_squares = sum([(value - mean) ** 2 for value in actual])
+    squared_error = sum([error ** 2 for error in errors])
+    check_value("mean_absolute_error", evaluation["mean_absolute_error"],
+                sum([abs(error) for error in errors]) / rows)
+    check_value("mean_squared_error", evaluation["mean_squared_error"],
+                squared_error / rows)
+    check_value("r_squared", evaluation["r_squared"],
+                1 - squared_error / sum_of_squares if sum_of_squares
+                else 0.0)
+    assert True
+
+
+def metric_waves(values, wave):
+    """Splits the comma-separated metric values in waves
+
+    """
+    values = [float(value) for value in values.split(",")]
+    return [values[start: start + wave] for
+            start in range(0, len(values), wave)]
+
+
+@step(r'I cross-validate the metric values "(.*)" in waves of (\d+) till the confidence interval is within (\d*\.?\d+) or (\d+) rounds are reached')
+def i_cross_validate_waves(step, values=None, wave=None, tolerance=None,
+                           max_rounds=None):
+    if values is None or wave is None or tolerance is None or \
+            max_rounds is None:
+        assert False
+    world.cv_waves = metric_waves(values, int(wave))
+    world.cv_tolerance = float(tolerance)
+    world.cv_max_rounds = int(max_rounds)
+    world.cv_decisions = []
+    measure = MeasureAccumulator()
+    rounds = 0
+    for wave_values in world.cv_waves:
+        rounds += len(wave_values)
+        stop, half_width = cross_validation_stop(
+            measure, wave_values, rounds, world.cv_max_rounds,
+            world.cv_tolerance)
+        world.cv_decisions.append((rounds, stop, half_width))
+        if stop:
+            break
+
+
+@step(r'cross-validation (converges|stops) after (\d+) rounds')
+def i_check_cross_validation_stop(step, result=None, rounds=None):
+    if result is None or rounds is None:
+        assert False
+    last_rounds, stop, half_width = world.cv_decisions[-1]
+    if not stop or last_rounds != int(rounds) or \
+            (half_width <= world.cv_tolerance) != (result == "converges"):
+        assert False, "Decisions: %s" % world.cv_decisions
+    for rounds, stop, half_width in world.cv_decisions:
+        values = [value for wave_values in world.cv_waves for
+                  value in wave_values][0: rounds]
+        mean = sum(values) / rounds
+        expected = (CONFIDENCE_Z * math.sqrt(
+            sum([(value - mean) ** 2 for value in values]) /
+            (rounds - 1) / rounds) if rounds > 1 else float('inf'))
+        if abs(half_width - expected) > 1e-9 and half_width != expected:
+            assert False, "Half width after %s rounds: %s, expected %s" % (
+                rounds, half_width, expected)
+    assert True
+
+
+@step(r'the same decisions are taken when resuming after each wave')
+def i_check_resumed_decisions(step):
+    # when resuming, the logged evaluations are added in a single wave
+    for index, (rounds, stop, half_width) in enumerate(world.cv_decisions):
+        values = [value for wave_values in world.cv_waves[0: index + 1] for
+                  value in wave_values]
+        decision = cross_validation_stop(
+            MeasureAccumulator(), values, rounds, world.cv_max_rounds,
+            world.cv_tolerance)
+        if decision[0] != stop or (abs(decision[1] - half_width) > 1e-9 and
+                                   decision[1] != half_width):
+            assert False, "Resumed after %s rounds: %s, expected %s" % (
+                rounds, decision, (stop, half_width))
+    assert True
+
+
+@step(r'a wave with no metric values is rejected')
+def i_check_empty_wave(step):
+    try:
+        cross_validation_stop(MeasureAccumulator(), [], 0,
+                              world.cv_max_rounds, world.cv_tolerance)
+    except SystemExit:
+        assert True
+        return
+    assert False, "The empty wave was not rejected"
+
+
+def check_close(name, value, expected):
+    """Compares the values of two evaluations, allowing for the rounding
+       errors of adding the measures in a different order
+
+    """
+    if isinstance(expected, dict):
+        if sorted(value.keys()) != sorted(expected.keys()):
+            assert False, "%s keys: %s, expected %s" % (name, value.keys(),
+                                                        expected.keys())
+        for key in expected:
+            check_close("%s %s" % (name, key), value[key], expected[key])
+    elif isinstance(expected, list) and name.endswith("class_names"):
+        if sorted(value) != sorted(expected):
+            assert False, "%s: %s, expected %s" % (name, value, expected)
+    elif isinstance(expected, list):
+        if len(value) != len(expected):
+            assert False, "%s: %s, expected %s" % (name, value, expected)
+        for index, item in enumerate(expected):
+            check_close("%s %s" % (name, index), value[index], item)
+    elif isinstance(expected, float) and not isinstance(value, bool):
+        if not (value == expected or abs(value - expected) <= 1e-9 or
+                (math.isnan(value) and math.isnan(expected))):
+            assert False, "%s: %s, expected %s" % (name, value, expected)
+    elif value != expected:
+        assert False, "%s: %s, expected %s" % (name, value, expected)
+
+
+@step(r'I save the evaluations in "(.*)" with up to (\d+) parallel tasks in "(.*)"')
+def i_save_evaluations(step, evaluation_files=None, max_parallel=None,
+                       output_dir=None):
+    if evaluation_files is None or max_parallel is None or \
+            output_dir is None:
+        assert False
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    world.evaluation_files = evaluation_files.split(",")
+    args = argparse.Namespace(max_parallel_evaluations=int(max_parallel),
+                              verbosity=0)
+
+    def get_evaluation(evaluation, api, verbosity, session_file):
+        """Reads the evaluation file. The last evaluations are retrieved
+           first.
+
+        """
+        index = world.evaluation_files.index(evaluation)
+        time.sleep(0.1 * (len(world.evaluation_files) - index))
+        with open(evaluation) as evaluation_handler:
+            return json.load(evaluation_handler)
+
+    def save_evaluation(evaluation, output, api=None):
+        """Stores the evaluation JSON
+
+        """
+        with open(output + ".json", "w") as evaluation_handler:
+            json.dump(evaluation_result(evaluation), evaluation_handler)
+
+    def file_name(index, evaluation):
+        """Name of the files of the index-th evaluation
+
+        """
+        return os.path.join(output_dir, "evaluation_%s" % index)
+
+    retrieve, save = r.get_evaluation, r.save_evaluation
+    r.get_evaluation, r.save_evaluation = get_evaluation, save_evaluation
+    try:
+        accumulator = new_accumulator()
+        world.saved_order = []
+        for index, evaluation in saved_evaluations(
+                world.evaluation_files, file_name, None, args):
+            world.saved_order.append(index)
+            add_evaluation(accumulator, evaluation_result(evaluation))
+    finally:
+        r.get_evaluation, r.save_evaluation = retrieve, save
+    world.saved_files = [file_name(index, None) + ".json" for
+                         index in range(len(world.evaluation_files))]
+    world.averaged = averaged_evaluation(accumulator,
+                                         len(world.evaluation_files))
+
+
+@step(r'the evaluations are saved (in order|as they finish) and averaged as when retrieved one by one')
+def i_check_saved_evaluations(step, order=None):
+    if order is None:
+        assert False
+    indexes = range(len(world.evaluation_files))
+    if sorted(world.saved_order) != indexes or \
+            (world.saved_order == indexes) != (order == "in order"):
+        assert False, "Saved evaluations order: %s" % world.saved_order
+    for saved_file, evaluation_file in zip(world.saved_files,
+                                           world.evaluation_files):
+        with open(saved_file) as saved_handler:
+            saved = json.load(saved_handler)
+        with open(evaluation_file) as evaluation_handler:
+            if saved != evaluation_result(json.load(evaluation_handler)):
+                assert False, "%s is not %s" % (saved_file, evaluation_file)
+    check_close("averaged", world.averaged,
+                average_evaluations(world.evaluation_files))
+    assert True
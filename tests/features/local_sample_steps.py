@@ -0,0 +1,170 @@
+import os
+import csv
+import json
+import shlex
+import argparse
+from lettuce import step, world
+from bigmler.local_sample import (read_rows, select_rows, numeric_columns,
+                                  statistics, to_number)
+from bigmler.sampleoutput import written_rows
+
+
+def sample_args(options):
+    """Namespace with the sampling options in the options string
+
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode')
+    parser.add_argument('--seed')
+    parser.add_argument('--rows', type=int)
+    parser.add_argument('--row-offset', type=int)
+    parser.add_argument('--row-order-by')
+    parser.add_argument('--unique', action='store_true', default=False)
+    return parser.parse_args(shlex.split(options))
+
+
+@step(r'I read the rows of "(.*)"')
+def i_read_rows(step, data=None):
+    if data is None:
+        assert False
+    world.sample_headers, rows = read_rows(data, ",", True)
+    world.sample_rows = list(rows)
+
+
+@step(r'I select the sample rows using options "(.*)"')
+def i_select_rows(step, options=None):
+    if options is None:
+        assert False
+    world.sample_options = options
+    world.selected = select_rows(iter(world.sample_rows),
+                                 world.sample_headers, sample_args(options))
+
+
+@step(r'the selected rows are the rows (\d+) to (\d+) of the file')
+def i_check_rows_range(step, first=None, last=None):
+    if first is None or last is None:
+        assert False
+    expected = world.sample_rows[int(first): int(last) + 1]
+    if world.selected != expected:
+        assert False, "Selected rows:\n%s\nExpected rows:\n%s" % (
+            world.selected, expected)
+    assert True
+
+
+@step(r'the selected rows are sorted by "(.*)"')
+def i_check_rows_order(step, name=None):
+    if name is None:
+        assert False
+    descending = name.startswith("-")
+    column = world.sample_headers.index(name.lstrip("-"))
+    values = [to_number(row[column]) for _, row in world.selected]
+    if values != sorted(values, reverse=descending):
+        assert False, "Selected values: %s" % values
+    # rows with the same value keep the order in the file
+    for previous, current in zip(world.selected, world.selected[1:]):
+        if to_number(previous[1][column]) == to_number(current[1][column]) \
+                and previous[0] > current[0]:
+            assert False, "Rows %s and %s are not in order" % (previous[0],
+                                                               current[0])
+    assert True
+
+
+@step(r'the selected rows are (\d+) different rows of the file')
+def i_check_different_rows(step, count=None):
+    if count is None:
+        assert False
+    indexes = [index for index, _ in world.selected]
+    if len(indexes) != int(count) or len(set(indexes)) != int(count):
+        assert False, "Selected row indexes: %s" % indexes
+    for index, row in world.selected:
+        if world.sample_rows[index] != (index, row):
+            assert False, "Row %s is not in the file" % index
+    assert True
+
+
+@step(r'the selected rows have no repeated contents')
+def i_check_unique_rows(step):
+    contents = [tuple(row) for _, row in world.selected]
+    expected = set([tuple(row) for _, row in world.sample_rows])
+    if len(set(contents)) != len(contents) or set(contents) != expected:
+        assert False, "Selected %s rows for %s different rows" % (
+            len(contents), len(expected))
+    assert True
+
+
+@step(r'the same rows are selected again')
+def i_check_same_selection(step):
+    selected = select_rows(iter(world.sample_rows), world.sample_headers,
+                           sample_args(world.sample_options))
+    if selected != world.selected:
+        assert False, "Selected rows:\n%s\nExpected rows:\n%s" % (
+            selected, world.selected)
+    assert True
+
+
+@step(r'the local statistics of "(.*)" are like in "(.*)"')
+def i_check_statistics(step, name=None, check_file=None):
+    if name is None or check_file is None:
+        assert False
+    with open(check_file) as check_stat_file:
+        check_stats = json.load(check_stat_file)
+    rows = [row for _, row in world.sample_rows]
+    stat_column = world.sample_headers.index(name)
+    # the field ids in the check file are the column numbers in hexadecimal
+    field_ids = check_stats["pearson_correlations"].keys()
+    columns = [int(field_id, 16) for field_id in field_ids]
+    matrix = numeric_columns(rows, [stat_column] + columns)
+    pearson, spearman, _, _ = statistics(matrix[:, 0], matrix[:, 1:])
+    for position, field_id in enumerate(field_ids):
+        for key, values in [("pearson_correlations", pearson),
+                            ("spearman_correlations", spearman)]:
+            if round(values[position], 5) != check_stats[key][field_id]:
+                assert False, "%s of %s: %s, expected %s" % (
+                    key, field_id, values[position],
+                    check_stats[key][field_id])
+    assert True
+
+
+@step(r'I copy the first (\d+) bytes of "(.*)" to "(.*)"')
+def i_copy_bytes(step, size=None, data=None, output=None):
+    if size is None or data is None or output is None:
+        assert False
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(data, "rb") as data_file:
+        world.sample_contents = data_file.read()
+    with open(output, "wb") as output_file:
+        output_file.write(world.sample_contents[0: int(size)])
+    world.sample_output = output
+
+
+@step(r'I count the sample rows written in the file (with|without) headers')
+def i_count_written_rows(step, headers=None):
+    if headers is None:
+        assert False
+    world.sample_header = headers == "with"
+    world.written, world.header_written = written_rows(
+        world.sample_output, world.sample_header)
+
+
+@step(r'(\d+) complete rows are found and the incomplete row is removed')
+def i_check_written_rows(step, rows=None):
+    if rows is None:
+        assert False
+    if world.written != int(rows):
+        assert False, "Found %s rows, expected %s" % (world.written, rows)
+    with open(world.sample_output, "rb") as output_file:
+        contents = output_file.read()
+    if not world.sample_contents.startswith(contents) or \
+            (contents and not contents.endswith("\n")):
+        assert False, "The file was cut to:\n%s" % contents
+    file_rows = list(csv.reader(world.sample_contents.splitlines(True)))
+    kept_rows = list(csv.reader(contents.splitlines(True)))
+    if kept_rows != file_rows[0: len(kept_rows)] or \
+            len(kept_rows) != int(rows) + (
+                1 if world.sample_header and kept_rows else 0):
+        assert False, "Kept rows: %s" % kept_rows
+    if world.header_written != bool(kept_rows):
+        assert False, "Header written: %s" % world.header_written
+    assert True
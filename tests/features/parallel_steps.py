@@ -0,0 +1,275 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from lettuce import step, world
+import bigmler.resources as r
+from bigmler.parallel import run_in_parallel, TokenBucket
+from bigmler.utils import list_ids, PAGE_LENGTH
+from bigmler.cluster.dispatcher import create_cluster_datasets
+
+
+class TaskCounter(object):
+    """Counts the started tasks and the maximum number of tasks running at
+       the same time
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = 0
+        self.running = 0
+        self.max_running = 0
+
+    def task(self, index, delay, failing=None):
+        """Sleeps for a delay that depends on the index and returns its
+           square, or exits if it's the failing index
+
+        """
+        with self.lock:
+            self.started += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            # later tasks finish earlier
+            time.sleep(delay * (1 + (index * 7) % 5) / 5.0)
+            if index == failing:
+                sys.exit("Failed to run task %s." % index)
+            return index * index
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+@step(r'I run (\d+) tasks taking up to (\d*\.?\d+) seconds with up to (\d+) parallel threads (in order|as they finish)')
+def i_run_tasks(step, tasks=None, delay=None, max_parallel=None,
+                order=None):
+    if tasks is None or delay is None or max_parallel is None or \
+            order is None:
+        assert False
+    world.counter = TaskCounter()
+    world.tasks = int(tasks)
+    start = time.time()
+    world.parallel_results = list(run_in_parallel(
+        world.counter.task,
+        [(index, float(delay)) for index in range(world.tasks)],
+        max_parallel=int(max_parallel), ordered=(order == "in order")))
+    world.parallel_time = time.time() - start
+
+
+@step(r'I run (\d+) tasks taking up to (\d*\.?\d+) seconds with up to (\d+) parallel threads and task (\d+) fails')
+def i_run_failing_tasks(step, tasks=None, delay=None, max_parallel=None,
+                        failing=None):
+    if tasks is None or delay is None or max_parallel is None or \
+            failing is None:
+        assert False
+    world.counter = TaskCounter()
+    world.tasks = int(tasks)
+    world.parallel_results = []
+    world.parallel_error = None
+    try:
+        for result in run_in_parallel(
+                world.counter.task,
+                [(index, float(delay), int(failing)) for
+                 index in range(world.tasks)],
+                max_parallel=int(max_parallel)):
+            world.parallel_results.append(result)
+    except SystemExit, exc:
+        world.parallel_error = str(exc)
+
+
+@step(r'the results of all the tasks are yielded (in order|once)')
+def i_check_results(step, order=None):
+    if order is None:
+        assert False
+    results = world.parallel_results
+    if order == "once":
+        results = sorted(results)
+    expected = [(index, index * index) for index in range(world.tasks)]
+    if results != expected:
+        assert False, "Results: %s, expected %s" % (world.parallel_results,
+                                                    expected)
+    assert True
+
+
+@step(r'no more than (\d+) tasks ran at the same time')
+def i_check_max_running(step, max_parallel=None):
+    if max_parallel is None:
+        assert False
+    if world.counter.max_running > int(max_parallel):
+        assert False, "%s tasks ran at the same time" % \
+            world.counter.max_running
+    assert True
+
+
+@step(r'the tasks took less than (\d*\.?\d+) seconds')
+def i_check_parallel_time(step, seconds=None):
+    if seconds is None:
+        assert False
+    if world.parallel_time >= float(seconds):
+        assert False, "The tasks took %s seconds" % world.parallel_time
+    assert True
+
+
+@step(r'the error of task (\d+) is raised and no more than (\d+) tasks are started')
+def i_check_parallel_error(step, failing=None, started=None):
+    if failing is None or started is None:
+        assert False
+    if world.parallel_error != "Failed to run task %s." % failing:
+        assert False, "Error: %s" % world.parallel_error
+    # the results of the tasks before the failing one are yielded in order
+    # till the error is found
+    indexes = [index for index, _ in world.parallel_results]
+    if indexes != range(len(indexes)) or len(indexes) > int(failing):
+        assert False, "Results: %s" % world.parallel_results
+    # the remaining tasks are discarded when the error is raised
+    time.sleep(2)
+    if world.counter.started > int(started):
+        assert False, "%s tasks were started" % world.counter.started
+    assert True
+
+
+@step(r'I acquire (\d+) tokens from a bucket with rate (\d+) and capacity (\d+) using (\d+) threads')
+def i_acquire_tokens(step, tokens=None, rate=None, capacity=None,
+                     threads=None):
+    if tokens is None or rate is None or capacity is None or \
+            threads is None:
+        assert False
+    bucket = TokenBucket(int(rate), int(capacity))
+    start = time.time()
+    list(run_in_parallel(lambda _: bucket.acquire(), range(int(tokens)),
+                         max_parallel=int(threads)))
+    world.bucket_time = time.time() - start
+
+
+@step(r'the tokens took from (\d*\.?\d+) to (\d*\.?\d+) seconds')
+def i_check_tokens_time(step, minimum=None, maximum=None):
+    if minimum is None or maximum is None:
+        assert False
+    if not float(minimum) <= world.bucket_time <= float(maximum):
+        assert False, "The tokens took %s seconds" % world.bucket_time
+    assert True
+
+
+@step(r'I create the datasets of (\d+) centroids with up to (\d+) parallel tasks logging in "(.*)"')
+def i_create_cluster_datasets(step, centroids=None, max_parallel=None,
+                              output_dir=None):
+    if centroids is None or max_parallel is None or output_dir is None:
+        assert False
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    world.session_file = os.path.join(output_dir, "bigmler_sessions")
+    if os.path.exists(world.session_file):
+        os.remove(world.session_file)
+    world.centroids = int(centroids)
+    cluster = {"resource": "cluster/5540b3e4c0ed0b3b3a000001",
+               "object": {"clusters": {"clusters": [
+                   {"id": "%06x" % index, "name": "Cluster %s" % index} for
+                   index in range(world.centroids)]}}}
+    args = argparse.Namespace(max_parallel_datasets=int(max_parallel),
+                              verbosity=0)
+
+    def create_dataset(cluster, dataset_args, args, api, path,
+                       session_file, log, origin):
+        """Creates no dataset. The datasets of the last centroids are
+           created first.
+
+        """
+        index = int(dataset_args['centroid'], 16)
+        time.sleep(0.1 * (world.centroids - index))
+        return "dataset/5540b3e4c0ed0b3b3a%06x" % index
+
+    create = r.create_dataset
+    r.create_dataset = create_dataset
+    try:
+        create_cluster_datasets(
+            cluster, ["%06x" % index for index in range(world.centroids)],
+            args, None, session_file=world.session_file)
+    finally:
+        r.create_dataset = create
+
+
+@step(r'the datasets are logged (in the centroids order|as they are created)')
+def i_check_cluster_datasets_log(step, order=None):
+    if order is None:
+        assert False
+    with open(world.session_file) as session_handler:
+        logged = [re.search(r"Dataset for Cluster (\d+) created: .*"
+                            r"5540b3e4c0ed0b3b3a(\w+) \((\d+) of (\d+)\)",
+                            line).groups() for line in session_handler]
+    centroids = [int(centroid) for centroid, _, _, _ in logged]
+    # the datasets of the last centroids are created first, so they are
+    # logged first when created in parallel
+    if (centroids == range(world.centroids)) != (
+            order == "in the centroids order"):
+        assert False, "Logged centroids: %s" % centroids
+    if sorted(centroids) != range(world.centroids) or \
+            [int(dataset, 16) for _, dataset, _, _ in logged] != centroids or \
+            [(int(count), int(total)) for _, _, count, total in logged] != \
+            [(count + 1, world.centroids) for
+             count in range(world.centroids)]:
+        assert False, "Logged datasets: %s" % logged
+    assert True
+
+
+class ResourcesLister(object):
+    """Lists a synthetic list of resources by pages. The first pages take
+       longer to be retrieved and new resources can be created after the
+       first page is listed
+
+    """
+
+    def __init__(self, count, created=0):
+        self.lock = threading.Lock()
+        self.ids = ["source/5540b3e4c0ed0b3b3a%06x" % index for
+                    index in range(count)]
+        self.created = created
+        self.queries = []
+
+    def list_sources(self, query_string):
+        """Returns the page of resources given by the offset and limit in
+           the query string, like the API list calls
+
+        """
+        offset = re.search(r"offset=(\d+)", query_string)
+        offset = 0 if offset is None else int(offset.group(1))
+        limit = int(re.search(r"limit=(\d+)", query_string).group(1))
+        with self.lock:
+            self.queries.append(query_string)
+            ids = self.ids[:]
+            if offset == 0:
+                # newest resources are listed first
+                self.ids = ["source/5540b3e4c0ed0b3b3b%06x" % index for
+                            index in range(self.created)] + self.ids
+        time.sleep(0.05 * max(0, 5 - offset / limit))
+        return {"objects": [{"resource": resource_id} for
+                            resource_id in ids[offset: offset + limit]],
+                "meta": {"offset": offset, "limit": limit,
+                         "total_count": len(ids)}}
+
+
+@step(r'I list (\d*\.?\d+) pages of resources with up to (\d+) parallel threads while (\d+) resources are created')
+def i_list_ids(step, pages=None, max_parallel=None, created=None):
+    if pages is None or max_parallel is None or created is None:
+        assert False
+    world.lister = ResourcesLister(int(float(pages) * PAGE_LENGTH),
+                                   int(created))
+    world.listed_ids = world.lister.ids[:]
+    world.list_result = list_ids(world.lister.list_sources, "project=p",
+                                 max_parallel=int(max_parallel))
+
+
+@step(r'every resource is listed once in the listing order after (\d+) calls')
+def i_check_listed_ids(step, calls=None):
+    if calls is None:
+        assert False
+    # the ids repeated in shifted pages are listed only once
+    if world.list_result != world.listed_ids:
+        assert False, "Listed %s ids, expected %s" % (
+            len(world.list_result), len(world.listed_ids))
+    if len(world.lister.queries) != int(calls) or \
+            any("project=p" not in query for query in world.lister.queries):
+        assert False, "Queries: %s" % world.lister.queries
+    assert True